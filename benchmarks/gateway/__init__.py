@@ -0,0 +1 @@
+"""Gateway replay benchmarks, see ``python -m benchmarks.gateway --help``."""
@@ -0,0 +1,254 @@
+"""Replays gateway corpora through a real client and reports dispatch throughput and latency.
+
+Run with ``python -m benchmarks.gateway``. Every scenario connects a :class:`wharf.Client` to a
+local fake gateway, which sends READY followed by the corpus over a zlib stream. A listener is
+registered for every event in the corpus, the latency of an event is the time between the
+gateway writing its frame and the listener starting. ``--listener-mode`` picks what that
+listener is called with, ``batch`` registers a single batch listener of raw dicts instead,
+which is how a consumer forwarding events elsewhere would listen. Loop lag is how late a 1ms timer on the
+client's event loop fired at worst, which is how long anything else sharing the loop, like
+heartbeats, could have been stalled.
+
+Results are compared against ``baselines.json`` when it holds a run with the same
+configuration, any metric worse by more than ``--tolerance`` fails the run. Baselines are
+machine specific, record your own with ``--save-baseline`` before comparing branches.
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import platform
+import sys
+import time
+from typing import List, Optional
+
+import wharf
+
+from . import corpus, metrics
+from .server import GatewayProcess
+
+DEFAULT_COUNTS = {
+    "guild_create": 2_000,
+    "large_guild": 10,
+    "message_create": 20_000,
+    "interaction_create": 10_000,
+    "mixed": 20_000,
+}
+
+
+async def _watch_lag(lags: List[float], interval: float = 0.001):
+    while True:
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - before - interval)
+
+
+async def replay(
+    payloads: List[dict],
+    *,
+    rate: Optional[float],
+    fragment: Optional[int],
+    timeout: float,
+    offload_threshold: Optional[int],
+    freeze: bool,
+    listener_mode: str,
+) -> dict:
+    gateway = GatewayProcess(payloads, rate=rate, fragment=fragment)
+    loop = asyncio.get_running_loop()
+    url = await loop.run_in_executor(None, gateway.start)
+
+    client = wharf.Client(
+        token="benchmark",
+        intents=wharf.Intents.ALL,
+        defer_after=None,
+    )
+    client.ws.gw_url = url
+    client.ws.decoder.threshold = offload_threshold
+    client.ws.decoder.freeze = freeze
+
+    handled_at: List[float] = []
+    done = loop.create_future()
+
+    async def listener(*_):
+        handled_at.append(time.perf_counter())
+        if len(handled_at) == len(payloads) and not done.done():
+            done.set_result(None)
+
+    async def batch_listener(events):
+        now = time.perf_counter()
+        handled_at.extend(now for _ in events)
+        if len(handled_at) == len(payloads) and not done.done():
+            done.set_result(None)
+
+    names = {payload["t"].lower() for payload in payloads}
+
+    if listener_mode == "batch":
+        client.dispatcher.add_batch_listener(batch_listener, *names)
+    else:
+        for name in names:
+            client.dispatcher.subscribe(name, listener, mode=listener_mode)
+
+    rss_before = metrics.rss_mib()
+    cpu_before = time.process_time()
+    lags: List[float] = []
+    watcher = asyncio.create_task(_watch_lag(lags))
+    connection = asyncio.create_task(client.ws.connect())
+
+    try:
+        await asyncio.wait_for(done, timeout)
+    except asyncio.TimeoutError:
+        print(
+            f"  timed out after {len(handled_at)}/{len(payloads)} events",
+            file=sys.stderr,
+        )
+    finally:
+        cpu_seconds = time.process_time() - cpu_before
+        rss_after = metrics.rss_mib()
+        watcher.cancel()
+
+    sent_at = await gateway.sent_at()
+
+    await client.ws.close()
+    connection.cancel()
+    gateway.stop()
+
+    return metrics.summarize(
+        sent_at,
+        handled_at,
+        cpu_seconds=cpu_seconds,
+        rss_before=rss_before,
+        rss_after=rss_after,
+        lags=lags,
+    )
+
+
+def _print(label: str, result: dict):
+    print(
+        f"{label:<20} {result['events']:>7} events "
+        f"{result['events_per_sec']:>10.0f} ev/s  "
+        f"p50 {result['p50_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  "
+        f"{result['cpu_us_per_event']:>7.1f} us cpu/ev  "
+        f"rss {result['rss_mib']:.1f} MiB ({result['rss_delta_mib']:+.1f})  "
+        f"lag max {result['max_lag_ms']:.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.gateway")
+    parser.add_argument(
+        "--scenario",
+        choices=(*corpus.SCENARIOS, "all"),
+        default="all",
+        help="which synthesized corpus to replay",
+    )
+    parser.add_argument(
+        "--corpus", help="replay a recorded corpus (.jsonl or .jsonl.gz)"
+    )
+    parser.add_argument("--count", type=int, help="events per synthesized scenario")
+    parser.add_argument(
+        "--rate", type=float, help="events per second, default flat out"
+    )
+    parser.add_argument(
+        "--fragment", type=int, help="split frames into messages of N bytes"
+    )
+    parser.add_argument(
+        "--offload-threshold",
+        type=int,
+        default=wharf.PayloadDecoder().threshold,
+        help="frame bytes from which decoding leaves the event loop, 0 to never offload",
+    )
+    parser.add_argument(
+        "--freeze-payloads",
+        action="store_true",
+        help="gc.freeze() after every offloaded payload",
+    )
+    parser.add_argument(
+        "--listener-mode",
+        choices=("model", "dict", "bytes", "batch"),
+        default="model",
+        help="what listeners are called with",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    logging.getLogger("wharf").setLevel(args.log_level)
+
+    if args.corpus:
+        runs = [(f"corpus:{os.path.basename(args.corpus)}", corpus.load(args.corpus))]
+    else:
+        scenarios = corpus.SCENARIOS if args.scenario == "all" else (args.scenario,)
+        runs = [
+            (
+                scenario,
+                corpus.synthesize(
+                    scenario, args.count or DEFAULT_COUNTS[scenario], seed=args.seed
+                ),
+            )
+            for scenario in scenarios
+        ]
+
+    baselines = metrics.load_baselines()
+    failed = False
+
+    for label, payloads in runs:
+        config = {
+            "events": len(payloads),
+            "rate": args.rate,
+            "fragment": args.fragment,
+            "seed": args.seed,
+            "offload_threshold": args.offload_threshold,
+            "freeze_payloads": args.freeze_payloads,
+            "listener_mode": args.listener_mode,
+        }
+
+        # the corpora stay alive for the whole run, keep full collections from walking them
+        # so the loop lag measured is the client's own
+        gc.collect()
+        gc.freeze()
+
+        result = asyncio.run(
+            replay(
+                payloads,
+                rate=args.rate,
+                fragment=args.fragment,
+                timeout=args.timeout,
+                offload_threshold=args.offload_threshold or None,
+                freeze=args.freeze_payloads,
+                listener_mode=args.listener_mode,
+            )
+        )
+        gc.unfreeze()
+        _print(label, result)
+
+        baseline = baselines.get(label)
+        if baseline is not None and baseline["config"] != config:
+            print(f"  baseline was recorded with {baseline['config']}, not comparing")
+            baseline = None
+
+        regressions = metrics.compare(result, baseline, tolerance=args.tolerance)
+        for regression in regressions:
+            print(f"  REGRESSION {regression}")
+        failed = failed or bool(regressions)
+
+        if args.save_baseline:
+            baselines[label] = {
+                "config": config,
+                "metrics": {k: round(v, 3) for k, v in result.items()},
+                "python": platform.python_version(),
+            }
+
+    if args.save_baseline:
+        metrics.save_baselines(baselines)
+        print(f"saved baselines to {metrics.BASELINES}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Gateway payload corpora, synthesized or recorded from a live bot, and their zlib-stream framing."""
+import gzip
+import json
+import random
+import zlib
+from typing import Any, Iterable, Iterator, List, Optional
+
+SCENARIOS = (
+    "guild_create",
+    "large_guild",
+    "message_create",
+    "interaction_create",
+    "mixed",
+)
+
+_snowflake = 175928847299117063
+
+
+def _id(rng: random.Random) -> str:
+    return str(_snowflake + rng.randrange(1 << 40))
+
+
+def _user(rng: random.Random) -> dict:
+    return {
+        "id": _id(rng),
+        "username": f"user{rng.randrange(100_000)}",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": f"{rng.getrandbits(128):032x}",
+    }
+
+
+def _member(rng: random.Random, guild_id: str) -> dict:
+    return {
+        "user": _user(rng),
+        "nick": None,
+        "avatar": None,
+        "roles": [_id(rng) for _ in range(rng.randrange(4))],
+        "joined_at": "2022-10-01T12:00:00.000000+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+        "guild_id": guild_id,
+    }
+
+
+def _channel(rng: random.Random, guild_id: str, position: int) -> dict:
+    return {
+        "id": _id(rng),
+        "type": 0,
+        "guild_id": guild_id,
+        "name": f"channel-{position}",
+        "position": position,
+        "topic": None,
+        "nsfw": False,
+        "permission_overwrites": [],
+        "parent_id": None,
+        "last_message_id": _id(rng),
+        "rate_limit_per_user": 0,
+    }
+
+
+def guild_create(rng: random.Random, *, members: int = 50, channels: int = 20) -> dict:
+    guild_id = _id(rng)
+    return {
+        "id": guild_id,
+        "name": f"guild {guild_id[-6:]}",
+        "icon": None,
+        "owner_id": _id(rng),
+        "member_count": members,
+        "large": members > 250,
+        "unavailable": False,
+        "joined_at": "2022-10-01T12:00:00.000000+00:00",
+        "roles": [{"id": guild_id, "name": "@everyone", "permissions": "0"}],
+        "emojis": [],
+        "features": [],
+        "channels": [_channel(rng, guild_id, i) for i in range(channels)],
+        "threads": [],
+        "members": [_member(rng, guild_id) for _ in range(members)],
+        "presences": [],
+        "voice_states": [],
+    }
+
+
+def message_create(rng: random.Random) -> dict:
+    guild_id = _id(rng)
+    words = rng.randrange(3, 40)
+    return {
+        "id": _id(rng),
+        "type": 0,
+        "channel_id": _id(rng),
+        "guild_id": guild_id,
+        "author": _user(rng),
+        "member": {"roles": [], "joined_at": "2022-10-01T12:00:00.000000+00:00"},
+        "content": " ".join(f"word{rng.randrange(1000)}" for _ in range(words)),
+        "timestamp": "2022-10-01T12:00:00.000000+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+    }
+
+
+def interaction_create(rng: random.Random) -> dict:
+    guild_id = _id(rng)
+    return {
+        "id": _id(rng),
+        "application_id": _id(rng),
+        "type": 2,
+        "token": f"{rng.getrandbits(256):064x}",
+        "version": 1,
+        "guild_id": guild_id,
+        "channel_id": _id(rng),
+        "member": _member(rng, guild_id),
+        "data": {
+            "id": _id(rng),
+            "name": "ping",
+            "type": 1,
+            "options": [{"name": "count", "type": 4, "value": rng.randrange(100)}],
+        },
+    }
+
+
+def ready(rng: random.Random, guild_ids: Iterable[str]) -> dict:
+    return {
+        "v": 10,
+        "user": {**_user(rng), "bot": True},
+        "guilds": [{"id": guild_id, "unavailable": True} for guild_id in guild_ids],
+        "session_id": f"{rng.getrandbits(128):032x}",
+        "resume_gateway_url": "wss://gateway.invalid",
+        "application": {"id": _id(rng), "flags": 0},
+    }
+
+
+def _dispatch(name: str, data: dict, seq: int) -> dict:
+    return {"op": 0, "t": name, "s": seq, "d": data}
+
+
+def synthesize(scenario: str, count: int, *, seed: int = 0) -> List[dict]:
+    """Builds a session worth of gateway payloads, READY first and then ``count`` events.
+    Args:
+        scenario (str): One of :data:`SCENARIOS`.
+        count (int): How many events follow READY.
+        seed (int): Seeds the generator, the same seed always gives the same corpus.
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError(f"unknown scenario {scenario!r}")
+
+    rng = random.Random(seed)
+    events: List[tuple] = []
+
+    if scenario == "guild_create":
+        events = [("GUILD_CREATE", guild_create(rng)) for _ in range(count)]
+    elif scenario == "large_guild":
+        # a few megabytes per payload, what a bot in big community servers gets on startup
+        events = [
+            ("GUILD_CREATE", guild_create(rng, members=25_000, channels=200))
+            for _ in range(count)
+        ]
+    elif scenario == "message_create":
+        events = [("MESSAGE_CREATE", message_create(rng)) for _ in range(count)]
+    elif scenario == "interaction_create":
+        events = [("INTERACTION_CREATE", interaction_create(rng)) for _ in range(count)]
+    else:
+        makers = (
+            [("MESSAGE_CREATE", message_create)] * 8
+            + [("INTERACTION_CREATE", interaction_create)]
+            + [("GUILD_CREATE", lambda rng: guild_create(rng, members=10, channels=5))]
+        )
+        for _ in range(count):
+            name, make = rng.choice(makers)
+            events.append((name, make(rng)))
+
+    guild_ids = [data["id"] for name, data in events if name == "GUILD_CREATE"]
+    payloads = [_dispatch("READY", ready(rng, guild_ids), 1)]
+    payloads.extend(
+        _dispatch(name, data, seq) for seq, (name, data) in enumerate(events, 2)
+    )
+    return payloads
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+
+    return open(path, mode, encoding="utf-8")
+
+
+def load(path: str) -> List[dict]:
+    """Reads a recorded corpus, one gateway payload per line, optionally gzipped.
+
+    Sequence numbers are rewritten and a READY is synthesized if the recording lacks one,
+    so any capture can be replayed as a fresh session.
+    """
+    with _open(path, "r") as f:
+        payloads = [json.loads(line) for line in f if line.strip()]
+
+    payloads = [p for p in payloads if p.get("op") == 0]
+
+    if not payloads or payloads[0].get("t") != "READY":
+        guild_ids = [p["d"]["id"] for p in payloads if p.get("t") == "GUILD_CREATE"]
+        payloads.insert(0, _dispatch("READY", ready(random.Random(0), guild_ids), 1))
+
+    for seq, payload in enumerate(payloads, 1):
+        payload["s"] = seq
+
+    return payloads
+
+
+class Recorder:
+    """A dispatcher middleware that appends every event it sees to a corpus file.
+
+    Usage: ``client.dispatcher.add_middleware(Recorder("corpus.jsonl.gz"))``. Note that it only
+    sees events something in the client parses or listens to.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = _open(path, "a")
+        self._seq = 0
+
+    def __call__(self, event_name: str, data: Any) -> bool:
+        self._seq += 1
+        self._file.write(json.dumps(_dispatch(event_name.upper(), data, self._seq)))
+        self._file.write("\n")
+        return True
+
+    def close(self):
+        self._file.close()
+
+
+def hello(heartbeat_interval: int) -> dict:
+    return {"op": 10, "d": {"heartbeat_interval": heartbeat_interval}}
+
+
+def frames(
+    payloads: Iterable[dict], *, fragment: Optional[int] = None
+) -> Iterator[List[bytes]]:
+    """Compresses payloads into one zlib stream, the way Discord does with ``compress=zlib-stream``.
+
+    Yields a list of websocket messages per payload, a single message unless ``fragment`` caps
+    the message size, in which case the client has to buffer until the flush suffix.
+    """
+    compressor = zlib.compressobj()
+
+    for payload in payloads:
+        data = compressor.compress(json.dumps(payload).encode())
+        data += compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        if fragment is None or len(data) <= fragment:
+            yield [data]
+        else:
+            yield [data[i : i + fragment] for i in range(0, len(data), fragment)]
@@ -0,0 +1,105 @@
+"""Metrics for a replay run and their comparison against stored baselines."""
+import json
+import os
+import resource
+import sys
+from typing import Dict, List, Optional, Sequence
+
+BASELINES = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# metric -> whether higher is better
+METRICS = {
+    "events_per_sec": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "cpu_us_per_event": False,
+    "rss_delta_mib": False,
+    "max_lag_ms": False,
+}
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def rss_mib() -> float:
+    """The current resident set size, falling back to the peak where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, KiB everywhere else
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def summarize(
+    sent_at: List[float],
+    handled_at: List[float],
+    *,
+    cpu_seconds: float,
+    rss_before: float,
+    rss_after: float,
+    lags: Sequence[float] = (),
+) -> Dict[str, float]:
+    count = min(len(sent_at), len(handled_at))
+    latencies = [(handled_at[i] - sent_at[i]) * 1000 for i in range(count)]
+    elapsed = handled_at[count - 1] - sent_at[0] if count else 0.0
+
+    return {
+        "events": count,
+        "events_per_sec": count / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "cpu_us_per_event": cpu_seconds / count * 1e6 if count else 0.0,
+        "rss_mib": rss_after,
+        "rss_delta_mib": rss_after - rss_before,
+        "max_lag_ms": max(lags, default=0.0) * 1000,
+    }
+
+
+def load_baselines(path: str = BASELINES) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(baselines: dict, path: str = BASELINES):
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+
+def compare(
+    result: Dict[str, float], baseline: Optional[dict], *, tolerance: float
+) -> List[str]:
+    """Lists every metric that got worse than its baseline by more than ``tolerance``."""
+    if baseline is None:
+        return []
+
+    regressions = []
+
+    for metric, higher_is_better in METRICS.items():
+        old = baseline["metrics"].get(metric)
+        new = result[metric]
+        if old is None:
+            continue
+
+        if higher_is_better:
+            worse = new < old * (1 - tolerance)
+        else:
+            # tiny absolute values (sub-millisecond latencies, a few KiB of RSS) are noise
+            worse = new > old * (1 + tolerance) and new - old > 0.5
+
+        if worse:
+            regressions.append(f"{metric}: {old:.2f} -> {new:.2f}")
+
+    return regressions
@@ -0,0 +1,139 @@
+"""A local stand-in for the Discord gateway that replays a corpus over one zlib-stream connection.
+
+It runs in its own process so compressing and sending frames doesn't count against the client's
+CPU time. Send times are taken from :func:`time.perf_counter`, which is a system wide monotonic
+clock on Linux and macOS, so they can be compared with the client's own timestamps.
+"""
+import asyncio
+import json
+import multiprocessing
+import time
+from typing import List, Optional
+
+from aiohttp import WSMsgType, web
+
+from . import corpus
+
+HEARTBEAT_INTERVAL = 41_250
+
+
+class FakeGateway:
+    """Serves one session per connection: HELLO, then READY and the corpus once IDENTIFY arrives.
+    Args:
+        payloads (List[dict]): The session to replay, READY first.
+        rate (Optional[float]): Events per second, None to send as fast as the socket allows.
+        fragment (Optional[int]): Splits compressed frames into messages of at most this many bytes.
+    """
+
+    def __init__(
+        self,
+        payloads: List[dict],
+        *,
+        rate: Optional[float] = None,
+        fragment: Optional[int] = None,
+    ):
+        # compressing up front keeps the send loop as cheap as a real gateway's
+        self.frames = list(
+            corpus.frames(
+                [corpus.hello(HEARTBEAT_INTERVAL), *payloads], fragment=fragment
+            )
+        )
+        self.rate = rate
+        self.sent_at: List[float] = []
+        self.done = asyncio.Event()
+        self.app = web.Application()
+        self.app.router.add_get("/", self.handle)
+
+    async def _send(self, ws: web.WebSocketResponse, frame: List[bytes]):
+        for message in frame:
+            await ws.send_bytes(message)
+
+    async def _replay(self, ws: web.WebSocketResponse):
+        frames = self.frames[1:]
+        start = time.perf_counter()
+
+        for i, frame in enumerate(frames):
+            if self.rate is not None:
+                delay = start + i / self.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            self.sent_at.append(time.perf_counter())
+            await self._send(ws, frame)
+
+        self.done.set()
+
+    async def handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        await self._send(ws, self.frames[0])
+
+        replay: Optional[asyncio.Task] = None
+
+        async for msg in ws:
+            if msg.type is not WSMsgType.TEXT:
+                continue
+
+            op = json.loads(msg.data)["op"]
+
+            if op == 2 and replay is None:
+                replay = asyncio.create_task(self._replay(ws))
+            elif op == 1:
+                # the zlib stream belongs to the replay, plain text frames are fine too
+                await ws.send_str(json.dumps({"op": 11}))
+
+        if replay is not None:
+            replay.cancel()
+
+        return ws
+
+
+async def _serve(payloads, rate, fragment, conn):
+    gateway = FakeGateway(payloads, rate=rate, fragment=fragment)
+    runner = web.AppRunner(gateway.app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore
+    conn.send(port)
+
+    await gateway.done.wait()
+    conn.send(gateway.sent_at)
+
+    # keep serving until the client hung up
+    await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+    await runner.cleanup()
+
+
+def _main(payloads, rate, fragment, conn):
+    asyncio.run(_serve(payloads, rate, fragment, conn))
+
+
+class GatewayProcess:
+    """Runs a :class:`FakeGateway` in a child process."""
+
+    def __init__(
+        self,
+        payloads: List[dict],
+        *,
+        rate: Optional[float] = None,
+        fragment: Optional[int] = None,
+    ):
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_main, args=(payloads, rate, fragment, child), daemon=True
+        )
+
+    def start(self) -> str:
+        self._process.start()
+        port = self._conn.recv()
+        return f"ws://127.0.0.1:{port}/?v=10&encoding=json&compress=zlib-stream"
+
+    async def sent_at(self) -> List[float]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._conn.recv)
+
+    def stop(self):
+        self._conn.send(None)
+        self._process.join(5)
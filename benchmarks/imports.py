@@ -0,0 +1,65 @@
+"""Measures how long importing wharf takes in a fresh interpreter.
+
+Run with ``python -m benchmarks.imports``. Every statement is run ``-n`` times, each in a new
+process so nothing is cached in ``sys.modules``, and the median is reported along with how
+many modules it loaded. ``from wharf import *`` loads every submodule, which is what
+``import wharf`` used to do before submodules were loaded lazily.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+STATEMENTS = (
+    "import wharf",
+    "from wharf import HTTPClient, Route",
+    "from wharf import Client, Intents",
+    "from wharf import *",
+)
+
+HEAVY = ("aiohttp", "aiohttp.web", "discord_typings", "wharf.gateway", "wharf.client")
+
+_PROBE = """
+import json, sys, time
+before = set(sys.modules)
+start = time.perf_counter()
+exec({statement!r})
+elapsed = time.perf_counter() - start
+loaded = set(sys.modules) - before
+print(json.dumps({{"elapsed": elapsed, "modules": len(loaded), "heavy": sorted(m for m in {heavy!r} if m in loaded)}}))
+"""
+
+
+def measure(statement: str, n: int) -> dict:
+    code = _PROBE.format(statement=statement, heavy=HEAVY)
+    runs = []
+
+    for _ in range(n):
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        runs.append(json.loads(out.stdout))
+
+    return {
+        "median_ms": statistics.median(run["elapsed"] for run in runs) * 1000,
+        "modules": runs[-1]["modules"],
+        "heavy": runs[-1]["heavy"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=15)
+    args = parser.parse_args()
+
+    for statement in STATEMENTS:
+        result = measure(statement, args.n)
+        print(
+            f"{statement:<36} {result['median_ms']:8.1f} ms {result['modules']:5d} modules"
+            f"  {', '.join(result['heavy']) or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
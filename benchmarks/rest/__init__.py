@@ -0,0 +1 @@
+"""REST ratelimit load tests against a local fake API, see ``python -m benchmarks.rest --help``."""
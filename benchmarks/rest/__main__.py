@@ -0,0 +1,195 @@
+"""Drives concurrent requests through :class:`wharf.HTTPClient` against the fake REST API.
+
+Run with ``python -m benchmarks.rest``. Requests are spread over a few routes per channel so
+several buckets (and one bucket hash shared by many channels) are exercised at once. Per
+bucket it reports throughput, how many 429s the client ran into, and the queueing latency,
+which is how long a request waited in the ratelimiter before its first attempt was sent.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import aiohttp
+
+import wharf
+from wharf.http import HTTPClient, Route
+
+from ..gateway.metrics import percentile
+from .server import RestServerProcess
+
+
+class _Request:
+    __slots__ = ("bucket", "started_at", "sent_at", "done_at", "statuses", "error")
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+        self.started_at = time.perf_counter()
+        self.sent_at: Optional[float] = None
+        self.done_at: Optional[float] = None
+        self.statuses: List[int] = []
+        self.error: Optional[str] = None
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    async def on_request_start(session, ctx: SimpleNamespace, params):
+        record: _Request = ctx.trace_request_ctx
+        if record.sent_at is None:
+            record.sent_at = time.perf_counter()
+
+    async def on_request_end(session, ctx: SimpleNamespace, params):
+        ctx.trace_request_ctx.statuses.append(params.response.status)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+
+def _workload(count: int, channels: int, seed: int) -> List[Route]:
+    rng = random.Random(seed)
+    channel_ids = [175928847299117063 + i for i in range(channels)]
+    routes = []
+
+    for _ in range(count):
+        roll = rng.random()
+        channel_id = rng.choice(channel_ids)
+
+        if roll < 0.6:
+            route = Route(
+                "POST", f"/channels/{channel_id}/messages", channel_id=channel_id
+            )
+        elif roll < 0.9:
+            route = Route("GET", f"/channels/{channel_id}", channel_id=channel_id)
+        else:
+            route = Route("GET", "/users/@me")
+
+        routes.append(route)
+
+    return routes
+
+
+async def _one(http: HTTPClient, route: Route, record: _Request, semaphore):
+    async with semaphore:
+        try:
+            await http.request(
+                route,
+                json_params={"content": "load test"}
+                if route.method == "POST"
+                else None,
+                trace_request_ctx=record,
+            )
+        except wharf.HTTPException:
+            record.error = f"HTTP {record.statuses[-1]}"
+        except Exception as exc:
+            record.error = type(exc).__name__
+        finally:
+            record.done_at = time.perf_counter()
+
+
+async def run(args: argparse.Namespace) -> None:
+    server = RestServerProcess(
+        bucket_limit=args.bucket_limit,
+        bucket_window=args.bucket_window,
+        global_limit=args.global_limit,
+        cloudflare_rate=args.cloudflare_rate,
+        error_rate=args.error_rate,
+        latency=args.latency / 1000,
+        seed=args.seed,
+    )
+    api_url = await asyncio.get_running_loop().run_in_executor(None, server.start)
+
+    http = HTTPClient(
+        token="benchmark", api_url=api_url, trace_configs=[_trace_config()]
+    )
+    routes = _workload(args.requests, args.channels, args.seed)
+    records = [_Request(route.bucket) for route in routes]
+    semaphore = asyncio.Semaphore(args.concurrency or len(routes))
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            _one(http, route, record, semaphore)
+            for route, record in zip(routes, records)
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    await http.close()
+    stats = server.stop()
+
+    by_bucket: Dict[str, List[_Request]] = defaultdict(list)
+    for record in records:
+        by_bucket[record.bucket].append(record)
+
+    print(
+        f"{'bucket':<48} {'reqs':>6} {'errors':>6} {'429s':>5} {'req/s':>8} "
+        f"{'queue p50':>10} {'queue p99':>10} {'total p99':>10}"
+    )
+
+    for bucket, group in sorted(by_bucket.items(), key=lambda item: -len(item[1])):
+        queued = [(r.sent_at - r.started_at) * 1000 for r in group if r.sent_at]
+        total = [(r.done_at - r.started_at) * 1000 for r in group if r.done_at]
+        limited = sum(r.statuses.count(429) for r in group)
+        errors = sum(r.error is not None for r in group)
+        span = max(r.done_at for r in group) - min(r.started_at for r in group)  # type: ignore
+
+        print(
+            f"{bucket[:48]:<48} {len(group):>6} {errors:>6} {limited:>5} "
+            f"{len(group) / span:>8.1f} {percentile(queued, 50):>8.1f}ms "
+            f"{percentile(queued, 99):>8.1f}ms {percentile(total, 99):>8.1f}ms"
+        )
+
+    failed = defaultdict(int)
+    for record in records:
+        if record.error is not None:
+            failed[record.error] += 1
+
+    print()
+    print(
+        f"{len(records)} requests in {elapsed:.2f}s ({len(records) / elapsed:.1f} req/s), "
+        f"{stats['requests']} reached the server"
+    )
+    print(
+        "server: "
+        + ", ".join(
+            f"{key} {value}" for key, value in stats.items() if key != "requests"
+        )
+    )
+    if failed:
+        print(
+            "failed: " + ", ".join(f"{key} x{value}" for key, value in failed.items())
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.rest")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=0, help="0 for no limit")
+    parser.add_argument("--bucket-limit", type=int, default=50)
+    parser.add_argument("--bucket-window", type=float, default=1.0)
+    parser.add_argument(
+        "--global-limit", type=int, default=None, help="requests per second"
+    )
+    parser.add_argument("--cloudflare-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="server ms per request"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    logging.getLogger("wharf").setLevel(args.log_level)
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
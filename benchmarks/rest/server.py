@@ -0,0 +1,224 @@
+"""A local stand-in for the Discord REST API that enforces ratelimits the way Discord does.
+
+Every route maps to a bucket hash shared by all routes with the same shape, and limits are
+counted per hash and major parameter (the channel, guild or webhook id), with the usual
+``X-RateLimit-*`` headers on every response. On top of that it can enforce a global limit,
+answer a fraction of requests with Cloudflare style 429s (no ``Via`` header, no JSON body) and
+inject 5xx errors.
+"""
+import asyncio
+import hashlib
+import math
+import multiprocessing
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+MAJOR_RESOURCES = ("channels", "guilds", "webhooks")
+
+
+def bucket_for(method: str, path: str) -> Tuple[str, str]:
+    """Returns the bucket hash and major parameter of a request path like ``/channels/1/messages``."""
+    segments = path.strip("/").split("/")
+    major = ""
+
+    if len(segments) > 1 and segments[0] in MAJOR_RESOURCES:
+        major = segments[1]
+
+    shape = "/".join(
+        "{id}"
+        if segment.isdigit() or (i == 2 and segments[0] == "webhooks")
+        else segment
+        for i, segment in enumerate(segments)
+    )
+    digest = hashlib.sha1(f"{method} {shape}".encode()).hexdigest()[:16]
+    return digest, major
+
+
+class FakeRestServer:
+    """Serves ``/api/v10/*``, answering every request that makes it past the limits with a stub.
+    Args:
+        bucket_limit (int): Requests per bucket and major parameter per window.
+        bucket_window (float): The bucket window in seconds.
+        global_limit (Optional[int]): Requests per second across all buckets, None to disable.
+        cloudflare_rate (float): The fraction of requests answered with a Cloudflare 429.
+        error_rate (float): The fraction of requests answered with a 5xx.
+        latency (float): Seconds every request takes to process.
+        seed (int): Seeds error and Cloudflare injection.
+    """
+
+    def __init__(
+        self,
+        *,
+        bucket_limit: int = 50,
+        bucket_window: float = 1.0,
+        global_limit: Optional[int] = None,
+        cloudflare_rate: float = 0.0,
+        error_rate: float = 0.0,
+        latency: float = 0.0,
+        seed: int = 0,
+    ):
+        self.bucket_limit = bucket_limit
+        self.bucket_window = bucket_window
+        self.global_limit = global_limit
+        self.cloudflare_rate = cloudflare_rate
+        self.error_rate = error_rate
+        self.latency = latency
+        self._random = random.Random(seed)
+
+        # (hash, major) -> [reset_at, remaining]
+        self._windows: Dict[Tuple[str, str], List[float]] = {}
+        self._global_window = [0.0, 0]
+        self._ids = 0
+
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "ok": 0,
+            "bucket_429": 0,
+            "global_429": 0,
+            "cloudflare_429": 0,
+            "server_errors": 0,
+        }
+
+        self.app = web.Application()
+        self.app.router.add_route("*", "/api/v10/{path:.*}", self.handle)
+
+    def _json(self, data: dict, *, status: int = 200, headers: Optional[dict] = None):
+        return web.json_response(data, status=status, headers=headers)
+
+    def _ratelimited(self, scope: str, retry_after: float, headers: dict):
+        headers = {
+            **headers,
+            "Retry-After": str(math.ceil(retry_after)),
+            "X-RateLimit-Scope": scope,
+            "Via": "1.1 google",
+        }
+
+        if scope == "global":
+            headers["X-RateLimit-Global"] = "true"
+
+        body = {
+            "message": "You are being rate limited.",
+            "retry_after": round(retry_after, 3),
+            "global": scope == "global",
+        }
+        return self._json(body, status=429, headers=headers)
+
+    def _check_global(self, now: float) -> Optional[web.Response]:
+        if self.global_limit is None:
+            return None
+
+        window = self._global_window
+        if now >= window[0]:
+            window[0] = math.floor(now) + 1
+            window[1] = 0
+
+        if window[1] >= self.global_limit:
+            self.stats["global_429"] += 1
+            return self._ratelimited("global", window[0] - now, {})
+
+        window[1] += 1
+        return None
+
+    def _next_id(self) -> str:
+        self._ids += 1
+        return str((int(time.time() * 1000) - 1420070400000) << 22 | self._ids & 0xFFF)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.stats["requests"] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self._random.random() < self.cloudflare_rate:
+            self.stats["cloudflare_429"] += 1
+            return web.Response(
+                status=429, text="error code: 1015", content_type="text/plain"
+            )
+
+        now = time.time()
+
+        response = self._check_global(now)
+        if response is not None:
+            return response
+
+        digest, major = bucket_for(request.method, request.match_info["path"])
+        window = self._windows.get((digest, major))
+
+        if window is None or now >= window[0]:
+            window = self._windows[(digest, major)] = [
+                now + self.bucket_window,
+                self.bucket_limit,
+            ]
+
+        reset_after = window[0] - now
+        headers = {
+            "X-RateLimit-Bucket": digest,
+            "X-RateLimit-Limit": str(self.bucket_limit),
+            "X-RateLimit-Reset": f"{window[0]:.3f}",
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+        }
+
+        if window[1] <= 0:
+            self.stats["bucket_429"] += 1
+            headers["X-RateLimit-Remaining"] = "0"
+            return self._ratelimited("user", reset_after, headers)
+
+        window[1] -= 1
+        headers["X-RateLimit-Remaining"] = str(int(window[1]))
+
+        if self._random.random() < self.error_rate:
+            self.stats["server_errors"] += 1
+            status = self._random.choice((500, 502, 503, 504))
+            return web.Response(status=status, text="upstream error", headers=headers)
+
+        self.stats["ok"] += 1
+
+        data = {"id": self._next_id()}
+        if request.can_read_body:
+            data.update(await request.json())
+
+        return self._json(data, headers=headers)
+
+
+async def _serve(options: dict, conn):
+    server = FakeRestServer(**options)
+    runner = web.AppRunner(server.app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+
+    conn.send(site._server.sockets[0].getsockname()[1])  # type: ignore
+
+    await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+    conn.send(server.stats)
+    await runner.cleanup()
+
+
+def _main(options: dict, conn):
+    asyncio.run(_serve(options, conn))
+
+
+class RestServerProcess:
+    """Runs a :class:`FakeRestServer` in a child process, see it for the options."""
+
+    def __init__(self, **options):
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_main, args=(options, child), daemon=True
+        )
+
+    def start(self) -> str:
+        """Starts the server, returning the base API url to point a client at."""
+        self._process.start()
+        port = self._conn.recv()
+        return f"http://127.0.0.1:{port}/api/v10"
+
+    def stop(self) -> Dict[str, int]:
+        """Stops the server, returning its response counters."""
+        self._conn.send(None)
+        stats = self._conn.recv()
+        self._process.join(5)
+        return stats
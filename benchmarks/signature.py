@@ -0,0 +1,89 @@
+"""Measures interaction signature verification, alone and through the interactions server.
+
+Run with ``python -m benchmarks.signature``.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp.test_utils import TestClient, TestServer
+from nacl.signing import SigningKey
+
+import wharf
+
+
+def _sign(key: SigningKey, body: bytes):
+    timestamp = str(int(time.time()))
+    signature = key.sign(timestamp.encode() + body).signature.hex()
+    return {"X-Signature-Ed25519": signature, "X-Signature-Timestamp": timestamp}
+
+
+def bench_verify(key: SigningKey, n: int):
+    verifier = wharf.SignatureVerifier(key.verify_key.encode().hex())
+    body = json.dumps({"type": 2, "id": "1", "data": {"name": "ping"}}).encode()
+    headers = _sign(key, body)
+
+    start = time.perf_counter()
+    for _ in range(n):
+        verifier.verify(
+            headers["X-Signature-Timestamp"], body, headers["X-Signature-Ed25519"]
+        )
+    elapsed = time.perf_counter() - start
+
+    print(f"verify:      {n / elapsed:10.0f} req/s ({elapsed / n * 1e6:.1f} us each)")
+
+
+async def bench_server(key: SigningKey, n: int, concurrency: int):
+    client = wharf.Client(token="benchmark", intents=wharf.Intents.NONE)
+    server = wharf.InteractionServer(client, public_key=key.verify_key.encode().hex())
+
+    async def interaction_create(interaction):
+        await interaction.reply("pong")
+
+    client.dispatcher.subscribe("interaction_create", interaction_create)
+
+    bodies = [
+        json.dumps(
+            {
+                "type": 2,
+                "id": str(i),
+                "token": "t",
+                "data": {"name": "ping", "options": []},
+            }
+        ).encode()
+        for i in range(n)
+    ]
+    signed = [(body, _sign(key, body)) for body in bodies]
+
+    async with TestClient(TestServer(server.app)) as http:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(body, headers):
+            async with semaphore:
+                resp = await http.post("/interactions", data=body, headers=headers)
+                assert resp.status == 200, resp.status
+                await resp.read()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(body, headers) for body, headers in signed))
+        elapsed = time.perf_counter() - start
+
+    print(
+        f"server:      {n / elapsed:10.0f} req/s (inline replies, {concurrency} in flight)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    key = SigningKey.generate()
+    bench_verify(key, args.n)
+    asyncio.run(bench_server(key, args.n, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,15 @@
+import logging
+
 import wharf
 
-client = wharf.Client(token="SomeToken", intents=wharf.Intents.all())
+logging.basicConfig(level=logging.INFO)
+
+client = wharf.Client(
+    token="SomeToken",
+    intents=wharf.Intents.GUILDS
+    | wharf.Intents.GUILD_MESSAGES
+    | wharf.Intents.MESSAGE_CONTENT,
+)
 
 
 @client.listen("ready")
@@ -11,7 +20,7 @@ async def ready(data):
 @client.listen("message_create")
 async def message_create(message):
     if message.content == ".hi":
-        await client.send(message.channel_id, "hi :)")
+        await client.send_message(message.channel_id, "hi :)")
 
 
 client.run()
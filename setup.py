@@ -20,5 +20,11 @@ setup(
     license="MIT",
     description="An minimal discord api wrapper that allows you to do what you want to do",
     install_requires=requirements,
+    extras_require={
+        "interactions": ["PyNaCl"],
+        "snapshot": ["msgpack"],
+        "opentelemetry": ["opentelemetry-api"],
+        "uvloop": ["uvloop; sys_platform != 'win32'"],
+    },
     python_requires=">=3.8.0",
 )
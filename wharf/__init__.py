@@ -4,10 +4,104 @@ __version__ = "1.0.0"
 __license__ = "MIT"
 __copyright__ = "Copyright (c) 2022 SawshaDev"
 
-from .client import *
-from .errors import *
-from .file import *
-from .gateway import *
-from .http import *
-from .impl import *
-from .intents import *
+import importlib
+from typing import TYPE_CHECKING
+
+# Submodules are imported the first time one of their names is looked up, so a worker that
+# only needs the REST client doesn't pay for the gateway, the models or the metrics server.
+_EXPORTS = {
+    "asset": ("Asset", "AssetCache"),
+    "cache": ("Cache",),
+    "client": ("Client",),
+    "commands": ("CommandRouter", "command_hash"),
+    "dispatcher": ("Dispatcher",),
+    "enums": ("Statuses",),
+    "errors": ("BaseException", "BucketMigrated", "HTTPException", "WebsocketClosed"),
+    "file": ("File",),
+    "gateway": ("Gateway", "OPCodes"),
+    "http": ("HTTPClient", "Route"),
+    "impl": (
+        "Bucket",
+        "BurstRatelimiter",
+        "Channel",
+        "Deduplicator",
+        "Embed",
+        "EventBatcher",
+        "GatewaySendQueue",
+        "Guild",
+        "Interaction",
+        "InteractionCommand",
+        "InteractionOption",
+        "InteractionOptionType",
+        "ManualRatelimiter",
+        "Member",
+        "MemberChunkRequest",
+        "Message",
+        "MessageCoalescer",
+        "PayloadDecoder",
+        "Ratelimiter",
+        "RatelimiterBase",
+        "User",
+        "WaiterRegistry",
+        "WindowRatelimiter",
+    ),
+    "intents": ("Intents",),
+    "interactions": ("InteractionServer", "SignatureVerifier"),
+    "metrics": ("Counter", "Gauge", "Histogram", "Metrics"),
+    "profiling": ("HandlerProfiler", "LoopMonitor", "SamplingProfiler"),
+    "runner": ("new_event_loop", "run"),
+    "snapshot": ("load_snapshot", "save_snapshot"),
+    "tracing": (
+        "OpenTelemetryProcessor",
+        "Span",
+        "SpanRecorder",
+        "Tracer",
+        "current_span",
+    ),
+    "webhook": ("Webhook",),
+}
+
+_LAZY = {name: module for module, names in _EXPORTS.items() for name in names}
+
+# reachable as wharf.BaseException, but a star import mustn't shadow the builtin
+__all__ = tuple(name for name in _LAZY if name != "BaseException")
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+
+    if module is not None:
+        value = getattr(importlib.import_module(f".{module}", __name__), name)
+    elif name in _EXPORTS:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY) | set(_EXPORTS))
+
+
+if TYPE_CHECKING:
+    from .asset import *
+    from .cache import *
+    from .client import Client
+    from .commands import *
+    from .dispatcher import Dispatcher
+    from .enums import Statuses
+    from .errors import BaseException, BucketMigrated, HTTPException, WebsocketClosed
+    from .file import *
+    from .gateway import Gateway, OPCodes
+    from .http import HTTPClient, Route
+    from .impl import *
+    from .intents import Intents
+    from .interactions import *
+    from .metrics import *
+    from .profiling import *
+    from .runner import *
+    from .snapshot import *
+    from .tracing import *
+    from .webhook import *
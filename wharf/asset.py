@@ -1,13 +1,43 @@
 from __future__ import annotations
 
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Union
+
+import aiohttp
+
+if TYPE_CHECKING:
+    from .http import HTTPClient
+
+__all__ = ("Asset", "AssetCache")
+
+_log = logging.getLogger(__name__)
+
+
+VALID_FORMATS = ("webp", "png", "jpg", "jpeg", "gif")
+VALID_SIZES = tuple(1 << i for i in range(4, 13))
+
 
 class Asset:
     BASE_URL = "https://cdn.discordapp.com"
 
-    def __init__(self, *, url: str, key: str, animated: bool = False):
+    def __init__(
+        self,
+        *,
+        url: str,
+        key: str,
+        animated: bool = False,
+        cache: Optional[AssetCache] = None,
+    ):
         self._url: str = url
         self._animated: bool = animated
         self._key: str = key
+        self._cache = cache
 
     @property
     def url(self) -> str:
@@ -23,12 +53,364 @@ class Asset:
         """:class:`bool`: Returns whether the asset is animated."""
         return self._animated
 
+    def url_for(
+        self, *, size: Optional[int] = None, format: Optional[str] = None
+    ) -> str:
+        """:class:`str`: Returns the URL of this asset in another size and/or format."""
+        path, _, query = self._url.partition("?")
+        base, _, current_format = path.rpartition(".")
+        current_size = query.partition("size=")[2] or "1024"
+
+        format = format or current_format
+        size = size or int(current_size)
+
+        if format not in VALID_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(VALID_FORMATS)}")
+        if format == "gif" and not self._animated:
+            raise ValueError("only animated assets can be fetched as gif")
+        if size not in VALID_SIZES:
+            raise ValueError("size must be a power of 2 between 16 and 4096")
+
+        return f"{base}.{format}?size={size}"
+
+    async def read(
+        self,
+        *,
+        size: Optional[int] = None,
+        format: Optional[str] = None,
+        cache: Optional[AssetCache] = None,
+    ) -> bytes:
+        """Downloads the asset, or reads it from the cache if it was downloaded before.
+        Args:
+            size (Optional[int]): The size to fetch, a power of 2 between 16 and 4096.
+            format (Optional[str]): One of webp, png, jpg, jpeg or gif.
+            cache (Optional[AssetCache]): The cache to go through, defaults to the client's.
+        """
+        cache = cache or self._cache or AssetCache.default()
+        url = self.url_for(size=size, format=format)
+        size = int(url.rpartition("size=")[2])
+        format = url.partition("?")[0].rpartition(".")[2]
+
+        return await cache.get(url, f"{self._key}-{size}.{format}")
+
+    async def save(
+        self,
+        fp: Union[str, os.PathLike, io.BufferedIOBase],
+        *,
+        size: Optional[int] = None,
+        format: Optional[str] = None,
+        cache: Optional[AssetCache] = None,
+    ) -> int:
+        """Writes the asset to a path or file object, returning how many bytes were written."""
+        data = await self.read(size=size, format=format, cache=cache)
+
+        if isinstance(fp, io.BufferedIOBase):
+            return fp.write(data)
+
+        with open(fp, "wb") as f:
+            return f.write(data)
+
     @classmethod
-    def _from_avatar(cls, user_id: int, avatar: str):
+    def _from_avatar(
+        cls, user_id: int, avatar: str, *, cache: Optional[AssetCache] = None
+    ):
         animated = avatar.startswith("a_")
         formatted = "gif" if animated else "png"
         return cls(
             url=f"{cls.BASE_URL}/avatars/{user_id}/{avatar}.{formatted}?size=1024",
             key=avatar,
             animated=animated,
+            cache=cache,
         )
+
+
+class _DiskEntry:
+    __slots__ = ("size", "etag", "last_modified", "fetched_at")
+
+    def __init__(
+        self,
+        size: int,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        fetched_at: float,
+    ):
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+
+class AssetCache:
+    """A two tier LRU cache for CDN assets.
+
+    Assets are keyed by their hash, size and format. Discord hashes change whenever the image
+    does, so entries practically never go stale, they're still revalidated with a conditional
+    request once they're older than ``revalidate_after``. The memory tier holds the most
+    recently read bytes, the disk tier survives restarts and evicts the least recently read
+    files once it grows past ``max_disk_bytes``.
+
+    Args:
+        http (Optional[HTTPClient]): Downloads go through its session, a separate one is made otherwise.
+        directory (Optional[str]): Where to keep the disk tier, no disk tier if None.
+        max_memory_bytes (int): Defaults to 32 MiB.
+        max_disk_bytes (int): Defaults to 512 MiB.
+        revalidate_after (float): Seconds after which an entry is revalidated. Defaults to a day.
+    """
+
+    _default: Optional[AssetCache] = None
+
+    def __init__(
+        self,
+        http: Optional[HTTPClient] = None,
+        *,
+        directory: Optional[str] = None,
+        max_memory_bytes: int = 32 * 1024 * 1024,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+        revalidate_after: float = 24 * 60 * 60,
+    ):
+        self.http = http
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.revalidate_after = revalidate_after
+
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: OrderedDict[str, _DiskEntry] = OrderedDict()
+        self._disk_bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._load_index()
+
+    @classmethod
+    def default(cls) -> AssetCache:
+        """A memory only cache for assets that don't belong to a client."""
+        if cls._default is None:
+            cls._default = cls()
+
+        return cls._default
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self.http is not None:
+            return self.http._session
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)  # type: ignore
+
+    def _load_index(self):
+        entries = []
+
+        for root, _, files in os.walk(self.directory):  # type: ignore
+            for name in files:
+                if name.endswith(".meta") or name.endswith(".tmp"):
+                    continue
+
+                path = os.path.join(root, name)
+                meta = self._read_meta(path)
+                stat = os.stat(path)
+                entries.append((stat.st_atime, name, stat.st_size, meta))
+
+        # oldest first, so the OrderedDict ends up in LRU order
+        for _, name, size, meta in sorted(entries):
+            self._disk[name] = _DiskEntry(size, *meta)
+            self._disk_bytes += size
+
+    @staticmethod
+    def _read_meta(path: str) -> Tuple[Optional[str], Optional[str], float]:
+        try:
+            with open(f"{path}.meta") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None, None, 0.0
+
+        return meta.get("etag"), meta.get("last_modified"), meta.get("fetched_at", 0.0)
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.max_memory_bytes:
+            return
+
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    async def get(self, url: str, key: str) -> bytes:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return data
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+
+        try:
+            data = await self._get_uncached(url, key)
+        except Exception as exc:
+            future.set_exception(exc)
+            # nobody else might be waiting, don't let the loop complain about it
+            future.exception()
+            raise
+        else:
+            future.set_result(data)
+            self._remember(key, data)
+            return data
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _get_uncached(self, url: str, key: str) -> bytes:
+        loop = asyncio.get_running_loop()
+        entry = self._disk.get(key)
+
+        if entry is not None:
+            data = await loop.run_in_executor(None, self._read_file, key)
+
+            if data is not None:
+                self._disk.move_to_end(key)
+
+                if time.time() - entry.fetched_at < self.revalidate_after:
+                    self.disk_hits += 1
+                    return data
+
+                fresh = await self._download(url, key, entry)
+                self.revalidations += 1
+                return data if fresh is None else fresh
+
+            self._forget(key)
+
+        self.misses += 1
+        data = await self._download(url, key, None)
+        return data  # type: ignore
+
+    async def _download(
+        self, url: str, key: str, entry: Optional[_DiskEntry]
+    ) -> Optional[bytes]:
+        """Downloads an asset, returning None if the cached copy is still valid."""
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        async with self.session.get(url, headers=headers) as resp:
+            if resp.status == 304 and entry is not None:
+                entry.fetched_at = time.time()
+                await self._write_meta(key, entry)
+                return None
+
+            resp.raise_for_status()
+
+            buffer = bytearray()
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                buffer.extend(chunk)
+
+            data = bytes(buffer)
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+
+        if self.directory is not None:
+            await self._store(key, data, etag, last_modified)
+
+        return data
+
+    async def _store(
+        self, key: str, data: bytes, etag: Optional[str], last_modified: Optional[str]
+    ):
+        self._forget(key)
+
+        entry = _DiskEntry(len(data), etag, last_modified, time.time())
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._write_file, key, data
+        )
+        await self._write_meta(key, entry)
+
+        self._disk[key] = entry
+        self._disk_bytes += entry.size
+
+        while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+            evicted = next(iter(self._disk))
+            self._forget(evicted)
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._remove_file, evicted
+            )
+
+    def _forget(self, key: str):
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry.size
+
+    def _read_file(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        # bump the access time so the LRU order survives restarts even on noatime mounts
+        os.utime(path)
+        return data
+
+    def _write_file(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+
+        os.replace(f"{path}.tmp", path)
+
+    async def _write_meta(self, key: str, entry: _DiskEntry):
+        if self.directory is None:
+            return
+
+        meta = json.dumps(
+            {
+                "etag": entry.etag,
+                "last_modified": entry.last_modified,
+                "fetched_at": entry.fetched_at,
+            }
+        )
+
+        def write():
+            with open(f"{self._path(key)}.meta", "w") as f:
+                f.write(meta)
+
+        await asyncio.get_running_loop().run_in_executor(None, write)
+
+    def _remove_file(self, key: str):
+        for path in (self._path(key), f"{self._path(key)}.meta"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Union
+
+from .impl import Guild, Member
+from .intents import Intents
+
+if TYPE_CHECKING:
+    from .client import Client
+
+__all__ = ("Cache",)
+
+
+Snowflake = Union[int, str]
+
+
+class Cache:
+    """Holds the entities the client has seen, keyed by their integer IDs.
+
+    Guilds from GUILD_CREATE are stored as their raw payloads and only turned into
+    :class:`Guild` and :class:`Member` models the first time they're looked up, unless
+    ``lazy_guilds`` is off. Once every guild announced in READY arrived, or none arrived for
+    ``guild_ready_timeout`` seconds, a ``guilds_ready`` event is dispatched. Without the
+    GUILDS intent no GUILD_CREATE ever arrives, so ``guilds_ready`` follows READY right away.
+
+    Args:
+        bot (Client): The client this cache belongs to.
+        lazy_guilds (bool): Whether guild payloads are hydrated on first access. Defaults to True.
+        guild_ready_timeout (float): Seconds without a GUILD_CREATE before giving up on the rest.
+        intents (Intents): The intents the client identifies with. Defaults to all of them.
+    """
+
+    def __init__(
+        self,
+        bot: Client,
+        *,
+        lazy_guilds: bool = True,
+        guild_ready_timeout: float = 2.0,
+        intents: Intents = Intents.ALL,
+    ):
+        self.bot = bot
+        self.lazy_guilds = lazy_guilds
+        self.guild_ready_timeout = guild_ready_timeout
+        self.intents = intents
+
+        self.members: Dict[int, Dict[int, Member]] = {}
+        self.guilds: Dict[int, Guild] = {}
+        self._raw_guilds: Dict[int, dict] = {}
+
+        self.guilds_expected = 0
+        self.guilds_loaded = 0
+        self._pending_guilds: Set[int] = set()
+        self._guilds_ready_task: Optional[asyncio.Task] = None
+        self._last_guild_create = 0.0
+
+        self.ready_at: Optional[float] = None
+        self.guilds_ready_at: Optional[float] = None
+
+    def add_member(self, guild_id: Snowflake, member: Member):
+        self.members.setdefault(int(guild_id), {})[int(member.id)] = member
+
+    def get_member(self, guild_id: Snowflake, user_id: Snowflake) -> Optional[Member]:
+        self._hydrate(int(guild_id))
+        return self.members.get(int(guild_id), {}).get(int(user_id))
+
+    def get_members(self, guild_id: Snowflake) -> List[Member]:
+        self._hydrate(int(guild_id))
+        return list(self.members.get(int(guild_id), {}).values())
+
+    def get_guild(self, guild_id: Snowflake) -> Optional[Guild]:
+        self._hydrate(int(guild_id))
+        return self.guilds.get(int(guild_id))
+
+    def remove_guild(self, guild_id: Snowflake):
+        self.guilds.pop(int(guild_id), None)
+        self._raw_guilds.pop(int(guild_id), None)
+        self.members.pop(int(guild_id), None)
+
+    @property
+    def guild_count(self) -> int:
+        return len(self.guilds) + len(self._raw_guilds)
+
+    def _hydrate(self, guild_id: int):
+        data = self._raw_guilds.pop(guild_id, None)
+        if data is None:
+            return
+
+        self.guilds[guild_id] = Guild(data, self.bot)
+
+        for payload in data.get("members", ()):
+            self.add_member(guild_id, Member(payload, self.bot))
+
+    def parse_ready(self, data: dict):
+        self.ready_at = time.monotonic()
+
+        application = data.get("application")
+        if application is not None:
+            self.bot.http.application_id = application["id"]
+
+        self.guilds_ready_at = None
+        self._pending_guilds = (
+            {int(g["id"]) for g in data.get("guilds", ())}
+            if Intents.GUILDS in self.intents
+            else set()
+        )
+        self.guilds_expected = len(self._pending_guilds)
+        self.guilds_loaded = 0
+        self._last_guild_create = self.ready_at
+
+        if self._guilds_ready_task is not None:
+            self._guilds_ready_task.cancel()
+
+        self._guilds_ready_task = asyncio.create_task(self._wait_for_guilds())
+
+    def parse_guild_create(self, data: dict):
+        if data.get("unavailable"):
+            return
+
+        guild_id = int(data["id"])
+
+        self.guilds.pop(guild_id, None)
+        self._raw_guilds[guild_id] = data
+
+        if not self.lazy_guilds:
+            self._hydrate(guild_id)
+
+        if guild_id in self._pending_guilds:
+            self._pending_guilds.discard(guild_id)
+            self.guilds_loaded += 1
+            self._last_guild_create = time.monotonic()
+
+    def parse_guild_delete(self, data: dict):
+        if not data.get("unavailable"):
+            self.remove_guild(data["id"])
+
+    async def _wait_for_guilds(self):
+        while self._pending_guilds:
+            idle = time.monotonic() - self._last_guild_create
+            if idle >= self.guild_ready_timeout:
+                break
+
+            await asyncio.sleep(min(0.1, self.guild_ready_timeout - idle))
+
+        self.guilds_ready_at = time.monotonic()
+        self._guilds_ready_task = None
+
+        dispatcher = self.bot.dispatcher
+        if dispatcher.wants("guilds_ready"):
+            dispatcher.dispatch(
+                "guilds_ready",
+                {
+                    "loaded": self.guilds_loaded,
+                    "expected": self.guilds_expected,
+                    "unavailable": [str(g) for g in self._pending_guilds],
+                },
+            )
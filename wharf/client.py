@@ -1,37 +1,303 @@
 import asyncio
-from typing import List
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
 
+from .asset import AssetCache
+from .cache import Cache
+from .commands import CommandRouter, command_hash
 from .dispatcher import Dispatcher
 from .enums import Statuses
 from .file import File
 from .http import HTTPClient
-from .impl import Channel, Embed, Guild, InteractionCommand
+from .impl import Channel, Embed, Guild, InteractionCommand, Member
 from .intents import Intents
+from .metrics import Metrics
+from .profiling import HandlerProfiler
+from .runner import run as run_loop
+from .snapshot import load_snapshot, save_snapshot
+from .tracing import Tracer
+
+_log = logging.getLogger(__name__)
+
+
+def _read_command_hashes(path: str) -> Dict[str, str]:
+    # one hash per scope, "global" or a guild id, anything unreadable counts as never synced
+    try:
+        with open(path) as f:
+            hashes = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+    return hashes if isinstance(hashes, dict) else {}
+
+
+def _write_command_hashes(path: str, hashes: Dict[str, str]):
+    tmp = f"{path}.tmp"
+
+    with open(tmp, "w") as f:
+        json.dump(hashes, f)
+
+    os.replace(tmp, path)
 
 
 class Client:
-    def __init__(self, *, token: str, intents: Intents):
-        self.intents = intents
+    def __init__(
+        self,
+        *,
+        token: str,
+        intents: Intents,
+        lazy_guilds: bool = True,
+        snapshot_path: Optional[str] = None,
+        defer_after: Optional[float] = 2.0,
+        coalesce_window: Optional[float] = None,
+        asset_cache_dir: Optional[str] = None,
+        metrics_port: Optional[int] = None,
+        shutdown_timeout: float = 10.0,
+        event_mode: str = "model",
+    ):
+        self.intents = Intents(intents)
+        self.snapshot_path = snapshot_path
+        self.defer_after = defer_after
+        self.coalesce_window = coalesce_window
+        self.shutdown_timeout = shutdown_timeout
+
+        self.started_at: Optional[float] = None
+        self.shutdown_seconds: Optional[float] = None
+        self.loop_lag = 0.0
+        self._lag_task: Optional[asyncio.Task] = None
 
-        self.dispatcher = Dispatcher(self)
+        self.metrics_port = metrics_port
+        self.metrics = Metrics()
+        # disabled until a processor is added, see Tracer
+        self.tracer = Tracer()
+
+        self.dispatcher = Dispatcher(
+            self,
+            metrics=self.metrics,
+            tracer=self.tracer,
+            intents=self.intents,
+            mode=event_mode,
+        )
         self.http = HTTPClient(
-            dispatcher=self.dispatcher, token=token, intents=intents.value
+            dispatcher=self.dispatcher,
+            token=token,
+            intents=int(self.intents),
+            metrics=self.metrics,
+            tracer=self.tracer,
         )
         self.ws = self.http._gateway
+        self.cache = Cache(self, lazy_guilds=lazy_guilds, intents=self.intents)
+        self.assets = AssetCache(self.http, directory=asset_cache_dir)
+
+        self.metrics.gauge(
+            "wharf_cache_guilds",
+            "Guilds in the cache.",
+            func=lambda: self.cache.guild_count,
+        )
+        self.metrics.gauge(
+            "wharf_client_startup_seconds",
+            "Time from starting the client until READY and until every guild arrived.",
+            ("phase",),
+            func=self._startup_samples,
+        )
+        self.metrics.gauge(
+            "wharf_client_shutdown_seconds",
+            "How long the last shutdown took.",
+            func=lambda: self.shutdown_seconds or 0.0,
+        )
+        self.metrics.gauge(
+            "wharf_loop_lag_seconds",
+            "How late a once a second timer on the event loop last fired.",
+            func=lambda: self.loop_lag,
+        )
+
+        self.dispatcher.add_parser("ready", self.cache.parse_ready)
+
+        # without GUILDS the guild cache is never fed, so don't parse for it either
+        if Intents.GUILDS in self.intents:
+            self.dispatcher.add_parser("guild_create", self.cache.parse_guild_create)
+            self.dispatcher.add_parser("guild_delete", self.cache.parse_guild_delete)
+
+        self.router = CommandRouter(self)
+        self.dispatcher.add_parser("interaction_create", self.router.route)
+        self.dispatcher.add_middleware(self._track_interactions)
         self._slash_commands = []
 
-    def listen(self, name: str):
+    @property
+    def latency(self) -> float:
+        """Seconds between the last gateway heartbeat and its ACK."""
+        return self.ws.latency
+
+    @property
+    def latencies(self) -> List[Tuple[int, float]]:
+        """A ``(shard_id, latency)`` pair per shard. wharf currently runs a single shard."""
+        return [(0, self.ws.latency)]
+
+    def listen(self, name: str, *, mode: Optional[str] = None):
+        """Registers the decorated function as a listener.
+
+        Args:
+            name (str): The event, e.g. ``"message_create"``.
+            mode (Optional[str]): "model", "dict" or "bytes", defaults to ``event_mode``, see :class:`Dispatcher`.
+        """
+
         def inner(func):
             if name not in self.dispatcher.events:
-                self.dispatcher.subscribe(name, func)
+                self.dispatcher.subscribe(name, func, mode=mode)
             else:
-                self.dispatcher.add_callback(name, func)
+                self.dispatcher.add_callback(name, func, mode=mode)
 
         return inner
 
+    def listen_batch(
+        self,
+        *names: str,
+        mode: str = "dict",
+        max_size: int = 100,
+        max_delay: Optional[float] = 0.05,
+    ):
+        """Registers the decorated function as a batch listener of these events.
+
+        It's called with lists of ``(event_name, event)`` pairs, see
+        :meth:`Dispatcher.add_batch_listener`.
+        """
+
+        def inner(func):
+            self.dispatcher.add_batch_listener(
+                func, *names, mode=mode, max_size=max_size, max_delay=max_delay
+            )
+            return func
+
+        return inner
+
+    def _track_interactions(self, event_name: str, data: Any) -> bool:
+        if event_name == "interaction_create" and data.get("type") != 1:
+            self.http.track_interaction(data, defer_after=self.defer_after)
+
+        return True
+
+    def command(self, command: InteractionCommand, *path: str):
+        """Routes an application command, or a subcommand of it, to the decorated function.
+
+        The function is called with the interaction and the command's options as keyword
+        arguments, see :class:`CommandRouter`.
+        """
+
+        def inner(func):
+            self.router.add(command, func, *path)
+            return func
+
+        return inner
+
+    def middleware(self, func):
+        """Registers a dispatcher middleware, see :meth:`Dispatcher.add_middleware`."""
+        self.dispatcher.add_middleware(func)
+        return func
+
+    async def wait_for(
+        self,
+        event: str,
+        *,
+        check: Optional[Callable[..., bool]] = None,
+        timeout: Optional[float] = None,
+        **keys: Any,
+    ):
+        """Waits for the next dispatch of an event, optionally matching a check.
+
+        Keyword arguments such as ``channel_id``, ``user_id``, ``guild_id``, ``message_id`` and
+        ``interaction_id`` are matched against the raw payload before the check runs, and are what
+        the waiter is indexed by, so prefer them over doing the same comparison inside ``check``.
+
+        Args:
+            event (str): The name of the event, e.g. ``"message_create"``.
+            check (Optional[Callable[..., bool]]): A predicate given whatever a listener would receive.
+            timeout (Optional[float]): How many seconds to wait before raising ``asyncio.TimeoutError``.
+        """
+        if not self.intents.delivers(event):
+            _log.warning(
+                "Waiting for %r, which the intents %r never deliver",
+                event,
+                self.intents,
+            )
+
+        future = self.dispatcher.waiters.add(event.lower(), check=check, **keys)
+        return await asyncio.wait_for(future, timeout)
+
     async def change_presence(self, status: Statuses):
         await self.ws._change_precense(status=status.value)
 
+    def enable_profiling(
+        self,
+        *,
+        keep: int = 20,
+        slow_threshold: float = 0.5,
+        block_threshold: Optional[float] = 0.1,
+    ) -> HandlerProfiler:
+        """Starts timing listeners and watching the event loop, see :class:`HandlerProfiler`.
+
+        Can be called before or while the client runs.
+        """
+        self.disable_profiling()
+
+        profiler = HandlerProfiler(
+            keep=keep,
+            slow_threshold=slow_threshold,
+            block_threshold=block_threshold,
+            metrics=self.metrics,
+        )
+        self.dispatcher.profiler = profiler
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass  # started along with the client
+        else:
+            profiler.start()
+
+        return profiler
+
+    def disable_profiling(self):
+        if self.dispatcher.profiler is not None:
+            self.dispatcher.profiler.stop()
+            self.dispatcher.profiler = None
+
+    @property
+    def guild_progress(self) -> Tuple[int, int]:
+        """How many of the guilds announced in READY have arrived, and how many were announced."""
+        return self.cache.guilds_loaded, self.cache.guilds_expected
+
+    def get_guild(self, guild_id: int) -> Optional[Guild]:
+        return self.cache.get_guild(guild_id)
+
+    async def send_message(
+        self,
+        channel_id: int,
+        content: Optional[str] = None,
+        *,
+        embed: Optional[Embed] = None,
+        buffered: Optional[bool] = None,
+    ):
+        """Sends a message to a channel.
+
+        With ``buffered`` (the default when ``coalesce_window`` is set), messages sent to the
+        same channel within that window are merged into one, see :class:`MessageCoalescer`.
+        """
+        if buffered is None:
+            buffered = self.coalesce_window is not None
+
+        if buffered:
+            return await self.http.send_buffered_message(
+                channel_id,
+                content=content,
+                embed=embed,
+                window=self.coalesce_window or 0.05,
+            )
+
+        return await self.http.send_message(channel_id, content=content, embed=embed)
+
     async def fetch_channel(self, channel_id: int):
         return Channel(await self.http.get_channel(channel_id))
 
@@ -39,27 +305,182 @@ class Client:
 
         return Guild(await self.http.get_guild(guild_id), self)
 
+    async def query_members(
+        self,
+        guild_id: int,
+        query: str = "",
+        *,
+        limit: int = 0,
+        user_ids: Optional[List[int]] = None,
+        presences: bool = False,
+        cache: bool = True,
+    ) -> AsyncIterator[Member]:
+        """Streams guild members over the gateway, see :meth:`Gateway.request_guild_members`.
+
+        Unlike :meth:`Guild.fetch_member` this doesn't touch the REST ratelimits.
+        """
+        async for payload in self.ws.request_guild_members(
+            guild_id,
+            query=query,
+            limit=limit,
+            user_ids=user_ids,
+            presences=presences,
+        ):
+            member = Member(payload, self)
+
+            if cache:
+                self.cache.add_member(guild_id, member)
+
+            yield member
+
+    async def chunk_guilds(
+        self, guild_ids: Iterable[int], *, cache: bool = True, concurrency: int = 10
+    ):
+        """Requests every member of several guilds at once.
+
+        Requests go out as fast as the gateway send queue allows, at most ``concurrency``
+        guilds are being received at any time.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def chunk(guild_id: int):
+            async with semaphore:
+                return [m async for m in self.query_members(guild_id, cache=cache)]
+
+        return await asyncio.gather(*(chunk(guild_id) for guild_id in guild_ids))
+
     async def register_app_command(self, command: InteractionCommand):
         await self.http.register_app_commands(command)
         self._slash_commands.append(command._to_json())
 
+    async def sync_commands(
+        self,
+        commands: Optional[List[InteractionCommand]] = None,
+        *,
+        guild_id: Optional[int] = None,
+        cache_path: Optional[str] = None,
+    ) -> bool:
+        """Makes the registered application commands match the given ones.
+
+        The desired commands are hashed and compared to the hash stored at ``cache_path``
+        for the same scope, global or ``guild_id``, by the last sync that overwrote them, and
+        if that doesn't match, to the commands Discord has. Only if something actually
+        changed are they replaced, with a single bulk overwrite.
+
+        Args:
+            commands (Optional[List[InteractionCommand]]): Defaults to every command added with :meth:`command`.
+            guild_id (Optional[int]): Sync the commands of this guild instead of the global ones.
+            cache_path (Optional[str]): Where to keep the hashes of the last synced commands, one per scope.
+
+        Returns:
+            bool: Whether the commands were overwritten.
+        """
+        if commands is None:
+            commands = list(self.router.commands.values())
+
+        desired = [command._to_json() for command in commands]
+        digest = command_hash(desired)
+        scope = "global" if guild_id is None else str(guild_id)
+
+        hashes: Dict[str, str] = {}
+        if cache_path is not None:
+            hashes = _read_command_hashes(cache_path)
+            if hashes.get(scope) == digest:
+                return False
+
+        remote = await self.http.get_app_commands(guild_id=guild_id)
+        changed = command_hash(remote) != digest
+
+        if changed:
+            await self.http.bulk_overwrite_app_commands(desired, guild_id=guild_id)
+
+            # only a confirmed overwrite is remembered, syncing other scopes keeps theirs
+            if cache_path is not None:
+                hashes[scope] = digest
+                _write_command_hashes(cache_path, hashes)
+
+        return changed
+
+    @property
+    def startup_timings(self) -> Dict[str, float]:
+        """Seconds from :meth:`start` until READY and until every guild arrived, once they did."""
+        timings = {}
+
+        if self.started_at is not None:
+            for phase, at in (
+                ("ready", self.cache.ready_at),
+                ("guilds_ready", self.cache.guilds_ready_at),
+            ):
+                if at is not None and at >= self.started_at:
+                    timings[phase] = at - self.started_at
+
+        return timings
+
+    def _startup_samples(self) -> Dict[Tuple[str, ...], float]:
+        return {(phase,): value for phase, value in self.startup_timings.items()}
+
+    async def _watch_loop_lag(self, interval: float = 1.0):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            before = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag = loop.time() - before - interval
+
     async def start(self):
-        await self.http.start()
+        self.started_at = time.monotonic()
+        self._lag_task = asyncio.create_task(self._watch_loop_lag())
+        resume = False
+
+        if self.snapshot_path is not None:
+            resume = load_snapshot(self, self.snapshot_path)
+
+        if self.metrics_port is not None:
+            await self.metrics.start_server(port=self.metrics_port)
+
+        if self.dispatcher.profiler is not None:
+            self.dispatcher.profiler.start()
+
+        await self.http.start(resume=resume)
 
     async def close(self):
-        await self.http._session.close()
-        await self.ws.ws.close()
+        """Shuts the client down gracefully.
 
-        api_commands = await self.http.get_app_commands()
+        The gateway is closed first so no new events come in, then running listeners get up
+        to ``shutdown_timeout`` seconds to finish and buffered messages are sent, before the
+        snapshot is written and the sessions are closed.
+        """
+        started = time.perf_counter()
 
-        for command in api_commands:
-            for cached_command in self._slash_commands:
-                if command["name"] != cached_command["name"]:
-                    await self.http.delete_app_command(command)
-                continue
+        # a 4000 close keeps the session alive so the next start can resume it
+        await self.ws.close(code=4000 if self.snapshot_path is not None else 1000)
 
-    def run(self):
-        try:
-            asyncio.run(self.start())
-        except (KeyboardInterrupt, RuntimeError):
-            asyncio.run(self.close())
+        cancelled = await self.dispatcher.drain(self.shutdown_timeout)
+        if cancelled:
+            _log.warning("Cancelled %d listeners still running at shutdown", cancelled)
+
+        await self.http.close()
+        await self.assets.close()
+        await self.metrics.stop_server()
+
+        if self.dispatcher.profiler is not None:
+            self.dispatcher.profiler.stop()
+
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+
+        if self.snapshot_path is not None:
+            save_snapshot(self, self.snapshot_path)
+
+        self.shutdown_seconds = time.perf_counter() - started
+        _log.info("Shut down in %.2fs", self.shutdown_seconds)
+
+    def run(self, *, use_uvloop: Optional[bool] = None, debug: bool = False):
+        """Runs the client until it's stopped with Ctrl+C or SIGTERM, then closes it.
+
+        Args:
+            use_uvloop (Optional[bool]): Whether to run on uvloop, by default whenever it's installed.
+            debug (bool): Whether to run the event loop in debug mode. Defaults to False.
+        """
+        run_loop(self.start, shutdown=self.close, use_uvloop=use_uvloop, debug=debug)
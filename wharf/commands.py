@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Dict, List, Optional, Tuple
+
+from .impl import (
+    Channel,
+    Interaction,
+    InteractionCommand,
+    InteractionOptionType,
+    Member,
+    User,
+)
+
+if TYPE_CHECKING:
+    from .client import Client
+
+__all__ = ("CommandRouter", "command_hash")
+
+_log = logging.getLogger(__name__)
+
+
+Handler = Callable[..., Coroutine[Any, Any, Any]]
+Converter = Callable[[Any, dict], Any]
+Path = Tuple[str, ...]
+
+SUBCOMMAND_TYPES = (
+    InteractionOptionType.sub_command.value,
+    InteractionOptionType.sub_command_group.value,
+)
+
+
+def _convert_user(value: str, resolved: dict) -> Any:
+    user = resolved.get("users", {}).get(value)
+    if user is None:
+        return value
+
+    member = resolved.get("members", {}).get(value)
+    if member is not None:
+        return Member({**member, "user": user})
+
+    return User(user)
+
+
+def _convert_channel(value: str, resolved: dict) -> Any:
+    channel = resolved.get("channels", {}).get(value)
+    return Channel(channel) if channel is not None else value
+
+
+def _convert_role(value: str, resolved: dict) -> Any:
+    return resolved.get("roles", {}).get(value, value)
+
+
+def _convert_mentionable(value: str, resolved: dict) -> Any:
+    if value in resolved.get("users", {}):
+        return _convert_user(value, resolved)
+
+    return _convert_role(value, resolved)
+
+
+def _convert_attachment(value: str, resolved: dict) -> Any:
+    return resolved.get("attachments", {}).get(value, value)
+
+
+CONVERTERS: Dict[int, Converter] = {
+    InteractionOptionType.string.value: lambda value, _: value,
+    InteractionOptionType.integer.value: lambda value, _: int(value),
+    InteractionOptionType.boolean.value: lambda value, _: bool(value),
+    InteractionOptionType.user.value: _convert_user,
+    InteractionOptionType.channel.value: _convert_channel,
+    InteractionOptionType.role.value: _convert_role,
+    InteractionOptionType.mentionable.value: _convert_mentionable,
+    InteractionOptionType.decimal.value: lambda value, _: float(value),
+    InteractionOptionType.attachment.value: _convert_attachment,
+}
+
+
+def _normalize_option(option: dict) -> dict:
+    normalized = {
+        "name": option["name"],
+        "description": option.get("description") or "",
+        "type": option["type"],
+        # discord leaves out required when it's false, and returns nothing for empty lists
+        "required": bool(option.get("required", False)),
+        "choices": option.get("choices") or [],
+        "options": [_normalize_option(o) for o in option.get("options") or ()],
+    }
+
+    if option["type"] in SUBCOMMAND_TYPES:
+        del normalized["required"]
+
+    return normalized
+
+
+def normalize_command(command: dict) -> dict:
+    """Strips a command payload down to the fields wharf sets, with Discord's defaults filled in.
+
+    This makes locally built commands and the ones returned by the API comparable.
+    """
+    return {
+        "name": command["name"],
+        "description": command.get("description") or "",
+        "type": command.get("type", 1),
+        "options": [_normalize_option(o) for o in command.get("options") or ()],
+    }
+
+
+def command_hash(commands: List[dict]) -> str:
+    """A stable hash of a set of command payloads, independent of their order."""
+    normalized = sorted(
+        (normalize_command(c) for c in commands), key=lambda c: (c["type"], c["name"])
+    )
+    raw = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class _Route:
+    __slots__ = ("handler", "converters")
+
+    def __init__(self, handler: Handler, command: InteractionCommand):
+        self.handler = handler
+        # compiled once, so routing an interaction is a dict lookup per option
+        self.converters: Dict[str, Converter] = {
+            option["name"]: CONVERTERS.get(
+                option["type"], CONVERTERS[InteractionOptionType.string.value]
+            )
+            for option in command.options
+        }
+
+    def convert(self, options: List[dict], resolved: dict) -> Dict[str, Any]:
+        converters = self.converters
+        # options the user left out are passed as None, so handlers don't need defaults
+        kwargs: Dict[str, Any] = dict.fromkeys(converters)
+
+        for option in options:
+            name = option["name"]
+            converter = converters.get(name)
+            value = option.get("value")
+            kwargs[name] = value if converter is None else converter(value, resolved)
+
+        return kwargs
+
+
+class CommandRouter:
+    """Sends application command interactions straight to the handler of that command.
+
+    Routes are keyed by the full command path, e.g. ``("admin", "users", "ban")`` for a
+    subcommand inside a group, so finding the handler is one dict lookup. Handlers are
+    called with the interaction and every option the user filled in as a keyword argument,
+    already converted to the type the option was declared with.
+    """
+
+    def __init__(self, bot: Client):
+        self.bot = bot
+        self.routes: Dict[Path, _Route] = {}
+        self.commands: Dict[str, InteractionCommand] = {}
+
+    def add(self, command: InteractionCommand, handler: Handler, *path: str):
+        """Routes a command, or one of its subcommands, to ``handler``.
+        Args:
+            command (InteractionCommand): The top level command.
+            handler (Handler): The coroutine function to call.
+            *path (str): Names of the group and/or subcommand inside ``command`` to route.
+        """
+        node = command
+        for name in path:
+            sub = node.get_subcommand(name)
+            if sub is None:
+                raise ValueError(f"{node.name!r} has no subcommand {name!r}")
+
+            node = sub
+
+        self.commands[command.name] = command
+        self.routes[(command.name, *path)] = _Route(handler, node)
+
+    def remove(self, *path: str):
+        self.routes.pop(path, None)
+
+    def route(self, payload: dict) -> Optional[Interaction]:
+        """Dispatcher parser for ``interaction_create``.
+
+        Returns the :class:`Interaction` handed to the handler when the command was routed,
+        which consumes the event, so ``interaction_create`` listeners don't see it.
+        """
+        # only application commands, components and autocomplete are left to listeners
+        if payload.get("type") != 2:
+            return
+
+        data = payload["data"]
+        path: Path = (data["name"],)
+        options: List[dict] = data.get("options", [])
+
+        while options and options[0]["type"] in SUBCOMMAND_TYPES:
+            path += (options[0]["name"],)
+            options = options[0].get("options", [])
+
+        route = self.routes.get(path)
+        if route is None:
+            return
+
+        interaction = Interaction(self.bot, payload)
+        kwargs = route.convert(options, data.get("resolved", {}))
+        # run like a listener, so it's timed, profiled, traced and drained on shutdown
+        self.bot.dispatcher.spawn(
+            "interaction_create", route.handler, (interaction,), kwargs
+        )
+        return interaction
@@ -2,10 +2,27 @@ from __future__ import annotations
 
 import asyncio
 import inspect
+import json
 import logging
-from typing import TYPE_CHECKING, Any, Callable, Coroutine, Dict, List, TypeVar
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
-from .impl import Interaction, Message
+from .impl import Deduplicator, EventBatcher, Interaction, Message, WaiterRegistry
+from .intents import Intents
+from .metrics import Metrics
+from .profiling import HandlerProfiler
+from .tracing import NOOP_SPAN, Tracer
 
 if TYPE_CHECKING:
     from .client import Client
@@ -15,21 +32,104 @@ EventT = TypeVar("EventT")
 T = TypeVar("T")
 Func = Callable[..., T]
 CoroFunc = Func[Coroutine[Any, Any, Any]]
+Middleware = Callable[[str, Any], bool]
+Parser = Callable[[Any], Any]
+
+MODES = ("model", "dict", "bytes")
 
 _log = logging.getLogger(__name__)
 
+_MISSING = object()
+
+
+def _encode_frame(event_name: str, data: Any) -> bytes:
+    # events that weren't received as is, like guilds_ready, get a payload shaped the same way
+    return json.dumps(
+        {"op": 0, "t": event_name.upper(), "s": None, "d": data}, separators=(",", ":")
+    ).encode()
+
 
 class Dispatcher:
-    def __init__(self, bot: Client):
+    """Runs the parsers, waiters and listeners of every event the gateway receives.
+
+    What a listener is called with depends on its mode, ``mode`` unless it was subscribed
+    with another one:
+
+    - ``"model"``: a model where there is one, like :class:`Message`, the payload otherwise.
+    - ``"dict"``: the payload's ``d`` as decoded, no model is built.
+    - ``"bytes"``: the whole payload, ``op``, ``t``, ``s`` and ``d``, as the JSON it was
+      received as, after inflating. Ready to forward without encoding it again.
+
+    Args:
+        bot (Client): The client events are dispatched for.
+        metrics (Optional[Metrics]): Where to record handler metrics.
+        tracer (Optional[Tracer]): Traces dispatches and listeners when enabled.
+        intents (Optional[Intents]): The intents identified with, to warn about listeners that will never run.
+        mode (str): How listeners are called by default. Defaults to "model".
+    """
+
+    def __init__(
+        self,
+        bot: Client,
+        *,
+        metrics: Optional[Metrics] = None,
+        tracer: Optional[Tracer] = None,
+        intents: Optional[Intents] = None,
+        mode: str = "model",
+    ):
+        if mode not in MODES:
+            raise ValueError(f"mode has to be one of {MODES}, not {mode!r}")
+
+        self.mode = mode
         self.events: Dict[str, List[CoroFunc]] = {}
+        self.batchers: Dict[str, List[EventBatcher]] = {}
+        self._modes: Dict[Tuple[str, CoroFunc], str] = {}
+        self.wants_frames = mode == "bytes"
+        self.waiters = WaiterRegistry()
+        self.deduplicator = Deduplicator()
+        self.middleware: List[Middleware] = [self.deduplicator]
+        self.parsers: Dict[str, Parser] = {}
         self.bot = bot
+        self.intents = intents
+
+        if intents is not None:
+            # nothing to deduplicate for events that never arrive
+            for event_name in list(self.deduplicator.keys):
+                if not intents.delivers(event_name):
+                    del self.deduplicator.keys[event_name]
+
+        self.profiler: Optional[HandlerProfiler] = None
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.pending_handlers = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._handler_duration = self.metrics.histogram(
+            "wharf_dispatcher_handler_duration_seconds",
+            "How long event listeners took to run.",
+            ("event",),
+        )
+        self.metrics.gauge(
+            "wharf_dispatcher_pending_handlers",
+            "Listener tasks that were started but haven't finished yet.",
+            func=lambda: self.pending_handlers,
+        )
+        self.metrics.gauge(
+            "wharf_dispatcher_waiters",
+            "Pending wait_for calls.",
+            func=lambda: len(self.waiters),
+        )
+        self.metrics.counter(
+            "wharf_dispatcher_duplicates_dropped_total",
+            "Events dropped because they were already dispatched.",
+            func=lambda: self.deduplicator.dropped,
+        )
 
     def filter_events(self, event_type: EventT, event_data=None):
         if event_type in ("message_create", "message_update"):
             if event_type == "message_update" and len(event_data) == 4:
                 return
 
-            return Message(event_data)
+            return Message(event_data, self.bot)
 
         elif event_type == "interaction_create":
             return Interaction(self.bot, event_data)
@@ -39,36 +139,311 @@ class Dispatcher:
 
         return event_data
 
-    def add_callback(self, event_name, func: CoroFunc):
+    def _check_intents(self, event_name: str):
+        if self.intents is not None and not self.intents.delivers(event_name):
+            _log.warning(
+                "Listening for %r, which the intents %r never deliver",
+                event_name,
+                self.intents,
+            )
+
+    def _set_mode(self, event_name: str, func: CoroFunc, mode: Optional[str]):
+        if mode is None or mode == self.mode:
+            self._modes.pop((event_name, func), None)
+        elif mode in MODES:
+            self._modes[(event_name, func)] = mode
+        else:
+            raise ValueError(f"mode has to be one of {MODES}, not {mode!r}")
+
+        self._update_wants_frames()
+
+    def _update_wants_frames(self):
+        # the gateway only keeps the received JSON around when somebody asked for it
+        self.wants_frames = (
+            self.mode == "bytes"
+            or "bytes" in self._modes.values()
+            or any(
+                batcher.mode == "bytes"
+                for batchers in self.batchers.values()
+                for batcher in batchers
+            )
+        )
+
+    def add_callback(self, event_name, func: CoroFunc, *, mode: Optional[str] = None):
         if event_name not in self.events:
             raise ValueError("Event not in any known events!")
 
+        self._set_mode(event_name, func, mode)
         self.events[event_name].append(func)
 
     def add_event(self, event_name: str):
         self.events[event_name] = []
 
-    def subscribe(self, event_name: str, func: CoroFunc):
+    def subscribe(self, event_name: str, func: CoroFunc, *, mode: Optional[str] = None):
+        """Makes ``func`` the only listener of an event.
+
+        Args:
+            event_name (str): The event, e.g. ``"message_create"``.
+            func (CoroFunc): The listener.
+            mode (Optional[str]): What it's called with, see :class:`Dispatcher`.
+        """
+        self._check_intents(event_name)
+
+        for old in self.events.get(event_name, ()):
+            self._modes.pop((event_name, old), None)
+
+        self._set_mode(event_name, func, mode)
         self.events[event_name] = [func]
 
         _log.info("Subscribed to %r", event_name)
 
+    def add_batch_listener(
+        self,
+        func: CoroFunc,
+        *event_names: str,
+        mode: str = "dict",
+        max_size: int = 100,
+        max_delay: Optional[float] = 0.05,
+    ) -> EventBatcher:
+        """Calls ``func`` with lists of ``(event_name, event)`` pairs instead of every event.
+
+        A list is passed once ``max_size`` events were collected or ``max_delay`` seconds
+        after the first of them, see :class:`EventBatcher`. Events are what a listener in
+        ``mode`` would be called with. Batches still collecting are flushed by :meth:`drain`.
+
+        Args:
+            func (CoroFunc): The listener.
+            event_names (str): The events to collect.
+            mode (str): What events are passed as, see :class:`Dispatcher`. Defaults to "dict".
+            max_size (int): The most events in a batch. Defaults to 100.
+            max_delay (Optional[float]): Seconds an event may wait for its batch to fill.
+        """
+        if mode not in MODES:
+            raise ValueError(f"mode has to be one of {MODES}, not {mode!r}")
+
+        label = ",".join(event_names)
+        batcher = EventBatcher(
+            lambda items: self.spawn(label, func, (items,)),
+            event_names,
+            mode=mode,
+            max_size=max_size,
+            max_delay=max_delay,
+        )
+
+        for event_name in batcher.events:
+            self._check_intents(event_name)
+            self.batchers.setdefault(event_name, []).append(batcher)
+
+        self._update_wants_frames()
+        return batcher
+
+    def remove_batch_listener(self, batcher: EventBatcher):
+        """Stops collecting events for a batch listener, flushing what it has."""
+        for event_name in batcher.events:
+            batchers = self.batchers.get(event_name, [])
+
+            if batcher in batchers:
+                batchers.remove(batcher)
+
+            if not batchers:
+                self.batchers.pop(event_name, None)
+
+        batcher.flush()
+        self._update_wants_frames()
+
+    def add_middleware(self, func: Middleware):
+        """Adds a hook that runs before an event is parsed or dispatched.
+
+        Middleware is called with the event name and the raw payload, returning ``False``
+        drops the event before any model, waiter or task is touched.
+        """
+        self.middleware.append(func)
+
+    def remove_middleware(self, func: Middleware):
+        self.middleware.remove(func)
+
+    def add_parser(self, event_name: str, func: Parser):
+        """Sets the internal state handler for an event.
+
+        Parsers run on the raw payload after middleware and before listeners, and keep running
+        even when nothing listens to the event. A parser that handles the event itself returns
+        the model it built for it: the event is then consumed, waiters are resolved with that
+        model and listeners and batch listeners don't see it.
+        """
+        self.parsers[event_name] = func
+
     def get_event(self, event_name: str):
         return self.events.get(event_name)
 
-    def dispatch(self, event_name: str, *args, **kwargs):
-        if not self.get_event(event_name):
+    def wants(self, event_name: str) -> bool:
+        """Whether anything is parsing, listening or waiting for this event."""
+        return (
+            event_name in self.parsers
+            or bool(self.events.get(event_name))
+            or event_name in self.batchers
+            or self.waiters.has_waiters(event_name)
+        )
+
+    def dispatch(self, event_name: str, *args, frame: Optional[bytes] = None):
+        """Dispatches an event.
+
+        Args:
+            event_name (str): The lowercased event name.
+            frame (Optional[bytes]): The payload as received, for listeners in "bytes" mode.
+        """
+        if not self.wants(event_name):
             raise ValueError("Event not in any events known :(")
 
+        raw = args[0] if args else None
+
+        if not self.tracer.enabled:
+            return self._dispatch(event_name, raw, args, frame)
+
+        attributes = {"event": event_name}
+        if event_name == "interaction_create":
+            attributes["interaction_id"] = raw.get("id")
+
+        # listener tasks copy the context, so their spans become children of this one
+        with self.tracer.span(f"dispatch {event_name}", **attributes):
+            self._dispatch(event_name, raw, args, frame)
+
+    def _dispatch(self, event_name: str, raw: Any, args: tuple, frame: Optional[bytes]):
+        for middleware in self.middleware:
+            if not middleware(event_name, raw):
+                return
+
+        parser = self.parsers.get(event_name)
+        if parser is not None:
+            model = parser(raw)
+
+            if model is not None:
+                if self.waiters.has_waiters(event_name):
+                    self.waiters.resolve(event_name, raw, model)
+
+                return
+
         event = self.events.get(event_name)
+        batchers = self.batchers.get(event_name)
+        has_waiters = self.waiters.has_waiters(event_name)
+
+        if not event and not batchers and not has_waiters:
+            return
+
+        # models are only built if a waiter or a "model" listener needs one
+        data: Any = _MISSING
+
+        if has_waiters:
+            data = self.filter_events(event_name, *args)
 
-        data = self.filter_events(event_name, *args)
+            if data is None:
+                self.waiters.resolve(event_name, raw)
+            else:
+                self.waiters.resolve(event_name, raw, data)
 
-        if event is not None:
+        if event:
             for callback in event:
-                if data is None:
-                    asyncio.create_task(callback())
+                mode = self._modes.get((event_name, callback), self.mode)
+
+                if mode == "model":
+                    if data is _MISSING:
+                        data = self.filter_events(event_name, *args)
+
+                    callback_args = () if data is None else (data,)
+                elif mode == "dict":
+                    callback_args = (raw,)
+                else:
+                    if frame is None:
+                        frame = _encode_frame(event_name, raw)
+
+                    callback_args = (frame,)
+
+                self.spawn(event_name, callback, callback_args)
+
+        if batchers:
+            for batcher in batchers:
+                if batcher.mode == "dict":
+                    batcher.add((event_name, raw))
+                elif batcher.mode == "bytes":
+                    if frame is None:
+                        frame = _encode_frame(event_name, raw)
+
+                    batcher.add((event_name, frame))
                 else:
-                    asyncio.create_task(callback(data))
+                    if data is _MISSING:
+                        data = self.filter_events(event_name, *args)
+
+                    batcher.add((event_name, data))
+
+    def spawn(
+        self,
+        event_name: str,
+        callback: CoroFunc,
+        args: tuple = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        """Runs ``callback(*args, **kwargs)`` in a task the way listeners are run.
+
+        It's timed, profiled and traced like a listener of ``event_name``, and waited for
+        by :meth:`drain`.
+        """
+        name = getattr(callback, "__qualname__", repr(callback))
+        task = asyncio.create_task(
+            self._run_handler(event_name, callback, args, kwargs or {}),
+            name=f"wharf listener {name} for {event_name!r}",
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+
+        if not task.cancelled() and task.exception() is not None:
+            _log.error("%s raised", task.get_name(), exc_info=task.exception())
+
+    async def drain(self, timeout: Optional[float] = None) -> int:
+        """Waits for running listeners to finish, cancelling those still running after ``timeout``.
 
-            _log.info("Dispatched event %r", event_name)
+        Batch listeners are handed what they collected so far first. Returns how many
+        listeners had to be cancelled.
+        """
+        for batchers in self.batchers.values():
+            for batcher in batchers:
+                batcher.flush()
+
+        if not self._tasks:
+            return 0
+
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+
+        for task in pending:
+            task.cancel()
+
+        if pending:
+            await asyncio.wait(pending)
+
+        return len(pending)
+
+    async def _run_handler(
+        self,
+        event_name: str,
+        callback: CoroFunc,
+        args: tuple,
+        kwargs: Dict[str, Any],
+    ):
+        self.pending_handlers += 1
+        start = time.perf_counter()
+        span = (
+            self.tracer.span(f"listener {callback.__qualname__}", event=event_name)
+            if self.tracer.enabled
+            else NOOP_SPAN
+        )
+
+        try:
+            with span:
+                if self.profiler is None:
+                    await callback(*args, **kwargs)
+                else:
+                    await self.profiler.run(event_name, callback, args, kwargs)
+        finally:
+            self.pending_handlers -= 1
+            self._handler_duration.observe(time.perf_counter() - start, event_name)
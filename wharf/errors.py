@@ -1,7 +1,10 @@
-from typing import Optional, Union
+from __future__ import annotations
 
-import discord_typings as dt
-from aiohttp import ClientResponse
+from typing import TYPE_CHECKING, Optional, Union
+
+if TYPE_CHECKING:
+    import discord_typings as dt
+    from aiohttp import ClientResponse
 
 
 class BaseException(Exception):
@@ -1,25 +1,32 @@
 from __future__ import annotations
 
 import asyncio
-import datetime
-import json
 import logging
 import random
-import traceback
-import zlib
+import time
 from sys import platform as _os
-from typing import TYPE_CHECKING, Any, Optional, Union
-
-from aiohttp import ClientSession, ClientWebSocketResponse, WSMsgType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Union,
+)
+
+from aiohttp import ClientError, ClientSession, ClientWebSocketResponse, WSMsgType
 
 from .dispatcher import Dispatcher
 from .errors import WebsocketClosed
+from .impl import GatewaySendQueue, MemberChunkRequest, PayloadDecoder
+from .metrics import FAST_BUCKETS
 
 if TYPE_CHECKING:
     from .http import HTTPClient
 
 
-logging.basicConfig(level=logging.INFO)
 _log = logging.getLogger(__name__)
 
 
@@ -37,35 +44,144 @@ class OPCodes:
     heartbeat_ack = 11
 
 
+class _Reconnect(Exception):
+    """Internal control flow for leaving the receive loop of a connection."""
+
+    def __init__(self, *, resume: bool, delay: float = 0.0):
+        self.resume = resume
+        self.delay = delay
+
+
+# Close codes after which reconnecting is pointless, mostly misconfiguration.
+FATAL_CLOSE_CODES = {4004, 4010, 4011, 4012, 4013, 4014}
+# Close codes after which the session can't be resumed and a fresh IDENTIFY is needed.
+NON_RESUMABLE_CLOSE_CODES = {4007, 4009}
+
+
 class Gateway:
     if TYPE_CHECKING:
         heartbeat_interval: int
 
+    ZLIB_SUFFIX = b"\x00\x00\xff\xff"
+
     def __init__(self, dispatcher: Dispatcher, http: HTTPClient):
         self.http = http
         self.token = self.http._token
         self.intents = self.http._intents
         self.api_version = 10
         self.gw_url: str = f"wss://gateway.discord.gg/?v={self.api_version}&encoding=json&compress=zlib-stream"
+        self.resume_gateway_url: Optional[str] = None
+        self.session_id: Optional[str] = None
         self._last_sequence: Optional[int] = None
-        self._first_heartbeat = True
         self.dispatcher = dispatcher
-        self._decompresser = zlib.decompressobj()
-        self.loop = asyncio.get_event_loop()
+        self.decoder = PayloadDecoder()
+        self._buffer = bytearray()
         self.session: Optional[ClientSession] = None
         self.ws: Optional[ClientWebSocketResponse] = None
+        self._closing = False
+
+        self.send_queue = GatewaySendQueue()
+        self._send_task: Optional[asyncio.Task] = None
+        self._close_task: Optional[asyncio.Task] = None
+        self._chunk_requests: Dict[str, MemberChunkRequest] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._last_heartbeat_send: Optional[float] = None
+        self._last_heartbeat_ack: Optional[float] = None
+        self._ack_pending = False
+        self.latency: float = float("inf")
+        """Seconds between the last heartbeat and its ACK, ``inf`` until the first ACK."""
+
+        self.max_backoff = 60.0
+        self._backoff_attempt = 0
+
+        self.identify_count = 0
+        self.resume_count = 0
+        self.failed_resume_count = 0
+        self.reconnect_count = 0
+
+        self._register_metrics()
+
+    def _register_metrics(self):
+        metrics = self.http.metrics
+
+        self._events_received = metrics.counter(
+            "wharf_gateway_events_total", "Dispatches received, by event.", ("event",)
+        )
+        self._bytes_received = metrics.counter(
+            "wharf_gateway_received_bytes_total",
+            "Bytes received over the gateway, before inflating.",
+        )
+        self._decode_time = metrics.histogram(
+            "wharf_gateway_decode_seconds",
+            "Time spent inflating and parsing a payload.",
+            buckets=FAST_BUCKETS,
+        )
+        metrics.counter(
+            "wharf_gateway_offloaded_decodes_total",
+            "Payloads big enough to be decoded off the event loop.",
+            func=lambda: self.decoder.offloaded,
+        )
+        metrics.gauge(
+            "wharf_gateway_heartbeat_latency_seconds",
+            "Time between the last heartbeat and its ACK.",
+            func=lambda: self.latency,
+        )
+        metrics.gauge(
+            "wharf_gateway_send_queue_depth",
+            "Commands waiting for the gateway ratelimit.",
+            func=lambda: self.send_queue.depth,
+        )
+        metrics.counter(
+            "wharf_gateway_commands_coalesced_total",
+            "Queued commands replaced by a newer command with the same key.",
+            func=lambda: self.send_queue.coalesced,
+        )
+
+        for name, attr, help in (
+            ("identifies", "identify_count", "Sessions started with IDENTIFY."),
+            ("resumes", "resume_count", "Sessions continued with RESUME."),
+            ("failed_resumes", "failed_resume_count", "RESUMEs that were rejected."),
+            ("reconnects", "reconnect_count", "Times the connection was reopened."),
+        ):
+            metrics.counter(
+                f"wharf_gateway_{name}_total",
+                help,
+                func=lambda attr=attr: getattr(self, attr),
+            )
+
+    def _frame_complete(self, msg: bytes) -> bool:
+        self._buffer.extend(msg)
+
+        # zlib-stream frames can be split up, only inflate once the flush suffix arrives,
+        # which itself may be split across the last two messages
+        return len(self._buffer) >= 4 and self._buffer[-4:] == self.ZLIB_SUFFIX
+
+    @property
+    def can_resume(self) -> bool:
+        return self.session_id is not None and self._last_sequence is not None
 
-    def _decompress_msg(self, msg: Union[str, bytes]):
-        ZLIB_SUFFIX = b"\x00\x00\xff\xff"
+    @property
+    def resume_ratio(self) -> float:
+        """How many of the session starts so far were resumes rather than identifies."""
+        total = self.identify_count + self.resume_count
+        return self.resume_count / total if total else 0.0
+
+    def _url_for(self, resume: bool) -> str:
+        if resume and self.resume_gateway_url is not None:
+            query = self.gw_url.partition("?")[2]
+            return f"{self.resume_gateway_url.rstrip('/')}/?{query}"
 
-        # Message should be compressed
-        if len(msg) < 4 or msg[-4:] != ZLIB_SUFFIX:
-            out_str: str = ""
+        return self.gw_url
 
-            return out_str
+    def _reset_session(self):
+        self.session_id = None
+        self.resume_gateway_url = None
+        self._last_sequence = None
 
-        buff = self._decompresser.decompress(msg)
-        return buff.decode("utf-8")
+    def _next_backoff(self) -> float:
+        self._backoff_attempt += 1
+        delay = min(self.max_backoff, 2 ** (self._backoff_attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
 
     @property
     def identify_payload(self):
@@ -94,19 +210,76 @@ class Gateway:
     def ping_payload(self):
         return {"op": OPCodes.heartbeat, "d": self._last_sequence}
 
-    async def keep_heartbeat(self):
-        jitters = self.heartbeat_interval
-        if self._first_heartbeat:
-            jitters *= random.uniform(1.0, 0.0)
-            self._first_heartbeat = False
+    async def keep_heartbeat(self, ws: ClientWebSocketResponse):
+        interval = self.heartbeat_interval / 1000
+
+        # the first heartbeat is jittered so a fleet of clients doesn't beat in lockstep
+        await asyncio.sleep(interval * random.random())
 
-        await self.ws.send_json(self.ping_payload)
-        await asyncio.sleep(jitters / 1000)
-        asyncio.create_task(self.keep_heartbeat())
+        while not ws.closed:
+            if self._ack_pending:
+                _log.warning(
+                    "No heartbeat ACK received in %.2fs, closing zombie connection",
+                    interval,
+                )
+                # a non 1000 close code keeps the session, so the receive loop resumes
+                await ws.close(code=4000)
+                return
 
-    async def send(self, data: dict):
-        await self.ws.send_json(data)
-        _log.info("Sent json to the gateway successfully")
+            await self._send_heartbeat(ws)
+            await asyncio.sleep(interval)
+
+    async def _send_heartbeat(self, ws: ClientWebSocketResponse):
+        self._ack_pending = True
+        self._last_heartbeat_send = time.perf_counter()
+        await self.send_queue.send_priority(ws, self.ping_payload)
+
+    def _start_heartbeat(self):
+        self._stop_heartbeat()
+        self._ack_pending = False
+        self._heartbeat_task = asyncio.create_task(self.keep_heartbeat(self.ws))  # type: ignore
+
+    def _stop_heartbeat(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    @property
+    def queue_depth(self) -> int:
+        """How many commands are waiting for the gateway ratelimit."""
+        return self.send_queue.depth
+
+    async def send(self, data: dict, *, key: Optional[Hashable] = None):
+        """Queues a command and waits until it was sent.
+        Args:
+            data (dict): The payload to send.
+            key (Optional[Hashable]): Pending commands with the same key are replaced instead of sent twice.
+        """
+        await self.send_queue.put(data, key=key)
+
+    def _start_sending(self):
+        self._stop_sending()
+
+        ws = self.ws
+        self._send_task = asyncio.create_task(self.send_queue.run(ws))  # type: ignore
+        self._send_task.add_done_callback(lambda task: self._sending_done(ws, task))
+
+    def _sending_done(self, ws: ClientWebSocketResponse, task: asyncio.Task):
+        if task.cancelled() or task.exception() is None:
+            return
+
+        _log.warning(
+            "Sending to the gateway failed (%r), reconnecting", task.exception()
+        )
+
+        if not ws.closed:
+            # like a zombie connection, a non 1000 close makes the receive loop resume
+            self._close_task = asyncio.create_task(ws.close(code=4000))
+
+    def _stop_sending(self):
+        if self._send_task is not None:
+            self._send_task.cancel()
+            self._send_task = None
 
     async def _change_precense(self, *, status: str):
         activities = []  # Placeholder whilst i do more testing with presences uwu
@@ -121,71 +294,240 @@ class Gateway:
             },
         }
 
-        await self.ws.send_json(payload)
+        await self.send(payload, key=OPCodes.presence_update)
+
+    async def request_guild_members(
+        self,
+        guild_id: int,
+        *,
+        query: str = "",
+        limit: int = 0,
+        user_ids: Optional[List[int]] = None,
+        presences: bool = False,
+        timeout: float = 30.0,
+    ) -> AsyncIterator[dict]:
+        """Requests members over the gateway, yielding raw member payloads as chunks arrive.
+
+        An empty query with a limit of 0 requests every member, which needs the GUILD_MEMBERS intent.
+
+        Args:
+            guild_id (int): The guild to request members from.
+            query (str): Only return members whose username starts with this.
+            limit (int): The most members to return, 0 for no limit.
+            user_ids (Optional[List[int]]): Request these members instead of running a query.
+            presences (bool): Whether presences should be sent along, needs GUILD_PRESENCES.
+            timeout (float): Seconds to wait for each chunk.
+        """
+        request = MemberChunkRequest(guild_id, timeout=timeout)
+
+        payload: Dict[str, Any] = {
+            "guild_id": str(guild_id),
+            "presences": presences,
+            "nonce": request.nonce,
+        }
+
+        if user_ids is not None:
+            payload["user_ids"] = [str(user_id) for user_id in user_ids]
+        else:
+            payload["query"] = query
+            payload["limit"] = limit
+
+        self._chunk_requests[request.nonce] = request
+
+        try:
+            await self.send({"op": OPCodes.request_guild_members, "d": payload})
+
+            async for member in request:
+                yield member
+        finally:
+            self._chunk_requests.pop(request.nonce, None)
+
+    async def close(self, *, code: int = 1000):
+        """Closes the connection for good.
+        Args:
+            code (int): The close code. Anything but 1000/1001 keeps the session resumable.
+        """
+        self._closing = True
+        self._stop_heartbeat()
+        self._stop_sending()
+        self.send_queue.clear()
+
+        if self.ws is not None and not self.ws.closed:
+            await self.ws.close(code=code)
+
+        if self.session is not None:
+            await self.session.close()
+
+        self.decoder.close()
 
     async def connect(self, *, reconnect: bool = False):
         if not self.session:
             self.session = ClientSession()
 
-        self.ws = await self.session.ws_connect(self.gw_url)
+        self._closing = False
+        resume = reconnect and self.can_resume
+
+        while not self._closing:
+            delay = 0.0
+
+            try:
+                await self._connect_once(resume=resume)
+            except _Reconnect as exc:
+                resume = exc.resume and self.can_resume
+                delay = exc.delay
+            except (ClientError, asyncio.TimeoutError) as exc:
+                resume = self.can_resume
+                delay = self._next_backoff()
+                _log.warning(
+                    "Lost connection to the gateway (%r), retrying in %.2fs", exc, delay
+                )
+            else:
+                # the receive loop only returns once we closed the socket ourselves
+                return
+
+            if self._closing:
+                return
+
+            if not resume:
+                self._reset_session()
+
+            self.reconnect_count += 1
+
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def _connect_once(self, *, resume: bool):
+        self.decoder.reset()
+        self._buffer.clear()
+        self.send_queue.limiter.reset()
+
+        self.ws = await self.session.ws_connect(self._url_for(resume))  # type: ignore
+
+        try:
+            await self._receive_loop(resume=resume)
+        finally:
+            self._stop_heartbeat()
+            self._stop_sending()
+
+            if not self.ws.closed:
+                # anything other than 1000/1001 keeps the session alive for a resume
+                await self.ws.close(code=4000)
 
+    async def _decode(self, raw: Union[bytes, bytearray, str], *, compressed: bool):
+        if self.dispatcher.wants_frames:
+            return await self.decoder.decode_frame(raw, compressed=compressed)
+
+        return await self.decoder.decode(raw, compressed=compressed), None
+
+    async def _receive_loop(self, *, resume: bool):
         while True:
+            msg = await self.ws.receive()  # type: ignore
+
+            if msg.type is WSMsgType.BINARY:
+                start = time.perf_counter()
+                self._bytes_received.inc(amount=len(msg.data))
+
+                if not self._frame_complete(msg.data):
+                    continue
+
+                data, frame = await self._decode(self._buffer, compressed=True)
+                self._buffer.clear()
+            elif msg.type is WSMsgType.TEXT:
+                start = time.perf_counter()
+                self._bytes_received.inc(amount=len(msg.data))
+                data, frame = await self._decode(msg.data, compressed=False)
+            elif msg.type in (WSMsgType.CLOSE, WSMsgType.CLOSING, WSMsgType.CLOSED):
+                if self._closing:
+                    return
 
-            msg = await self.ws.receive()
+                code = msg.data if msg.type is WSMsgType.CLOSE else self.ws.close_code  # type: ignore
+                self._handle_close(code, msg.extra)
+            else:
+                raise _Reconnect(resume=True, delay=self._next_backoff())
 
-            if msg.type in (WSMsgType.BINARY, WSMsgType.TEXT):
-                data: Union[Any, str] = None
-                if msg.type == WSMsgType.BINARY:
-                    data = self._decompress_msg(msg.data)
-                elif msg.type == WSMsgType.TEXT:
-                    data = msg.data
+            self._decode_time.observe(time.perf_counter() - start)
 
-                data = json.loads(data)
+            await self._handle_payload(data, resume=resume, frame=frame)
 
+    def _handle_close(self, code: Optional[int], reason: Any):
+        if code in FATAL_CLOSE_CODES:
+            raise WebsocketClosed(code, reason)  # type: ignore
+
+        _log.info("Gateway closed with code %s, reconnecting", code)
+        raise _Reconnect(
+            resume=code not in NON_RESUMABLE_CLOSE_CODES, delay=self._next_backoff()
+        )
+
+    async def _handle_payload(
+        self, data: dict, *, resume: bool, frame: Optional[bytes] = None
+    ):
+        op = data["op"]
+
+        if data.get("s") is not None:
             self._last_sequence = data["s"]
 
-            _log.info(data["op"])
+        if op == OPCodes.dispatch:
+            event_name: str = data["t"]
 
-            if data["op"] == OPCodes.hello:
-                self.heartbeat_interval = data["d"]["heartbeat_interval"]
+            if event_name == "READY":
+                self.session_id = data["d"]["session_id"]
+                self.resume_gateway_url = data["d"].get("resume_gateway_url")
+                self._backoff_attempt = 0
+                self._start_sending()
 
-                if reconnect:
-                    await self.send(self.resume_payload)
-                else:
-                    await self.send(self.identify_payload)
+            elif event_name == "RESUMED":
+                self._backoff_attempt = 0
+                self._start_sending()
+                _log.info("Resumed session %s", self.session_id)
 
-                asyncio.create_task(self.keep_heartbeat())
+            elif event_name == "GUILD_MEMBERS_CHUNK":
+                request = self._chunk_requests.get(data["d"].get("nonce"))
+                if request is not None:
+                    request.feed(data["d"])
 
-            if data["op"] == OPCodes.heartbeat:
-                await self.send(self.ping_payload)
+            event_name = event_name.lower()
+            self._events_received.inc(event_name)
 
-            if data["op"] == OPCodes.dispatch:
+            if self.dispatcher.wants(event_name):
+                self.dispatcher.dispatch(event_name, data["d"], frame=frame)
 
-                if data["t"] == "READY":
-                    self.session_id = data["d"]["session_id"]
+        elif op == OPCodes.hello:
+            self.heartbeat_interval = data["d"]["heartbeat_interval"]
 
-                event_data = data["d"]
+            if resume and self.can_resume:
+                self.resume_count += 1
+                await self.send_queue.send_priority(self.ws, self.resume_payload)  # type: ignore
+            else:
+                self.identify_count += 1
+                await self.send_queue.send_priority(self.ws, self.identify_payload)  # type: ignore
 
-                if data["t"].lower() not in self.dispatcher.events.keys():
-                    continue
+            self._start_heartbeat()
+
+        elif op == OPCodes.heartbeat:
+            await self._send_heartbeat(self.ws)  # type: ignore
+
+        elif op == OPCodes.heartbeat_ack:
+            self._last_heartbeat_ack = time.perf_counter()
+            self._ack_pending = False
 
-                self.dispatcher.dispatch(data["t"].lower(), event_data)
+            if self._last_heartbeat_send is not None:
+                self.latency = self._last_heartbeat_ack - self._last_heartbeat_send
 
-            if data["op"] == OPCodes.heartbeat_ack:
-                self._last_heartbeat_ack = datetime.datetime.now()
+        elif op == OPCodes.reconnect:
+            _log.info("Gateway asked us to reconnect")
+            raise _Reconnect(resume=True)
 
-            if data["op"] == OPCodes.reconnect:
-                _log.info("reconnected!!")
-                await self.ws.close(code=4001)
-                await self.connect(reconnect=True)
+        elif op == OPCodes.invalid_session:
+            resumable = bool(data["d"])
 
-            if data["op"] == OPCodes.invalid_session:
-                await self.ws.close(code=4001)
-                _log.info("invalid?")
-                break
+            if resume and not resumable:
+                self.failed_resume_count += 1
 
-            elif msg.type == WSMsgType.CLOSE:
-                raise WebsocketClosed(msg.data, msg.extra)
+            _log.info("Session invalidated (resumable=%s)", resumable)
+            # discord wants a random 1-5 second wait before identifying again
+            raise _Reconnect(
+                resume=resumable, delay=0.0 if resumable else random.uniform(1, 5)
+            )
 
     @property
     def is_closed(self):
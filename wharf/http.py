@@ -2,6 +2,7 @@ import asyncio
 import json
 import logging
 import sys
+import time
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, Any, List, Optional, Union
 from urllib.parse import quote as urlquote
@@ -13,8 +14,11 @@ from .dispatcher import Dispatcher
 from .errors import BucketMigrated, HTTPException
 from .file import File
 from .gateway import Gateway
-from .impl import Embed, InteractionCommand
-from .impl.ratelimit import Ratelimiter
+from .impl import Embed, InteractionCommand, MessageCoalescer
+from .impl.ratelimit import Bucket, Ratelimiter
+from .metrics import Metrics
+from .runner import run as run_loop
+from .tracing import NOOP_SPAN, Tracer
 
 _log = logging.getLogger(__name__)
 
@@ -23,6 +27,11 @@ __all__ = ("Route",)
 
 BASE_API_URL = "https://discord.com/api/v10"
 
+# Discord drops interactions that weren't responded to within this many seconds.
+INTERACTION_DEADLINE = 3.0
+# Interaction tokens stay valid for followups for this long.
+INTERACTION_TOKEN_LIFETIME = 15 * 60
+
 
 @dataclass
 class PreparedData:
@@ -67,28 +76,142 @@ class Route:
 
         return f"{self.method}:{self.url.format_map(top_level_params | other_params)}"
 
+    @property
+    def template(self) -> str:
+        """The url with ids and tokens taken out, for labelling metrics."""
+        parts = self.url.split("/")
+
+        for i, part in enumerate(parts):
+            if part.isdigit():
+                parts[i] = "{id}"
+            elif i > 1 and parts[i - 2] in ("webhooks", "interactions"):
+                parts[i] = "{token}"
+            elif i > 0 and parts[i - 1] == "reactions":
+                parts[i] = "{emoji}"
+
+        return "/".join(parts)
+
+    @property
+    def major_parameters(self) -> str:
+        """The top level parameters Discord scopes a shared bucket hash to."""
+        return "-".join(
+            str(getattr(self, k))
+            for k in ("guild_id", "channel_id", "webhook_id", "webhook_token")
+            if getattr(self, k) is not None
+        )
+
+
+class _InteractionState:
+    __slots__ = (
+        "id",
+        "application_id",
+        "token",
+        "type",
+        "received_at",
+        "acknowledged",
+        "deferred",
+        "timer",
+        "defer_task",
+    )
+
+    def __init__(self, payload: dict, received_at: float):
+        self.id: str = payload["id"]
+        self.application_id: Optional[str] = payload.get("application_id")
+        self.token: str = payload["token"]
+        self.type: Optional[int] = payload.get("type")
+        self.received_at = received_at
+        self.acknowledged = False
+        self.deferred = False
+        self.timer: Optional[asyncio.TimerHandle] = None
+        # the deferred response while it's being sent, responses wait for it
+        self.defer_task: Optional[asyncio.Task] = None
+
+
+def _bucket_attributes(template: str, bucket: Bucket) -> dict:
+    # Route.bucket holds webhook and interaction tokens, spans only get the template and hash
+    attributes = {"route": template}
+
+    if bucket.bucket is not None:
+        attributes["bucket"] = bucket.bucket
+
+    return attributes
+
 
 class HTTPClient:
-    def __init__(self, *, dispatcher: Dispatcher, token: str, intents: int):
+    def __init__(
+        self,
+        *,
+        dispatcher: Optional[Dispatcher] = None,
+        token: Optional[str] = None,
+        intents: int = 0,
+        api_url: str = BASE_API_URL,
+        trace_configs: Optional[List[aiohttp.TraceConfig]] = None,
+        metrics: Optional[Metrics] = None,
+        tracer: Optional[Tracer] = None,
+    ):
         self._intents = intents
+        self.api_url = api_url
+        self.trace_configs = trace_configs
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.tracer = tracer if tracer is not None else Tracer()
         self._token = token
         self.__session: aiohttp.ClientSession = None  # type: ignore
-        self._gateway = Gateway(dispatcher, self)
+        self._gateway = Gateway(dispatcher, self)  # type: ignore
         self.base_headers = {"Authorization": f"Bot {self._token}"}
         self.user_agent = "DiscordBot (https://github.com/sawshadev/wharf, {0}) Python/{1.major}.{1.minor}.{1.micro}".format(
             __version__, sys.version_info
         )
-        self.loop = asyncio.get_event_loop()
         self.ratelimiter = Ratelimiter()
         self.req_id = 0
+        self.application_id: Optional[str] = None
+        self._inline_responses: dict[str, asyncio.Future] = {}
+        self._interactions: dict[str, _InteractionState] = {}
+        self._channel_buffers: dict[int, MessageCoalescer] = {}
+        self.interaction_auto_defers = 0
+        self.interaction_deadline_misses = 0
+
+        self.default_headers: dict[str, str] = (
+            {"Authorization": f"Bot {self._token}"} if self._token is not None else {}
+        )
 
-        self.default_headers: dict[str, str] = {"Authorization": f"Bot {self._token}"}
+        self._requests = self.metrics.counter(
+            "wharf_http_requests_total",
+            "REST requests sent, by route and response status.",
+            ("method", "route", "status"),
+        )
+        self._request_duration = self.metrics.histogram(
+            "wharf_http_request_duration_seconds",
+            "Time between sending a request and its response.",
+            ("method", "route"),
+        )
+        self._ratelimit_wait = self.metrics.histogram(
+            "wharf_http_ratelimit_wait_seconds",
+            "Time a request spent waiting on ratelimits.",
+            ("route",),
+        )
+        self._ratelimited = self.metrics.counter(
+            "wharf_http_ratelimited_total",
+            "429 responses, by route and scope.",
+            ("route", "scope"),
+        )
+        self.metrics.counter(
+            "wharf_interaction_auto_defers_total",
+            "Interactions deferred because nothing responded in time.",
+            func=lambda: self.interaction_auto_defers,
+        )
+        self.metrics.counter(
+            "wharf_interaction_deadline_misses_total",
+            "Interactions responded to after Discord's deadline.",
+            func=lambda: self.interaction_deadline_misses,
+        )
 
     @property
     def _session(self):
         if self.__session is None or self.__session.closed:
             self.__session = aiohttp.ClientSession(
-                headers={"User-Agent": self.user_agent}, json_serialize=json.dumps
+                headers={"User-Agent": self.user_agent},
+                json_serialize=json.dumps,
+                trace_configs=self.trace_configs,
             )
 
         return self.__session
@@ -103,7 +226,9 @@ class HTTPClient:
     def _prepare_data(data: Optional[dict[str, Any]], files: Optional[File]):
         pd = PreparedData()
 
-        if data is not None and files is None:
+        if isinstance(data, list):
+            pd.json = data  # type: ignore
+        elif data is not None and files is None:
             pd.json = _filter_dict(data)
 
         if data is not None and files is not None:
@@ -127,16 +252,21 @@ class HTTPClient:
         json_params: dict = None,
         files: Optional[List[File]] = None,
         reason: Optional[str] = None,
+        auth: bool = True,
         **kwargs,
     ):
+        """Makes a request to the Discord REST API.
+
+        Requests with ``auth`` off are sent without the bot token and don't count against the
+        global ratelimit, which is what webhook and interaction token routes want.
+        """
         self.req_id += 1
 
         query_params = query_params or {}
-        max_tries = 5
 
         kwargs = kwargs or {}
 
-        headers: dict[str, str] = self.default_headers
+        headers: dict[str, str] = dict(self.default_headers) if auth else {}
 
         if reason:
             headers["X-Audit-Log-Reason"] = urlquote(reason, safe="/ ")
@@ -149,112 +279,440 @@ class HTTPClient:
         if data.multipart_content is not None:
             kwargs["data"] = data.multipart_content
 
+        with self.tracer.span(
+            "http.request", method=route.method, route=route.template
+        ):
+            return await self._send(route, headers, query_params, kwargs, auth=auth)
+
+    async def _send(
+        self,
+        route: Route,
+        headers: dict[str, str],
+        query_params: dict[str, Any],
+        kwargs: dict[str, Any],
+        *,
+        auth: bool,
+    ):
         bucket = self.ratelimiter.get_bucket(route.bucket)
 
+        template = route.template
+        max_tries = 5
+        retry_reason = None
+
         for tries in range(max_tries):
-            async with self.ratelimiter.global_bucket:
-                async with bucket:
+            # attempts after the first are traced as retries, with their own wait and send
+            retry = (
+                self.tracer.span("http.retry", attempt=tries, reason=retry_reason)
+                if tries
+                else NOOP_SPAN
+            )
+
+            with retry:
+                wait_start = time.perf_counter()
+
+                with self.tracer.span(
+                    "ratelimit.wait", **_bucket_attributes(template, bucket)
+                ):
+                    if auth:
+                        await self.ratelimiter.global_bucket.acquire()
+
+                    await bucket.acquire()
+
+                sent_at = time.perf_counter()
+
+                with self.tracer.span("http.send", attempt=tries) as send:
                     response = await self._session.request(
                         route.method,
-                        f"{BASE_API_URL}{route.url}",
+                        f"{self.api_url}{route.url}",
                         params=query_params,
                         headers=headers,
                         **kwargs,
                     )
+                    send.set_attribute("status", response.status)
+
+                received_at = time.perf_counter()
+
+                self._requests.inc(route.method, template, str(response.status))
+                self._request_duration.observe(
+                    received_at - sent_at, route.method, template
+                )
 
-                    bucket_url = bucket.bucket is None
-                    bucket.update_info(response)
+                bucket_url = bucket.bucket is None
+                bucket.update_info(response)
+
+                exhausted = (
+                    self.tracer.span(
+                        "ratelimit.wait",
+                        exhausted=True,
+                        **_bucket_attributes(template, bucket),
+                    )
+                    if bucket.is_locked()
+                    else NOOP_SPAN
+                )
+                with exhausted:
                     await bucket.acquire()
 
-                    if bucket_url and bucket.bucket is not None:
-                        try:
-                            self.ratelimiter.migrate(route.bucket, bucket.bucket)
-                        except BucketMigrated:
-                            bucket = self.ratelimiter.get_bucket(route.bucket)
-
-                    if 200 <= response.status < 300:
-                        return await self._text_or_json(response)
-
-                    if response.status == 429:  # Uh oh! we're ratelimited shit fuck
-                        _log.info("Retry after %s", response.headers["Retry-After"])
-                        if "Via" not in response.headers:
-                            # cloudflare fucked us. :(
-
-                            raise HTTPException(
-                                response, await self._text_or_json(response)
-                            )
-
-                        is_global = response.headers["X-RateLimit-Scope"] == "global"
-
-                        if is_global:
-                            retry_after = float(response.headers["Retry-After"])
-                            _log.info(
-                                "REQUEST:%d All requests have hit a global ratelimit! Retrying in %f.",
-                                self.req_id,
-                                retry_after,
-                            )
-                            self.ratelimiter.global_bucket.lock_for(retry_after)
-                            await self.ratelimiter.global_bucket.acquire()
+                self._ratelimit_wait.observe(
+                    sent_at - wait_start + time.perf_counter() - received_at, template
+                )
 
-                        _log.info(
-                            "REQUEST:%d Ratelimit is over. Continuing with the request.",
-                            self.req_id,
+                if bucket_url and bucket.bucket is not None:
+                    try:
+                        # a hash is shared between routes, but its limits apply per major parameter
+                        self.ratelimiter.migrate(
+                            route.bucket, f"{bucket.bucket}:{route.major_parameters}"
                         )
-                        continue
+                    except BucketMigrated:
+                        bucket = self.ratelimiter.get_bucket(route.bucket)
 
-                    if response.status in {500, 502, 504}:
-                        wait_time = 1 + tries * 2
-                        _log.info(
-                            "REQUEST: %d Got a server error! Retrying in %d.",
-                            self.req_id,
-                            wait_time,
-                        )
-                        await asyncio.sleep(wait_time)
-                        continue
+                if 200 <= response.status < 300:
+                    return await self._text_or_json(response)
+
+                if response.status == 429:  # Uh oh! we're ratelimited shit fuck
+                    _log.debug("Retry after %s", response.headers.get("Retry-After"))
+                    if "Via" not in response.headers:
+                        # cloudflare fucked us. :(
+                        self._ratelimited.inc(template, "cloudflare")
 
-                    if response.status >= 400:
                         raise HTTPException(
                             response, await self._text_or_json(response)
                         )
 
+                    scope = response.headers.get("X-RateLimit-Scope", "user")
+                    self._ratelimited.inc(template, scope)
+                    retry_reason = f"ratelimited:{scope}"
+
+                    if scope == "global":
+                        retry_after = float(response.headers["Retry-After"])
+                        _log.warning(
+                            "REQUEST:%d All requests have hit a global ratelimit! Retrying in %f.",
+                            self.req_id,
+                            retry_after,
+                        )
+                        self.ratelimiter.global_bucket.lock_for(retry_after)
+
+                        with self.tracer.span("ratelimit.wait", scope="global"):
+                            await self.ratelimiter.global_bucket.acquire()
+
+                    _log.debug(
+                        "REQUEST:%d Ratelimit is over. Continuing with the request.",
+                        self.req_id,
+                    )
+                    continue
+
+                if response.status in {500, 502, 504}:
+                    wait_time = 1 + tries * 2
+                    retry_reason = f"status:{response.status}"
+                    _log.warning(
+                        "REQUEST: %d Got a server error! Retrying in %d.",
+                        self.req_id,
+                        wait_time,
+                    )
+
+                    with self.tracer.span("http.backoff", delay=wait_time):
+                        await asyncio.sleep(wait_time)
+                    continue
+
+                if response.status >= 400:
+                    raise HTTPException(response, await self._text_or_json(response))
+
     async def get_gateway_bot(self):
         return await self.request(Route("GET", "/gateway/bot"))
 
+    async def get_application_id(self) -> str:
+        """The ID of the bot's application, fetched once and then cached."""
+        if self.application_id is None:
+            me = await self.get_me()
+            self.application_id = me["id"]
+
+        return self.application_id  # type: ignore
+
+    def _commands_url(self, application_id: str, guild_id: Optional[int]) -> str:
+        if guild_id is None:
+            return f"/applications/{application_id}/commands"
+
+        return f"/applications/{application_id}/guilds/{guild_id}/commands"
+
     async def register_app_commands(self, command: InteractionCommand):
-        me = await self.get_me()
+        application_id = await self.get_application_id()
 
         return await self.request(
-            Route("POST", f"/applications/{me['id']}/commands"),
+            Route("POST", self._commands_url(application_id, None)),
             json_params=command._to_json(),
         )
 
     async def delete_app_command(self, payload):
-        me = await self.get_me()
+        application_id = await self.get_application_id()
+
+        return await self.request(
+            Route(
+                "DELETE",
+                f"/applications/{application_id}/commands/{payload['id']}",
+            )
+        )
+
+    async def get_app_commands(self, *, guild_id: Optional[int] = None):
+        application_id = await self.get_application_id()
+
+        return await self.request(
+            Route("GET", self._commands_url(application_id, guild_id))
+        )
+
+    async def bulk_overwrite_app_commands(
+        self, commands: List[dict], *, guild_id: Optional[int] = None
+    ):
+        application_id = await self.get_application_id()
+
+        return await self.request(
+            Route("PUT", self._commands_url(application_id, guild_id)),
+            json_params=commands,  # type: ignore
+        )
+
+    def expect_inline_response(self, interaction_id: Union[int, str]) -> asyncio.Future:
+        """Makes the next response to this interaction resolve the returned future instead of being POSTed.
+
+        Used by the interactions server, which sends the response back in its HTTP reply.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._inline_responses[str(interaction_id)] = future
+        return future
+
+    def discard_inline_response(self, interaction_id: Union[int, str]):
+        self._inline_responses.pop(str(interaction_id), None)
+
+    async def create_interaction_response(
+        self, interaction_id: Union[int, str], token: str, payload: dict
+    ):
+        future = self._inline_responses.pop(str(interaction_id), None)
+
+        if future is not None and not future.done():
+            future.set_result(payload)
+            return None
 
         return await self.request(
-            Route("DELETE", f"/applications/{me['id']}/commands/{payload['id']}")
+            Route("POST", f"/interactions/{interaction_id}/{token}/callback"),
+            json_params=payload,
+        )
+
+    def track_interaction(self, payload: dict, *, defer_after: Optional[float]):
+        """Starts the response deadline of an incoming interaction.
+
+        Unless something responded within ``defer_after`` seconds, a deferred response is
+        sent automatically so the interaction doesn't expire.
+        """
+        if not payload.get("id") or not payload.get("token"):
+            return
+
+        loop = asyncio.get_running_loop()
+        state = _InteractionState(payload, loop.time())
+        self._interactions[state.id] = state
+
+        # autocomplete can't be deferred
+        if defer_after is not None and state.type != 4:
+            state.timer = loop.call_later(defer_after, self._auto_defer, state)
+
+        loop.call_later(
+            INTERACTION_TOKEN_LIFETIME, self._interactions.pop, state.id, None
         )
 
-    async def get_app_commands(self):
-        me = await self.get_me()
+    def _acknowledge(self, state: _InteractionState, *, deferred: bool):
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+
+        state.acknowledged = True
+        state.deferred = deferred
+
+        elapsed = asyncio.get_running_loop().time() - state.received_at
+        if elapsed > INTERACTION_DEADLINE:
+            self.interaction_deadline_misses += 1
+            _log.warning(
+                "Responded to interaction %s after %.2fs, past the deadline",
+                state.id,
+                elapsed,
+            )
+
+    def defer_interaction(
+        self, interaction_id: Union[int, str], *, ephemeral: bool = False
+    ):
+        """Acknowledges an interaction without content, unless it already was acknowledged.
+
+        Components get a deferred update, anything else a deferred message.
+        """
+        state = self._interactions.get(str(interaction_id))
+        if state is None or state.acknowledged:
+            return
+
+        self._acknowledge(state, deferred=True)
+
+        payload: dict[str, Any] = {"type": 6 if state.type == 3 else 5}
+        if ephemeral:
+            payload["data"] = {"flags": 1 << 6}
+
+        task = asyncio.create_task(self._send_defer(state, payload))
+        task.add_done_callback(self._log_task_exception)
+        state.defer_task = task
+
+        return task
+
+    async def _send_defer(self, state: _InteractionState, payload: dict):
+        try:
+            return await self.create_interaction_response(
+                state.id, state.token, payload
+            )
+        except Exception:
+            # nothing was acknowledged, the next response has to go to the callback route
+            state.acknowledged = False
+            state.deferred = False
+            raise
+        finally:
+            state.defer_task = None
+
+    async def wait_for_defer(self, interaction_id: Union[int, str]):
+        """Waits until a deferred response that is being sent was sent, or failed to be."""
+        state = self._interactions.get(str(interaction_id))
+
+        if state is not None and state.defer_task is not None:
+            # a failure is logged and resets the state, whoever waits decides what's next
+            await asyncio.wait((state.defer_task,))
+
+    def _auto_defer(self, state: _InteractionState):
+        state.timer = None
+
+        if not state.acknowledged:
+            self.interaction_auto_defers += 1
+            self.defer_interaction(state.id)
 
-        return await self.request(Route("GET", f"/applications/{me['id']}/commands"))
+    @staticmethod
+    def _log_task_exception(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            _log.error("Deferring an interaction failed", exc_info=task.exception())
+
+    async def respond_to_interaction(
+        self, interaction_id: Union[int, str], token: str, data: dict
+    ):
+        """Sends a message in response to an interaction, whatever state it's in.
+
+        The first response goes to the callback route, a response to a deferred interaction
+        edits the original response, and anything after that is sent as a followup.
+        """
+        await self.wait_for_defer(interaction_id)
+        state = self._interactions.get(str(interaction_id))
+
+        if state is None or not state.acknowledged:
+            if state is not None:
+                self._acknowledge(state, deferred=False)
+
+            return await self.create_interaction_response(
+                interaction_id, token, {"type": 4, "data": data}
+            )
+
+        application_id = state.application_id or await self.get_application_id()
+
+        if state.deferred:
+            state.deferred = False
+            return await self.edit_original_response(application_id, token, data)
 
-    def interaction_respond(self, content: str, embed: Embed, *, id: int, token: str):
+        return await self.create_followup(application_id, token, data)
+
+    def create_followup(self, application_id: Union[int, str], token: str, data: dict):
+        return self.request(
+            Route(
+                "POST",
+                f"/webhooks/{application_id}/{token}",
+                webhook_id=application_id,
+                webhook_token=token,
+            ),
+            json_params=data,
+            auth=False,
+        )
+
+    def edit_original_response(
+        self, application_id: Union[int, str], token: str, data: dict
+    ):
         return self.request(
-            Route("POST", f"/interactions/{id}/{token}/callback"),
-            json_params={"type": 4, "data": {"content": content, "embeds": [embed]}},
+            Route(
+                "PATCH",
+                f"/webhooks/{application_id}/{token}/messages/@original",
+                webhook_id=application_id,
+                webhook_token=token,
+            ),
+            json_params=data,
+            auth=False,
         )
 
+    def delete_original_response(self, application_id: Union[int, str], token: str):
+        return self.request(
+            Route(
+                "DELETE",
+                f"/webhooks/{application_id}/{token}/messages/@original",
+                webhook_id=application_id,
+                webhook_token=token,
+            ),
+            auth=False,
+        )
+
+    def interaction_respond(
+        self, content: str, embed: Optional[Embed] = None, *, id: int, token: str
+    ):
+        data: dict[str, Any] = {"content": content}
+
+        if embed is not None:
+            data["embeds"] = [embed.to_dict()]
+
+        return self.respond_to_interaction(id, token, data)
+
     def send_message(
-        self, channel: int, *, content: str, embed: Embed, files: List[File] = None
+        self,
+        channel: int,
+        *,
+        content: Optional[str] = None,
+        embed: Optional[Embed] = None,
+        files: List[File] = None,
     ):
+        payload: dict[str, Any] = {"content": content}
+
+        if embed is not None:
+            payload["embeds"] = [embed.to_dict()]
+
+        return self._post_message(channel, payload, files=files)
+
+    def _post_message(self, channel: int, payload: dict, *, files: List[File] = None):
         return self.request(
-            Route("POST", f"/channels/{channel}/messages"),
-            json_params={"content": content, "embeds": [embed.to_dict()]},
+            Route("POST", f"/channels/{channel}/messages", channel_id=channel),
+            json_params=payload,
             files=files,
         )
 
+    def send_buffered_message(
+        self,
+        channel: int,
+        *,
+        content: Optional[str] = None,
+        embed: Optional[Embed] = None,
+        window: float = 0.05,
+    ) -> asyncio.Future:
+        """Queues a message that gets merged with others sent to the same channel shortly after.
+
+        Returns a future for the message this one ended up in, see :class:`MessageCoalescer`.
+        """
+        channel = int(channel)
+        buffer = self._channel_buffers.get(channel)
+
+        if buffer is None:
+            buffer = self._channel_buffers[channel] = MessageCoalescer(
+                lambda payload: self._post_message(channel, payload), window=window
+            )
+
+        future = buffer.put(content, [embed.to_dict()] if embed is not None else ())
+        future.add_done_callback(lambda _: self._prune_buffer(channel))
+        return future
+
+    def _prune_buffer(self, channel: int):
+        buffer = self._channel_buffers.get(channel)
+        if buffer is not None and buffer.idle:
+            del self._channel_buffers[channel]
+
     def get_guild(self, guild_id: int):
         return self.request(Route("GET", f"/guilds/{guild_id}"))
 
@@ -272,8 +730,26 @@ class HTTPClient:
 
         return self.request(route, reason=reason)
 
-    async def start(self):
-        await self._gateway.connect()
+    async def start(self, *, resume: bool = False):
+        await self._gateway.connect(reconnect=resume)
+
+    async def close(self):
+        """Sends whatever is still buffered for channels, then closes the session."""
+        for state in self._interactions.values():
+            if state.timer is not None:
+                state.timer.cancel()
+                state.timer = None
+
+        buffers = [buffer.flush() for buffer in self._channel_buffers.values()]
+        if buffers:
+            await asyncio.gather(*buffers, return_exceptions=True)
+
+        if self.__session is not None and not self.__session.closed:
+            await self.__session.close()
+
+    async def _shutdown(self):
+        await self._gateway.close()
+        await self.close()
 
-    def run(self):
-        asyncio.run(self.start())
+    def run(self, *, use_uvloop: Optional[bool] = None):
+        run_loop(self.start, shutdown=self._shutdown, use_uvloop=use_uvloop)
@@ -1,2 +1,9 @@
+from .batch import *
+from .chunking import *
+from .coalesce import *
+from .decode import *
+from .dedupe import *
 from .models import *
 from .ratelimit import *
+from .sendqueue import *
+from .waiters import *
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable, FrozenSet, Iterable, List, Optional
+
+__all__ = ("EventBatcher",)
+
+
+class EventBatcher:
+    """Collects events for a batch listener and hands them over in lists.
+
+    A batch is flushed once it holds ``max_size`` events, or ``max_delay`` seconds after its
+    first event was added, whichever comes first. Adding an event is a list append, so a
+    listener forwarding events elsewhere costs one task per batch instead of one per event.
+
+    Args:
+        flush (Callable[[List[Any]], Any]): Called with every full or timed out batch.
+        events (Iterable[str]): The events collected, e.g. ``("message_create",)``.
+        mode (str): How events are passed, see :class:`Dispatcher`. Defaults to "dict".
+        max_size (int): The most events in a batch. Defaults to 100.
+        max_delay (Optional[float]): Seconds an event may wait for its batch to fill, None to only flush full batches.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[Any]], Any],
+        events: Iterable[str],
+        *,
+        mode: str = "dict",
+        max_size: int = 100,
+        max_delay: Optional[float] = 0.05,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size has to be at least 1")
+
+        self._flush = flush
+        self.events: FrozenSet[str] = frozenset(events)
+        self.mode = mode
+        self.max_size = max_size
+        self.max_delay = max_delay
+
+        self._items: List[Any] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item: Any):
+        self._items.append(item)
+
+        if len(self._items) >= self.max_size:
+            self.flush()
+        elif self._timer is None and self.max_delay is not None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_delay, self.flush
+            )
+
+    def flush(self):
+        """Hands over whatever was collected so far, if anything."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._items:
+            return
+
+        items, self._items = self._items, []
+        self.batches += 1
+        self._flush(items)
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+import secrets
+from typing import Any, AsyncIterator, List, Optional, Set
+
+__all__ = ("MemberChunkRequest",)
+
+
+class MemberChunkRequest:
+    """Collects the GUILD_MEMBERS_CHUNK responses to a single REQUEST_GUILD_MEMBERS command.
+
+    Iterating over it yields raw member payloads as soon as the chunk carrying them arrives,
+    and stops after the last chunk.
+
+    Args:
+        guild_id (int): The guild the members were requested from.
+        timeout (float): Seconds to wait for the next chunk before giving up. Defaults to 30.
+    """
+
+    def __init__(self, guild_id: int, *, timeout: float = 30.0):
+        self.guild_id = guild_id
+        self.nonce: str = secrets.token_hex(8)
+        self.timeout = timeout
+        self.chunk_count: Optional[int] = None
+        self.not_found: List[Any] = []
+        self.presences: List[dict] = []
+        self._seen: Set[int] = set()
+        self._queue: asyncio.Queue[Optional[List[dict]]] = asyncio.Queue()
+
+    @property
+    def done(self) -> bool:
+        return self.chunk_count is not None and len(self._seen) >= self.chunk_count
+
+    def feed(self, data: dict):
+        index = data.get("chunk_index", 0)
+        if index in self._seen:
+            return
+
+        self._seen.add(index)
+        self.chunk_count = data.get("chunk_count", 1)
+        self.not_found.extend(data.get("not_found", ()))
+        self.presences.extend(data.get("presences", ()))
+
+        self._queue.put_nowait(data.get("members", []))
+
+        if self.done:
+            self._queue.put_nowait(None)
+
+    async def __aiter__(self) -> AsyncIterator[dict]:
+        while True:
+            members = await asyncio.wait_for(self._queue.get(), self.timeout)
+            if members is None:
+                return
+
+            for member in members:
+                yield member
+
+    async def collect(self) -> List[dict]:
+        return [member async for member in self]
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, List, Optional, Sequence
+
+__all__ = ("MessageCoalescer",)
+
+
+MAX_CONTENT = 2000
+MAX_EMBEDS = 10
+MAX_EMBED_DESCRIPTION = 4096
+MAX_EMBED_TOTAL = 6000
+
+
+def _embed_size(embed: dict) -> int:
+    size = len(embed.get("title") or "") + len(embed.get("description") or "")
+
+    for field in embed.get("fields") or ():
+        size += len(field.get("name", "")) + len(field.get("value", ""))
+
+    size += len((embed.get("footer") or {}).get("text", ""))
+    size += len((embed.get("author") or {}).get("name", ""))
+
+    return size
+
+
+class _Part:
+    __slots__ = ("content", "embeds", "future")
+
+    def __init__(
+        self, content: Optional[str], embeds: Sequence[dict], future: asyncio.Future
+    ):
+        self.content = content
+        self.embeds = list(embeds)
+        self.future = future
+
+
+class _Batch:
+    def __init__(self, overflow_into_embeds: bool):
+        self.overflow_into_embeds = overflow_into_embeds
+        self.lines: List[str] = []
+        self.content_size = 0
+        self.embeds: List[dict] = []
+        self.embed_size = 0
+        self.parts: List[_Part] = []
+        # the embed overflowing lines are currently appended to
+        self._line_embed: Optional[dict] = None
+
+    def _line_slot(self, line: str) -> Optional[str]:
+        if self.content_size + len(line) + bool(self.lines) <= MAX_CONTENT:
+            return "content"
+
+        if not self.overflow_into_embeds:
+            return None
+
+        embed = self._line_embed
+        if (
+            embed is not None
+            and embed is self.embeds[-1]
+            and len(embed["description"]) + 1 + len(line) <= MAX_EMBED_DESCRIPTION
+        ):
+            return "append"
+
+        if len(line) <= MAX_EMBED_DESCRIPTION:
+            return "new"
+
+        return None
+
+    def add(self, part: _Part) -> bool:
+        """Adds a part if it fits, returning whether it did."""
+        line = part.content
+        slot = self._line_slot(line) if line else None
+
+        if line and slot is None:
+            return False
+
+        new_embeds = len(part.embeds) + (slot == "new")
+        new_size = sum(_embed_size(e) for e in part.embeds)
+        if slot == "append":
+            new_size += len(line) + 1  # type: ignore
+        elif slot == "new":
+            new_size += len(line)  # type: ignore
+
+        if (
+            len(self.embeds) + new_embeds > MAX_EMBEDS
+            or self.embed_size + new_size > MAX_EMBED_TOTAL
+        ):
+            return False
+
+        if slot == "content":
+            self.content_size += len(line) + bool(self.lines)  # type: ignore
+            self.lines.append(line)  # type: ignore
+        elif slot == "append":
+            self._line_embed["description"] += f"\n{line}"  # type: ignore
+        elif slot == "new":
+            self._line_embed = {"description": line}
+            self.embeds.append(self._line_embed)
+
+        self.embeds.extend(part.embeds)
+        self.embed_size += new_size
+        self.parts.append(part)
+        return True
+
+    def force(self, part: _Part):
+        """Adds a part that doesn't fit anywhere as is, the API will reject it for its caller."""
+        if part.content:
+            self.lines.append(part.content)
+
+        self.embeds.extend(part.embeds)
+        self.parts.append(part)
+
+    def to_payload(self) -> dict:
+        payload: dict = {}
+
+        if self.lines:
+            payload["content"] = "\n".join(self.lines)
+
+        if self.embeds:
+            payload["embeds"] = self.embeds
+
+        return payload
+
+
+class MessageCoalescer:
+    """Packs messages sent within a short window into as few messages as possible.
+
+    Every :meth:`put` returns a future for the message its part ended up in. Parts are sent in
+    order, joined by newlines into the content, with their embeds appended, for as long as
+    Discord's content and embed limits allow. With ``overflow_into_embeds``, lines that don't
+    fit the content anymore continue in embed descriptions. Only one message is in flight at
+    a time, whatever gets queued meanwhile becomes the next batch.
+
+    Args:
+        send (Callable[[dict], Awaitable[Any]]): Sends one message payload.
+        window (float): Seconds to wait for more parts after the first one. Defaults to 0.05.
+        overflow_into_embeds (bool): Whether lines may spill into embeds. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[dict], Awaitable[Any]],
+        *,
+        window: float = 0.05,
+        overflow_into_embeds: bool = False,
+    ):
+        self._send = send
+        self.window = window
+        self.overflow_into_embeds = overflow_into_embeds
+        self._parts: Deque[_Part] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self.messages_sent = 0
+        self.parts_sent = 0
+
+    def __len__(self):
+        return len(self._parts)
+
+    @property
+    def idle(self) -> bool:
+        """Whether nothing is queued or being sent."""
+        return not self._parts and (self._task is None or self._task.done())
+
+    def put(
+        self, content: Optional[str] = None, embeds: Sequence[dict] = ()
+    ) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._parts.append(_Part(content, embeds, future))
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        return future
+
+    def _next_batch(self) -> _Batch:
+        batch = _Batch(self.overflow_into_embeds)
+
+        while self._parts:
+            if batch.add(self._parts[0]):
+                self._parts.popleft()
+            elif not batch.parts:
+                batch.force(self._parts.popleft())
+                break
+            else:
+                break
+
+        return batch
+
+    async def _run(self):
+        while self._parts:
+            if self.window:
+                await asyncio.sleep(self.window)
+
+            batch = self._next_batch()
+
+            try:
+                result = await self._send(batch.to_payload())
+            except Exception as exc:
+                for part in batch.parts:
+                    if not part.future.done():
+                        part.future.set_exception(exc)
+                continue
+
+            self.messages_sent += 1
+            self.parts_sent += len(batch.parts)
+
+            for part in batch.parts:
+                if not part.future.done():
+                    part.future.set_result(result)
+
+    async def flush(self):
+        """Waits until everything queued so far was sent."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
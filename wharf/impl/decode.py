@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import json
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Tuple, Union
+
+__all__ = ("PayloadDecoder",)
+
+Frame = Union[bytes, bytearray, str]
+
+
+class PayloadDecoder:
+    """Inflates and parses the frames of one gateway connection, keeping big ones off the loop.
+
+    Frames smaller than ``threshold`` bytes, as received, are decoded inline. Bigger ones, like
+    a GUILD_CREATE for a large guild, are inflated and parsed on a worker thread, so the
+    inflating runs in parallel with the loop as zlib releases the GIL. Frames are still
+    decoded one at a time and in the order they were received.
+
+    Parsing JSON holds the GIL, and so does the garbage collector walking every cached payload
+    whenever a big one is allocated, which is what stalls the loop the longest during a guild
+    flood. With ``freeze`` set, everything alive after an offloaded payload was decoded is
+    moved out of the collector's reach with :func:`gc.freeze`, which keeps full collections
+    short. The catch is that reference cycles alive at that moment are never collected.
+
+    Args:
+        threshold (Optional[int]): Frame size from which decoding is offloaded, None to never offload.
+        freeze (bool): Whether to :func:`gc.freeze` after every offloaded payload. Defaults to False.
+    """
+
+    def __init__(self, *, threshold: Optional[int] = 64 * 1024, freeze: bool = False):
+        self.threshold = threshold
+        self.freeze = freeze
+        self.offloaded = 0
+
+        self._decompressor = zlib.decompressobj()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def reset(self):
+        """Starts a new zlib stream, for a new connection."""
+        self._decompressor = zlib.decompressobj()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @staticmethod
+    def _decode(raw: Frame, decompressor: Any) -> Tuple[Any, Frame]:
+        if decompressor is not None:
+            raw = decompressor.decompress(raw)
+
+        return json.loads(raw), raw
+
+    async def decode(self, raw: Frame, *, compressed: bool) -> Any:
+        """Decodes a complete frame, ``compressed`` when it's part of the zlib stream."""
+        data, _ = await self._run(raw, compressed)
+        return data
+
+    async def decode_frame(self, raw: Frame, *, compressed: bool) -> Tuple[Any, bytes]:
+        """Like :meth:`decode`, but also returns the JSON that was parsed."""
+        data, frame = await self._run(raw, compressed)
+
+        if isinstance(frame, str):
+            frame = frame.encode()
+        elif isinstance(frame, bytearray):
+            frame = bytes(frame)
+
+        return data, frame
+
+    async def _run(self, raw: Frame, compressed: bool) -> Tuple[Any, Frame]:
+        decompressor = self._decompressor if compressed else None
+
+        if self.threshold is None or len(raw) < self.threshold:
+            return self._decode(raw, decompressor)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="wharf-decode"
+            )
+
+        self.offloaded += 1
+
+        # copied, the caller's buffer is cleared on reconnect even if this decode is abandoned
+        if isinstance(raw, bytearray):
+            raw = bytes(raw)
+
+        decoded = await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._decode, raw, decompressor
+        )
+
+        if self.freeze:
+            gc.freeze()
+
+        return decoded
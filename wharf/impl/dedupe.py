@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+__all__ = ("Deduplicator",)
+
+
+KeyFunc = Callable[[dict], Optional[Hashable]]
+
+
+def _chunk_key(data: dict) -> Optional[Hashable]:
+    # without a nonce, chunks of two separate requests for the same guild look the same
+    nonce = data.get("nonce")
+    if nonce is None:
+        return None
+
+    return (data.get("guild_id"), nonce, data.get("chunk_index"))
+
+
+# Only events whose id is unique per occurrence are deduplicated. Anything keyed on payload
+# fields (a reaction, a member joining, an edit) can legitimately happen twice within the TTL,
+# and GUILD_CREATE after a fresh IDENTIFY for example has to go through every time.
+DEFAULT_KEYS: Dict[str, KeyFunc] = {
+    "message_create": lambda d: d.get("id"),
+    "message_delete": lambda d: d.get("id"),
+    "interaction_create": lambda d: d.get("id"),
+    "guild_members_chunk": _chunk_key,
+}
+
+
+class Deduplicator:
+    """A dispatcher middleware that drops events it has already seen recently.
+
+    Seen keys live in an insertion-ordered dict capped at ``maxsize`` entries, the oldest entries
+    are evicted first either when they outlive ``ttl`` or when the cap is hit, so memory stays
+    fixed no matter how many shards feed the same dispatcher.
+
+    Args:
+        ttl (float): How many seconds an event is remembered for. Defaults to 60.
+        maxsize (int): The most keys remembered at once. Defaults to 10000.
+    """
+
+    def __init__(self, *, ttl: float = 60.0, maxsize: int = 10_000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.keys: Dict[str, KeyFunc] = dict(DEFAULT_KEYS)
+        self.dropped = 0
+        self._seen: OrderedDict[Tuple[str, Hashable], float] = OrderedDict()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def _evict(self, now: float):
+        seen = self._seen
+        deadline = now - self.ttl
+
+        while seen:
+            key, seen_at = next(iter(seen.items()))
+            if seen_at > deadline and len(seen) < self.maxsize:
+                break
+
+            seen.popitem(last=False)
+
+    def __call__(self, event_name: str, data: Any) -> bool:
+        key_func = self.keys.get(event_name)
+        if key_func is None or not isinstance(data, dict):
+            return True
+
+        key = key_func(data)
+        if key is None:
+            return True
+
+        now = time.monotonic()
+        self._evict(now)
+
+        full_key = (event_name, key)
+        if full_key in self._seen:
+            self.dropped += 1
+            return False
+
+        self._seen[full_key] = now
+        return True
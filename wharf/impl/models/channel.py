@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-import discord_typings as dt
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import discord_typings as dt
 
 
 class Channel:
@@ -1,10 +1,13 @@
-from typing import TYPE_CHECKING
+from __future__ import annotations
 
-import discord_typings as dt
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional
 
+from .channel import Channel
 from .member import Member
 
 if TYPE_CHECKING:
+    import discord_typings as dt
+
     from ...client import Client
 
 
@@ -17,9 +20,61 @@ class Guild:
         self.name = guild.get("name")
         self.id = guild.get("id")
         self.icon_hash = guild.get("icon")
+        self._raw_channels = guild.get("channels", [])
+        self._channels: Optional[List[Channel]] = None
+
+    @property
+    def channels(self) -> List[Channel]:
+        """The channels sent along with this guild, parsed on first access."""
+        if self._channels is None:
+            self._channels = [Channel(c) for c in self._raw_channels]
+
+        return self._channels
+
+    def _to_json(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "icon": self.icon_hash,
+            "channels": self._raw_channels,
+        }
+
+    @property
+    def members(self) -> List[Member]:
+        """The cached members of this guild, see :meth:`chunk`."""
+        return self.__bot.cache.get_members(self.id)  # type: ignore
+
+    def get_member(self, user_id: int) -> Optional[Member]:
+        return self.__bot.cache.get_member(self.id, user_id)  # type: ignore
+
+    async def chunk(self, *, cache: bool = True) -> List[Member]:
+        """Requests every member of this guild over the gateway.
+
+        This needs the GUILD_MEMBERS intent.
+        """
+        return [m async for m in self.query_members(cache=cache)]
+
+    def query_members(
+        self,
+        query: str = "",
+        *,
+        limit: int = 0,
+        user_ids: Optional[List[int]] = None,
+        presences: bool = False,
+        cache: bool = True,
+    ) -> AsyncIterator[Member]:
+        """Streams members whose username starts with ``query``, or the given ``user_ids``."""
+        return self.__bot.query_members(
+            self.id,  # type: ignore
+            query,
+            limit=limit,
+            user_ids=user_ids,
+            presences=presences,
+            cache=cache,
+        )
 
     async def fetch_member(self, user: int):
-        return Member(await self.__bot.http.get_member(user, self.id))
+        return Member(await self.__bot.http.get_member(user, self.id), self.__bot)
 
     async def ban(
         self,
@@ -3,20 +3,26 @@ from __future__ import annotations
 from enum import Enum
 from typing import TYPE_CHECKING, List, Optional
 
-import discord_typings as dt
-
 if TYPE_CHECKING:
+    import discord_typings as dt
+
     from ...client import Client
     from ..models import Embed
 
 
 class InteractionOptionType(Enum):
+    sub_command = 1
+    sub_command_group = 2
     string = 3
     number = 4
+    integer = 4
+    boolean = 5
     user = 6
     channel = 7
     role = 8
-    attachment = 10
+    mentionable = 9
+    decimal = 10
+    attachment = 11
 
 
 class InteractionOption:
@@ -38,23 +44,63 @@ class Interaction:
         self.payload = payload
         self.id = payload.get("id")
         self.token = payload.get("token")
+        self.application_id = payload.get("application_id")
         self.channel_id = payload.get("channel_id")
         self.command = InteractionCommand._from_json(payload)
-        self.options: List[InteractionOption] = []
+        self._options: Optional[List[InteractionOption]] = None
+
+    @property
+    def options(self) -> List[InteractionOption]:
+        """The top level options of the command, parsed on first access."""
+        if self._options is None:
+            self._options = self._make_options()
 
-        self._make_options()
+        return self._options
 
     async def reply(self, content: str, embed: Embed = None):
         """
         Replies to a discord interaction
+
+        If the interaction was already deferred, this edits the deferred response, after
+        that every reply is sent as a followup.
         """
 
-        await self.bot.http.interaction_respond(content, id=self.id, token=self.token)
+        await self.bot.http.interaction_respond(
+            content, embed, id=self.id, token=self.token
+        )
+
+    async def defer(self, *, ephemeral: bool = False):
+        """Acknowledges the interaction now and responds later, see :meth:`reply`."""
+        # an automatic defer may be in flight, if it fails this one is sent instead
+        await self.bot.http.wait_for_defer(self.id)
+        task = self.bot.http.defer_interaction(self.id, ephemeral=ephemeral)
+        if task is not None:
+            await task
+
+    async def followup(self, content: str, embed: Embed = None):
+        data = {"content": content}
+        if embed is not None:
+            data["embeds"] = [embed.to_dict()]
+
+        return await self.bot.http.create_followup(
+            self.application_id, self.token, data
+        )
+
+    async def edit_original(self, content: str, embed: Embed = None):
+        data = {"content": content}
+        if embed is not None:
+            data["embeds"] = [embed.to_dict()]
+
+        return await self.bot.http.edit_original_response(
+            self.application_id, self.token, data
+        )
 
-    def _make_options(self):
-        for option in self.payload["data"]["options"]:
-            option = InteractionOption(option)
-            self.options.append(option)
+    async def delete_original(self):
+        await self.bot.http.delete_original_response(self.application_id, self.token)
+
+    def _make_options(self) -> List[InteractionOption]:
+        data = self.payload.get("data") or {}
+        return [InteractionOption(option) for option in data.get("options", ())]
 
 
 class InteractionCommand:
@@ -62,6 +108,7 @@ class InteractionCommand:
         self.name = name
         self.description = description
         self.options = []
+        self.subcommands: List[InteractionCommand] = []
 
     def add_options(
         self,
@@ -84,6 +131,32 @@ class InteractionCommand:
 
         self.options.append(data)
 
+    def add_subcommand(self, command: InteractionCommand) -> InteractionCommand:
+        """Nests a command under this one, a subcommand with subcommands of its own becomes a group."""
+        self.subcommands.append(command)
+        return command
+
+    def get_subcommand(self, name: str) -> Optional[InteractionCommand]:
+        return next((sub for sub in self.subcommands if sub.name == name), None)
+
+    def _options_json(self) -> List[dict]:
+        if self.subcommands:
+            return [sub._to_option_json() for sub in self.subcommands]
+
+        return self.options
+
+    def _to_option_json(self):
+        return {
+            "name": self.name,
+            "description": self.description,
+            "type": (
+                InteractionOptionType.sub_command_group.value
+                if self.subcommands
+                else InteractionOptionType.sub_command.value
+            ),
+            "options": self._options_json(),
+        }
+
     def _to_json(self):
         payload = {
             "name": self.name,
@@ -91,14 +164,16 @@ class InteractionCommand:
             "type": 1,
         }
 
-        if self.options:
-            payload["options"] = self.options
+        options = self._options_json()
+        if options:
+            payload["options"] = options
 
         return payload
 
     @classmethod
     def _from_json(cls, payload: dt.InteractionCreateData):
-        name = payload["data"]["name"]
-        description = payload["data"].get("description", "")
+        data = payload.get("data") or {}
+        name = data.get("name", "")
+        description = data.get("description", "")
 
         return cls(name=name, description=description)
@@ -1,15 +1,19 @@
 from __future__ import annotations
 
-from typing import Optional
-
-import discord_typings as dt
+from typing import TYPE_CHECKING, Optional
 
 from ...asset import Asset
 
+if TYPE_CHECKING:
+    import discord_typings as dt
+
+    from ...client import Client
+
 
 class Member:
-    def __init__(self, payload: dt.GuildMemberData):
+    def __init__(self, payload: dt.GuildMemberData, bot: Optional[Client] = None):
         self._from_data(payload)
+        self.bot = bot
 
     def _from_data(self, payload: dt.GuildMemberData):
         self.guild_avatar = payload.get("avatar")
@@ -19,8 +23,17 @@ class Member:
         self.name = payload["user"]["username"]
         self._avatar = payload["user"].get("avatar")
 
+    def _to_json(self) -> dict:
+        return {
+            "avatar": self.guild_avatar,
+            "joined_at": self.joined_at,
+            "roles": self.roles,
+            "user": {"id": self.id, "username": self.name, "avatar": self._avatar},
+        }
+
     @property
     def avatar(self) -> Optional[Asset]:
         if self._avatar is not None:
-            return Asset._from_avatar(self.id, self._avatar)
+            cache = self.bot.assets if self.bot is not None else None
+            return Asset._from_avatar(self.id, self._avatar, cache=cache)
         return None
@@ -1,8 +1,14 @@
-import discord_typings as dt
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional
 
-from ...client import Client
 from .user import User
 
+if TYPE_CHECKING:
+    import discord_typings as dt
+
+    from ...client import Client
+
 
 class Message:
     def __init__(self, data: dt.MessageCreateData, bot: Client):
@@ -14,6 +20,21 @@ class Message:
         self.author = User(message["author"])
         self.channel_id = message["channel_id"]
 
-    async def send(self, content: str):
-        msg = await self.bot.http.send_message(self.channel_id, content=content)
+    async def send(self, content: str, *, buffered: Optional[bool] = None):
+        """Sends a message to the channel this message is in.
+
+        Buffered messages may be merged with other messages sent to the channel within the
+        client's ``coalesce_window``, they default to on when that window is set.
+        """
+        window = self.bot.coalesce_window
+        if buffered is None:
+            buffered = window is not None
+
+        if buffered:
+            msg = await self.bot.http.send_buffered_message(
+                self.channel_id, content=content, window=window or 0.05
+            )
+        else:
+            msg = await self.bot.http.send_message(self.channel_id, content=content)
+
         return Message(msg, self.bot)
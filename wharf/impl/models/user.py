@@ -1,4 +1,9 @@
-import discord_typings as dt
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import discord_typings as dt
 
 
 class User:
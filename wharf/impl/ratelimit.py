@@ -1,4 +1,5 @@
 import asyncio
+import time
 from datetime import datetime, timezone
 from typing import Optional, Union
 
@@ -86,6 +87,9 @@ class Bucket(BurstRatelimiter):
             elif self.remaining is not None:
                 self.remaining = min(raw_remaining, self.remaining)
 
+        if self.bucket is None:
+            self.bucket = resp.headers.get("X-RateLimit-Bucket")
+
         reset = resp.headers.get("X-RateLimit-Reset")
 
         if reset is not None:
@@ -122,6 +126,50 @@ class Bucket(BurstRatelimiter):
         return self._migrated
 
 
+class WindowRatelimiter:
+    """Allows ``limit`` acquisitions per fixed window of ``per`` seconds.
+
+    The last ``reserved`` slots of every window can only be taken by priority callers, so
+    something like a heartbeat always has room even while normal traffic is being throttled.
+
+    Args:
+        limit (int): How many acquisitions each window allows.
+        per (float): The length of a window in seconds.
+        reserved (int): How many of those are kept for priority acquisitions. Defaults to 0.
+    """
+
+    def __init__(self, limit: int, per: float, *, reserved: int = 0):
+        self.limit = limit
+        self.per = per
+        self.reserved = reserved
+        self.used = 0
+        self.window_start = time.monotonic()
+
+    def reset(self):
+        self.used = 0
+        self.window_start = time.monotonic()
+
+    def delay(self, *, priority: bool = False) -> float:
+        """How long until a slot is free, 0 if one is free right now."""
+        now = time.monotonic()
+
+        if now - self.window_start >= self.per:
+            self.used = 0
+            self.window_start = now
+
+        allowed = self.limit if priority else self.limit - self.reserved
+        if self.used < allowed:
+            return 0.0
+
+        return self.window_start + self.per - now
+
+    async def acquire(self, *, priority: bool = False):
+        while delay := self.delay(priority=priority):
+            await asyncio.sleep(delay)
+
+        self.used += 1
+
+
 class Ratelimiter:
     def __init__(self):
         self.discord_buckets: dict[str, Bucket] = {}
@@ -131,18 +179,34 @@ class Ratelimiter:
 
     def get_bucket(self, url: str):
         if url not in self.url_to_discord_hash:
-            bucket = Bucket()
-            self.url_buckets[url] = bucket
+            # concurrent requests to a route that has no known hash yet have to share a bucket
+            bucket = self.url_buckets.get(url)
+            if bucket is None:
+                bucket = self.url_buckets[url] = Bucket()
             return bucket
 
         my_hash = self.url_to_discord_hash[url]
         return self.discord_buckets[my_hash]
 
+    def restore(self, url_to_discord_hash: dict[str, str]):
+        """Seeds already known bucket hashes, e.g. from a snapshot, so they don't have to be relearned."""
+        for url, hash in url_to_discord_hash.items():
+            if hash not in self.discord_buckets:
+                bucket = Bucket()
+                bucket.bucket = hash
+                self.discord_buckets[hash] = bucket
+
+            self.url_to_discord_hash[url] = hash
+            self.url_buckets.pop(url, None)
+
     def migrate(self, url: str, hash: str):
         self.url_to_discord_hash[url] = hash
 
-        bucket = self.url_buckets[url]
-        self.discord_buckets[hash] = bucket
-        self.url_buckets.pop(url)
+        bucket = self.url_buckets.pop(url, None)
+        if bucket is None:
+            raise BucketMigrated(hash)
+
+        # another route may have learned the same bucket first, keep using that one
+        self.discord_buckets.setdefault(hash, bucket)
 
         bucket.migrate(hash)
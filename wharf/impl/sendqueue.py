@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, Hashable, Optional
+
+from .ratelimit import WindowRatelimiter
+
+if TYPE_CHECKING:
+    from aiohttp import ClientWebSocketResponse
+
+__all__ = ("GatewaySendQueue",)
+
+
+class _Command:
+    __slots__ = ("payload", "key", "future")
+
+    def __init__(self, payload: dict, key: Optional[Hashable], future: asyncio.Future):
+        self.payload = payload
+        self.key = key
+        self.future = future
+
+
+class GatewaySendQueue:
+    """Paces outbound gateway commands so the socket never gets closed with 4008.
+
+    Normal commands are queued and drained in order by a worker bound to the current
+    connection. Priority commands (heartbeats, IDENTIFY, RESUME) skip the queue and may use
+    the slots the limiter reserves. Commands queued with a key replace an older, still
+    pending command with the same key, so only the latest presence update is ever sent.
+
+    Args:
+        limit (int): Commands allowed per window. Defaults to 120.
+        per (float): Window length in seconds. Defaults to 60.
+        reserved (int): Slots per window kept for priority commands. Defaults to 5.
+    """
+
+    def __init__(self, *, limit: int = 120, per: float = 60.0, reserved: int = 5):
+        self.limiter = WindowRatelimiter(limit, per, reserved=reserved)
+        self._pending: Deque[_Command] = deque()
+        self._keyed: Dict[Hashable, _Command] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def depth(self) -> int:
+        """How many commands are waiting to be sent."""
+        return len(self._pending)
+
+    def put(self, payload: dict, *, key: Optional[Hashable] = None) -> asyncio.Future:
+        """Queues a command, the returned future resolves once it was written to the socket."""
+        if key is not None and key in self._keyed:
+            command = self._keyed[key]
+            command.payload = payload
+            self.coalesced += 1
+            return command.future
+
+        command = _Command(payload, key, asyncio.get_running_loop().create_future())
+        self._pending.append(command)
+
+        if key is not None:
+            self._keyed[key] = command
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+        return command.future
+
+    async def send_priority(self, ws: ClientWebSocketResponse, payload: dict):
+        await self.limiter.acquire(priority=True)
+        await ws.send_json(payload)
+
+    async def run(self, ws: ClientWebSocketResponse):
+        """Drains the queue into ``ws`` until it closes or the task gets cancelled."""
+        self._wakeup = wakeup = asyncio.Event()
+
+        while not ws.closed:
+            if not self._pending:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+
+            await self.limiter.acquire()
+
+            if ws.closed:
+                # the slot is lost, but the command stays queued for the next connection
+                break
+
+            command = self._pending.popleft()
+            if command.key is not None:
+                self._keyed.pop(command.key, None)
+
+            try:
+                await ws.send_json(command.payload)
+            except Exception as exc:
+                if not command.future.done():
+                    command.future.set_exception(exc)
+                raise
+            else:
+                if not command.future.done():
+                    command.future.set_result(None)
+
+    def clear(self, exc: Optional[BaseException] = None):
+        """Drops every pending command, failing their futures with ``exc`` if given."""
+        while self._pending:
+            command = self._pending.popleft()
+            if command.future.done():
+                continue
+
+            if exc is None:
+                command.future.cancel()
+            else:
+                command.future.set_exception(exc)
+
+        self._keyed.clear()
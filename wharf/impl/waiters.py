@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+__all__ = ("WaiterRegistry",)
+
+
+WaiterKey = Tuple[str, str]
+
+# The order here doubles as the index priority, the first key a waiter provides is the one it's
+# indexed under, so the most selective keys should come first.
+INDEX_KEYS = ("interaction_id", "message_id", "user_id", "channel_id", "guild_id")
+
+
+def _user_id(data: dict) -> Optional[str]:
+    for container in (data.get("author"), data.get("user"), data.get("member")):
+        if not isinstance(container, dict):
+            continue
+
+        if "user" in container:
+            container = container["user"]
+
+        if "id" in container:
+            return container["id"]
+
+    return data.get("user_id")
+
+
+def _message_id(event_name: str, data: dict) -> Optional[str]:
+    if event_name.startswith("message_") and "message_id" not in data:
+        return data.get("id")
+
+    if "message" in data and isinstance(data["message"], dict):
+        return data["message"].get("id")
+
+    return data.get("message_id")
+
+
+def extract_keys(event_name: str, data: Any) -> Dict[str, str]:
+    """Pulls every indexable key out of a raw gateway payload.
+    Args:
+        event_name (str): The lowercased name of the event.
+        data (Any): The raw ``d`` field of the dispatch.
+    """
+    if not isinstance(data, dict):
+        return {}
+
+    keys = {
+        "interaction_id": data.get("id")
+        if event_name == "interaction_create"
+        else None,
+        "message_id": _message_id(event_name, data),
+        "user_id": _user_id(data),
+        "channel_id": data.get("channel_id"),
+        "guild_id": data.get("guild_id"),
+    }
+
+    return {k: str(v) for k, v in keys.items() if v is not None}
+
+
+class _Waiter:
+    __slots__ = ("event_name", "index_key", "keys", "check", "future")
+
+    def __init__(
+        self,
+        event_name: str,
+        keys: Dict[str, str],
+        check: Optional[Callable[..., bool]],
+        future: asyncio.Future,
+    ):
+        self.event_name = event_name
+        self.keys = keys
+        self.check = check
+        self.future = future
+        self.index_key: Optional[WaiterKey] = next(
+            ((k, keys[k]) for k in INDEX_KEYS if k in keys), None
+        )
+
+    def matches(self, keys: Dict[str, str]) -> bool:
+        return all(keys.get(k) == v for k, v in self.keys.items())
+
+
+class WaiterRegistry:
+    """Holds every pending ``wait_for`` call, indexed by event name and then by a single key.
+
+    Waiters without any keys are kept in a catch-all bucket and are tested on every dispatch of their
+    event, keyed waiters are only ever looked at when an event carries their key, so thousands of
+    pending prompts in other channels cost a dict lookup.
+    """
+
+    def __init__(self):
+        # event name -> index key (or None) -> ordered set of waiters
+        self._index: Dict[str, Dict[Optional[WaiterKey], Dict[_Waiter, None]]] = {}
+
+    def __len__(self):
+        return sum(
+            len(bucket)
+            for buckets in self._index.values()
+            for bucket in buckets.values()
+        )
+
+    def has_waiters(self, event_name: str) -> bool:
+        return event_name in self._index
+
+    def add(
+        self,
+        event_name: str,
+        *,
+        check: Optional[Callable[..., bool]] = None,
+        **keys: Any,
+    ) -> asyncio.Future:
+        unknown = set(keys) - set(INDEX_KEYS)
+        if unknown:
+            raise TypeError(f"Unknown waiter keys: {', '.join(sorted(unknown))}")
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(
+            event_name,
+            {k: str(v) for k, v in keys.items() if v is not None},
+            check,
+            future,
+        )
+
+        buckets = self._index.setdefault(event_name, {})
+        buckets.setdefault(waiter.index_key, {})[waiter] = None
+        future.add_done_callback(lambda _: self._remove(waiter))
+
+        return future
+
+    def _remove(self, waiter: _Waiter):
+        buckets = self._index.get(waiter.event_name)
+        if buckets is None:
+            return
+
+        bucket = buckets.get(waiter.index_key)
+        if bucket is None:
+            return
+
+        bucket.pop(waiter, None)
+
+        if not bucket:
+            del buckets[waiter.index_key]
+        if not buckets:
+            del self._index[waiter.event_name]
+
+    def _candidates(self, event_name: str, keys: Dict[str, str]) -> Iterator[_Waiter]:
+        buckets = self._index.get(event_name)
+        if buckets is None:
+            return
+
+        lookups = [None] + [(k, v) for k, v in keys.items()]
+
+        for lookup in lookups:
+            bucket = buckets.get(lookup)  # type: ignore
+            if bucket:
+                # copy, resolving a waiter removes it from the bucket
+                yield from list(bucket)
+
+    def resolve(self, event_name: str, raw: Any, *args: Any):
+        """Completes every waiter that matches this event.
+        Args:
+            event_name (str): The lowercased name of the event.
+            raw (Any): The raw payload, used for key lookups.
+            *args (Any): What listeners would be called with, passed to checks and used as the result.
+        """
+        if event_name not in self._index:
+            return
+
+        keys = extract_keys(event_name, raw)
+
+        for waiter in self._candidates(event_name, keys):
+            if waiter.future.done() or not waiter.matches(keys):
+                continue
+
+            try:
+                if waiter.check is not None and not waiter.check(*args):
+                    continue
+            except Exception as exc:
+                waiter.future.set_exception(exc)
+                continue
+
+            if not args:
+                result = None
+            elif len(args) == 1:
+                result = args[0]
+            else:
+                result = args
+
+            waiter.future.set_result(result)
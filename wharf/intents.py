@@ -1,7 +1,19 @@
-from enum import Enum
+from __future__ import annotations
 
+from enum import IntFlag
+from typing import Dict
+
+__all__ = ("Intents",)
+
+
+class Intents(IntFlag):
+    """The gateway intents to identify with, combined with ``|``.
+
+    Besides deciding which events Discord sends, they decide what the client sets up: events
+    none of the intents can deliver get no parser, cache or deduplication entry, and
+    listening for one logs a warning, see :meth:`delivers`.
+    """
 
-class Intents(Enum):
     NONE = 0
     GUILDS = 1 << 0
     GUILD_MEMBERS = 1 << 1
@@ -66,6 +78,83 @@ class Intents(Enum):
 
     ALL = ALL_UNPRIVILEGED | ALL_PRIVILEGED
 
+    @classmethod
+    def all(cls) -> Intents:
+        """Every intent, privileged ones included."""
+        return cls.ALL
+
+    @classmethod
+    def default(cls) -> Intents:
+        """Every intent that doesn't need to be enabled in the developer portal."""
+        return cls.ALL_UNPRIVILEGED
+
+    @classmethod
+    def none(cls) -> Intents:
+        return cls.NONE
+
     @property
     def is_privileged(self) -> bool:
-        return bool(self & self.ALL_PRIVILEGED)
+        return bool(self & Intents.ALL_PRIVILEGED)
+
+    def delivers(self, event_name: str) -> bool:
+        """Whether Discord sends this event, e.g. ``"message_create"``, with these intents.
+
+        Events no intent is needed for, like READY or INTERACTION_CREATE, are always delivered.
+        """
+        required = EVENT_INTENTS.get(event_name.lower())
+        return required is None or bool(self & required)
+
+
+# Events Discord only sends with at least one of these intents, anything missing is sent
+# regardless of the intents. See https://discord.com/developers/docs/topics/gateway#list-of-intents
+EVENT_INTENTS: Dict[str, Intents] = {
+    "guild_create": Intents.GUILDS,
+    "guild_update": Intents.GUILDS,
+    "guild_delete": Intents.GUILDS,
+    "guild_role_create": Intents.GUILDS,
+    "guild_role_update": Intents.GUILDS,
+    "guild_role_delete": Intents.GUILDS,
+    "channel_create": Intents.GUILDS,
+    "channel_update": Intents.GUILDS,
+    "channel_delete": Intents.GUILDS,
+    "channel_pins_update": Intents.GUILDS | Intents.DIRECT_MESSAGES,
+    "thread_create": Intents.GUILDS,
+    "thread_update": Intents.GUILDS,
+    "thread_delete": Intents.GUILDS,
+    "thread_list_sync": Intents.GUILDS,
+    "thread_member_update": Intents.GUILDS,
+    "thread_members_update": Intents.GUILDS | Intents.GUILD_MEMBERS,
+    "stage_instance_create": Intents.GUILDS,
+    "stage_instance_update": Intents.GUILDS,
+    "stage_instance_delete": Intents.GUILDS,
+    "guild_member_add": Intents.GUILD_MEMBERS,
+    "guild_member_update": Intents.GUILD_MEMBERS,
+    "guild_member_remove": Intents.GUILD_MEMBERS,
+    "guild_ban_add": Intents.GUILD_BANS,
+    "guild_ban_remove": Intents.GUILD_BANS,
+    "guild_emojis_update": Intents.GUILD_EMOJIS,
+    "guild_stickers_update": Intents.GUILD_EMOJIS,
+    "guild_integrations_update": Intents.GUILD_INTEGRATIONS,
+    "integration_create": Intents.GUILD_INTEGRATIONS,
+    "integration_update": Intents.GUILD_INTEGRATIONS,
+    "integration_delete": Intents.GUILD_INTEGRATIONS,
+    "webhooks_update": Intents.GUILD_WEBHOOKS,
+    "invite_create": Intents.GUILD_INVITES,
+    "invite_delete": Intents.GUILD_INVITES,
+    "voice_state_update": Intents.GUILD_VOICE_STATES,
+    "presence_update": Intents.GUILD_PRESENCES,
+    "message_create": Intents.ALL_MESSAGES,
+    "message_update": Intents.ALL_MESSAGES,
+    "message_delete": Intents.ALL_MESSAGES,
+    "message_delete_bulk": Intents.GUILD_MESSAGES,
+    "message_reaction_add": Intents.ALL_MESSAGE_REACTIONS,
+    "message_reaction_remove": Intents.ALL_MESSAGE_REACTIONS,
+    "message_reaction_remove_all": Intents.ALL_MESSAGE_REACTIONS,
+    "message_reaction_remove_emoji": Intents.ALL_MESSAGE_REACTIONS,
+    "typing_start": Intents.ALL_MESSAGE_TYPING,
+    "guild_scheduled_event_create": Intents.GUILD_SCHEDULED_EVENTS,
+    "guild_scheduled_event_update": Intents.GUILD_SCHEDULED_EVENTS,
+    "guild_scheduled_event_delete": Intents.GUILD_SCHEDULED_EVENTS,
+    "guild_scheduled_event_user_add": Intents.GUILD_SCHEDULED_EVENTS,
+    "guild_scheduled_event_user_remove": Intents.GUILD_SCHEDULED_EVENTS,
+}
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import TYPE_CHECKING, Optional
+
+from aiohttp import web
+
+try:
+    from nacl.exceptions import BadSignatureError
+    from nacl.signing import VerifyKey
+except ImportError:
+    VerifyKey = None
+
+if TYPE_CHECKING:
+    from .client import Client
+
+__all__ = ("InteractionServer", "SignatureVerifier")
+
+_log = logging.getLogger(__name__)
+
+
+class SignatureVerifier:
+    """Verifies the Ed25519 signatures Discord puts on interaction webhooks.
+
+    Args:
+        public_key (str): The hex encoded public key of the application.
+    """
+
+    def __init__(self, public_key: str):
+        if VerifyKey is None:
+            raise RuntimeError(
+                "PyNaCl is needed to verify interactions, install wharf[interactions]"
+            )
+
+        # decoding the key is the expensive part, so it's done once up front
+        self._key = VerifyKey(bytes.fromhex(public_key))
+
+    def verify(self, timestamp: str, body: bytes, signature: str) -> bool:
+        try:
+            self._key.verify(timestamp.encode() + body, bytes.fromhex(signature))
+        except (BadSignatureError, ValueError):
+            return False
+
+        return True
+
+
+class InteractionServer:
+    """Receives interactions over HTTP instead of the gateway.
+
+    Incoming requests are verified, PINGs are answered directly, and everything else is
+    dispatched as ``interaction_create``. The first response a handler creates is sent back
+    in the HTTP reply itself instead of through the callback route. The client's automatic
+    defer usually provides that response for slow handlers, ``response_timeout`` is the
+    last resort for when it is turned off.
+
+    Args:
+        client (Client): The client to dispatch interactions to.
+        public_key (str): The hex encoded public key of the application.
+        path (str): The route to listen on. Defaults to ``/interactions``.
+        response_timeout (float): Seconds to wait for a response. Defaults to 2.5.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        *,
+        public_key: str,
+        path: str = "/interactions",
+        response_timeout: float = 2.5,
+    ):
+        self.client = client
+        self.verifier = SignatureVerifier(public_key)
+        self.response_timeout = response_timeout
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle)
+        self.app.on_cleanup.append(self._cleanup)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        signature = request.headers.get("X-Signature-Ed25519")
+        timestamp = request.headers.get("X-Signature-Timestamp")
+
+        if (
+            signature is None
+            or timestamp is None
+            or not self.verifier.verify(timestamp, body, signature)
+        ):
+            return web.Response(status=401, text="invalid request signature")
+
+        data = json.loads(body)
+
+        if data["type"] == 1:
+            return web.json_response({"type": 1})
+
+        http = self.client.http
+        future = http.expect_inline_response(data["id"])
+
+        try:
+            dispatcher = self.client.dispatcher
+            if dispatcher.wants("interaction_create"):
+                dispatcher.dispatch("interaction_create", data)
+
+            payload = await asyncio.wait_for(
+                asyncio.shield(future), self.response_timeout
+            )
+        except asyncio.TimeoutError:
+            _log.info("No response to interaction %s in time, deferring", data["id"])
+
+            if http.defer_interaction(data["id"]) is None:
+                payload = {"type": 5}
+            else:
+                payload = await future
+        finally:
+            http.discard_inline_response(data["id"])
+
+        return web.json_response(payload)
+
+    async def start(self, host: str = "0.0.0.0", port: int = 8080):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _cleanup(self, app: web.Application):
+        await self.client.http.close()
+
+    def run(self, host: str = "0.0.0.0", port: int = 8080):
+        web.run_app(self.app, host=host, port=port)
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import logging
+import math
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+__all__ = ("Metrics", "Counter", "Gauge", "Histogram")
+
+_log = logging.getLogger(__name__)
+
+
+Labels = Tuple[str, ...]
+Sample = Union[float, Dict[Labels, float]]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+
+    pairs = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+class _Metric:
+    type: str
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        *,
+        func: Optional[Callable[[], Sample]] = None,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self.values: Dict[Labels, float] = {}
+
+    def _samples(self) -> Dict[Labels, float]:
+        if self.func is None:
+            return self.values
+
+        sample = self.func()
+        return sample if isinstance(sample, dict) else {(): sample}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+        for labels, value in self._samples().items():
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            )
+
+        return lines
+
+
+class Counter(_Metric):
+    """A value that only goes up. With ``func`` it's read from elsewhere when collected."""
+
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down. With ``func`` it's read from elsewhere when collected."""
+
+    type = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) - amount
+
+
+class Histogram(_Metric):
+    """Counts observations into fixed buckets, plus their sum and count."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        *,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per bucket counts..., +Inf count, sum]
+        self.data: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        data = self.data.get(labels)
+        if data is None:
+            data = self.data[labels] = [0.0] * (len(self.buckets) + 2)
+
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = (*self.labelnames, "le")
+
+        for labels, data in self.data.items():
+            cumulative = 0.0
+
+            for bound, count in zip((*self.buckets, math.inf), data):
+                cumulative += count
+                le = _format_labels(names, (*labels, _format_value(bound)))
+                lines.append(f"{self.name}_bucket{le} {_format_value(cumulative)}")
+
+            formatted = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{formatted} {_format_value(data[-1])}")
+            lines.append(f"{self.name}_count{formatted} {_format_value(cumulative)}")
+
+        return lines
+
+
+class Metrics:
+    """A registry of counters, gauges and histograms, rendered in the Prometheus text format.
+
+    Recording is a dict update, nothing is aggregated or formatted until :meth:`render` is
+    called, and callback metrics (``func=``) aren't even read until then. Registering a name
+    twice returns the metric registered first, so components sharing a registry can declare
+    the metrics they touch without coordinating.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def __iter__(self):
+        return iter(self._metrics.values())
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        metric = self._metrics.get(name)
+
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"{name} is already registered as a {metric.type}")
+        elif kwargs.get("func") is not None:
+            # whatever registered last owns a callback metric, e.g. a replaced profiler
+            metric.func = kwargs["func"]
+
+        return metric
+
+    def counter(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        *,
+        func: Optional[Callable[[], Sample]] = None,
+    ) -> Counter:
+        return self._register(Counter, name, help, labelnames, func=func)
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        *,
+        func: Optional[Callable[[], Sample]] = None,
+    ) -> Gauge:
+        return self._register(Gauge, name, help, labelnames, func=func)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        *,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                _log.exception("Failed to collect %s", metric.name)
+
+        lines.append("")
+        return "\n".join(lines)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """An aiohttp handler serving :meth:`render`, to mount on an existing app."""
+        from aiohttp import web
+
+        return web.Response(
+            body=self.render().encode(), headers={"Content-Type": CONTENT_TYPE}
+        )
+
+    async def start_server(self, *, host: str = "127.0.0.1", port: int = 9090):
+        """Serves the metrics on ``http://host:port/metrics``."""
+        # aiohttp.web is only imported for the server, clients that never serve don't need it
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+        _log.info("Serving metrics on http://%s:%d/metrics", host, port)
+
+    async def stop_server(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
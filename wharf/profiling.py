@@ -0,0 +1,430 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import heapq
+import itertools
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Tuple
+
+from .metrics import Metrics
+
+__all__ = ("HandlerProfiler", "LoopMonitor", "SamplingProfiler")
+
+_log = logging.getLogger(__name__)
+
+
+def _handler_name(callback: Callable) -> str:
+    return f"{callback.__module__}.{getattr(callback, '__qualname__', repr(callback))}"
+
+
+def _format_frames(frames: List[FrameType]) -> List[str]:
+    summary = traceback.StackSummary.extract((f, f.f_lineno) for f in frames)
+    return summary.format()
+
+
+def _thread_stack(thread_id: int) -> List[str]:
+    frame = sys._current_frames().get(thread_id)
+    return traceback.format_stack(frame) if frame is not None else []
+
+
+class HandlerStats:
+    __slots__ = ("calls", "errors", "total", "max")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+class SlowCall:
+    """One listener invocation that made it into the slowest list.
+
+    ``stack`` is where the listener was suspended once it ran past the profiler's
+    ``slow_threshold``, it's empty for calls that finished before that.
+    """
+
+    __slots__ = ("event", "handler", "duration", "started_at", "stack")
+
+    def __init__(self, event: str, handler: str, started_at: float):
+        self.event = event
+        self.handler = handler
+        self.duration = 0.0
+        self.started_at = started_at
+        self.stack: List[str] = []
+
+    def __repr__(self):
+        return f"<SlowCall {self.handler} ({self.event}) {self.duration * 1000:.1f}ms>"
+
+
+class HandlerError:
+    __slots__ = ("event", "handler", "exception", "traceback", "at")
+
+    def __init__(self, event: str, handler: str, exception: BaseException):
+        self.event = event
+        self.handler = handler
+        self.exception = exception
+        self.traceback = traceback.format_exc()
+        self.at = time.time()
+
+
+class LoopMonitor:
+    """Warns when the event loop doesn't get to run callbacks for longer than ``threshold``.
+
+    The loop bumps a timestamp every ``threshold / 2`` seconds, and a watchdog thread checks
+    it. When the timestamp goes stale, the watchdog logs the loop thread's current stack,
+    which is the code that is blocking it.
+
+    Args:
+        threshold (float): Seconds of blocking worth a warning. Defaults to 0.1.
+        metrics (Optional[Metrics]): Registry to count blocks in.
+    """
+
+    def __init__(self, *, threshold: float = 0.1, metrics: Optional[Metrics] = None):
+        self.threshold = threshold
+        self.interval = threshold / 2
+        self.blocks = 0
+        self.max_lag = 0.0
+        self.last_block_stack: List[str] = []
+
+        self._last_beat = time.monotonic()
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._thread_id = 0
+
+        if metrics is not None:
+            metrics.counter(
+                "wharf_loop_blocks_total",
+                "Times the event loop was blocked past the monitor threshold.",
+                func=lambda: self.blocks,
+            )
+            metrics.gauge(
+                "wharf_loop_max_lag_seconds",
+                "The longest the event loop was seen blocked.",
+                func=lambda: self.max_lag,
+            )
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self.running:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        # every watcher gets its own event, so one that's still winding down after a
+        # stop() can't be revived by the next start()
+        self._stopped = threading.Event()
+        self._beat()
+
+        self._thread = threading.Thread(
+            target=self._watch,
+            args=(self._stopped,),
+            name="wharf-loop-monitor",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+
+    def _beat(self):
+        now = time.monotonic()
+        lag = now - self._last_beat - self.interval
+        if lag > self.max_lag and self._handle is not None:
+            self.max_lag = lag
+
+        self._last_beat = now
+        self._handle = self._loop.call_later(self.interval, self._beat)
+
+    def _watch(self, stopped: threading.Event):
+        reported_beat = None
+
+        while not stopped.wait(self.interval):
+            beat = self._last_beat
+            stalled = time.monotonic() - beat - self.interval
+
+            if stalled < self.threshold or beat == reported_beat:
+                continue
+
+            # only report each stall once, however long it lasts
+            reported_beat = beat
+            self.blocks += 1
+            self.last_block_stack = _thread_stack(self._thread_id)
+
+            _log.warning(
+                "Event loop blocked for over %.3fs, currently in:\n%s",
+                stalled,
+                "".join(self.last_block_stack),
+            )
+
+
+class HandlerProfiler:
+    """Times every listener invocation and captures the exceptions they raise.
+
+    Set it as :attr:`Dispatcher.profiler`, usually through :meth:`Client.enable_profiling`.
+    It keeps per listener stats, the ``keep`` slowest invocations along with where they were
+    stuck once they ran past ``slow_threshold``, and the ``keep`` most recent exceptions. A
+    :class:`LoopMonitor` is started alongside it.
+
+    Args:
+        keep (int): How many slow calls and errors to remember. Defaults to 20.
+        slow_threshold (float): Seconds after which a running listener's stack is captured.
+        block_threshold (Optional[float]): Passed to the :class:`LoopMonitor`, None for no monitor.
+        metrics (Optional[Metrics]): Registry to count listener errors in.
+    """
+
+    def __init__(
+        self,
+        *,
+        keep: int = 20,
+        slow_threshold: float = 0.5,
+        block_threshold: Optional[float] = 0.1,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.keep = keep
+        self.slow_threshold = slow_threshold
+        self.stats: Dict[str, HandlerStats] = collections.defaultdict(HandlerStats)
+        self.errors: Deque[HandlerError] = collections.deque(maxlen=keep)
+        self._slowest: List[Tuple[float, int, SlowCall]] = []
+        self._counter = itertools.count()
+
+        self.loop_monitor = (
+            LoopMonitor(threshold=block_threshold, metrics=metrics)
+            if block_threshold is not None
+            else None
+        )
+        self._errors_metric = (
+            metrics.counter(
+                "wharf_dispatcher_handler_errors_total",
+                "Exceptions raised by event listeners.",
+                ("event",),
+            )
+            if metrics is not None
+            else None
+        )
+
+    def start(self):
+        """Starts the loop monitor, needs a running event loop."""
+        if self.loop_monitor is not None:
+            self.loop_monitor.start()
+
+    def stop(self):
+        if self.loop_monitor is not None:
+            self.loop_monitor.stop()
+
+    @property
+    def slowest(self) -> List[SlowCall]:
+        """The slowest invocations so far, slowest first."""
+        return [call for _, _, call in sorted(self._slowest, reverse=True)]
+
+    def _capture_stack(self, task: asyncio.Task, call: SlowCall):
+        call.stack = _format_frames(task.get_stack())
+
+    def _record_slow(self, call: SlowCall):
+        entry = (call.duration, next(self._counter), call)
+
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif call.duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    async def run(
+        self,
+        event_name: str,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: tuple,
+        kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        name = _handler_name(callback)
+        call = SlowCall(event_name, name, time.time())
+        stats = self.stats[name]
+
+        task = asyncio.current_task()
+        watchdog = asyncio.get_running_loop().call_later(
+            self.slow_threshold, self._capture_stack, task, call
+        )
+        start = time.perf_counter()
+
+        try:
+            await callback(*args, **(kwargs or {}))
+        except Exception as exc:
+            stats.errors += 1
+            self.errors.append(HandlerError(event_name, name, exc))
+
+            if self._errors_metric is not None:
+                self._errors_metric.inc(event_name)
+
+            _log.exception("Listener %s for %r raised", name, event_name)
+        finally:
+            watchdog.cancel()
+
+            call.duration = time.perf_counter() - start
+            stats.calls += 1
+            stats.total += call.duration
+            stats.max = max(stats.max, call.duration)
+
+            self._record_slow(call)
+
+    def report(self, *, limit: int = 10) -> str:
+        """A plain text summary of the busiest listeners and the slowest calls."""
+        lines = [
+            f"{'listener':<60} {'calls':>8} {'errors':>7} {'mean ms':>9} {'max ms':>9}"
+        ]
+
+        by_total = sorted(self.stats.items(), key=lambda item: -item[1].total)
+        for name, stats in by_total[:limit]:
+            lines.append(
+                f"{name[-60:]:<60} {stats.calls:>8} {stats.errors:>7} "
+                f"{stats.mean * 1000:>9.2f} {stats.max * 1000:>9.2f}"
+            )
+
+        lines.append("")
+        lines.append("slowest calls:")
+
+        for call in self.slowest[:limit]:
+            lines.append(
+                f"  {call.duration * 1000:9.2f}ms {call.handler} ({call.event})"
+            )
+            lines.extend(f"    {line.rstrip()}" for line in call.stack[-4:])
+
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """A statistical profiler for the event loop thread that can be switched on at runtime.
+
+    While running, a background thread grabs the loop thread's stack every ``interval``
+    seconds and counts identical stacks. It adds no overhead while stopped, so it can stay
+    installed in production and be toggled with :meth:`install_signal_handler`.
+
+    Args:
+        interval (float): Seconds between samples. Defaults to 0.005.
+        path (Optional[str]): Where :meth:`stop` writes collapsed stacks, None to only log the top functions.
+    """
+
+    def __init__(self, *, interval: float = 0.005, path: Optional[str] = None):
+        self.interval = interval
+        self.path = path
+        self.samples: collections.Counter[Tuple[str, ...]] = collections.Counter()
+        self.sample_count = 0
+
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._target = threading.get_ident()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, *, thread_id: Optional[int] = None):
+        """Starts sampling ``thread_id``, by default the calling thread."""
+        if self.running:
+            return
+
+        self._target = thread_id if thread_id is not None else threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._sample, name="wharf-sampling-profiler", daemon=True
+        )
+        self._thread.start()
+        _log.info("Sampling profiler started")
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self._stopped.set()
+        self._thread.join()  # type: ignore
+        self._thread = None
+
+        if self.path is not None:
+            with open(self.path, "w") as f:
+                f.write(self.collapsed())
+
+            _log.info("Sampling profiler stopped, wrote %s", self.path)
+        else:
+            top = "\n".join(f"{count:>8} {name}" for name, count in self.top())
+            _log.info("Sampling profiler stopped, top functions:\n%s", top)
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def clear(self):
+        self.samples.clear()
+        self.sample_count = 0
+
+    def install_signal_handler(self, signum: int = getattr(signal, "SIGUSR2", 0)):
+        """Toggles the profiler whenever the process receives ``signum``. Unix only."""
+        loop = asyncio.get_running_loop()
+        target = threading.get_ident()
+
+        def toggle():
+            if self.running:
+                self.stop()
+            else:
+                self.start(thread_id=target)
+
+        loop.add_signal_handler(signum, toggle)
+        _log.info(
+            "Send signal %d to process %d to toggle profiling", signum, os.getpid()
+        )
+
+    def _sample(self):
+        frames = sys._current_frames
+
+        while not self._stopped.wait(self.interval):
+            frame = frames().get(self._target)
+            stack = []
+
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+                self.sample_count += 1
+
+    def collapsed(self) -> str:
+        """The samples as collapsed stacks, as read by flamegraph.pl and speedscope."""
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.samples.items()
+        )
+
+    def top(self, limit: int = 20) -> List[Tuple[str, int]]:
+        """The functions the loop was most often seen in, innermost frame only."""
+        counts: collections.Counter[str] = collections.Counter()
+
+        for stack, count in self.samples.items():
+            counts[stack[-1]] += count
+
+        return counts.most_common(limit)
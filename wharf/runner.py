@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+try:
+    import uvloop  # type: ignore
+except ImportError:
+    uvloop = None
+
+__all__ = ("new_event_loop", "run")
+
+_log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def new_event_loop(*, use_uvloop: Optional[bool] = None) -> asyncio.AbstractEventLoop:
+    """Creates an event loop, a uvloop one when it's available.
+
+    Args:
+        use_uvloop (Optional[bool]): True to require uvloop, False to never use it, None to use it if installed.
+    """
+    if use_uvloop is None:
+        use_uvloop = uvloop is not None
+
+    if not use_uvloop:
+        return asyncio.new_event_loop()
+
+    if uvloop is None:
+        raise RuntimeError("uvloop isn't installed, install it with wharf[uvloop]")
+
+    return uvloop.new_event_loop()
+
+
+def _cancel_all_tasks(loop: asyncio.AbstractEventLoop):
+    tasks = asyncio.all_tasks(loop)
+    if not tasks:
+        return
+
+    for task in tasks:
+        task.cancel()
+
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            loop.call_exception_handler(
+                {
+                    "message": "Unhandled exception during shutdown",
+                    "exception": task.exception(),
+                    "task": task,
+                }
+            )
+
+
+async def _run_until_stopped(
+    main: Callable[[], Awaitable[T]],
+    shutdown: Optional[Callable[[], Awaitable[Any]]],
+) -> Optional[T]:
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    signals = []
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+            signals.append(signum)
+        except (NotImplementedError, RuntimeError):
+            # Windows, or not the main thread, Ctrl+C still raises KeyboardInterrupt
+            pass
+
+    main_task = asyncio.ensure_future(main())
+    stopper = asyncio.ensure_future(stop.wait())
+
+    try:
+        await asyncio.wait({main_task, stopper}, return_when=asyncio.FIRST_COMPLETED)
+
+        if stop.is_set():
+            _log.info("Received a stop signal, shutting down")
+    finally:
+        stopper.cancel()
+
+        for signum in signals:
+            loop.remove_signal_handler(signum)
+
+        try:
+            if shutdown is not None:
+                await shutdown()
+        finally:
+            if not main_task.done():
+                main_task.cancel()
+
+            await asyncio.gather(main_task, return_exceptions=True)
+
+    return main_task.result() if not main_task.cancelled() else None
+
+
+def run(
+    main: Callable[[], Awaitable[T]],
+    *,
+    shutdown: Optional[Callable[[], Awaitable[Any]]] = None,
+    use_uvloop: Optional[bool] = None,
+    debug: bool = False,
+) -> Optional[T]:
+    """Runs ``main()`` in a new event loop until it returns or the process is asked to stop.
+
+    Everything ``main`` creates, sessions, tasks and futures, is created inside the loop this
+    makes. On SIGINT or SIGTERM (Ctrl+C on Windows), or once ``main`` returns, ``shutdown()``
+    is awaited before ``main`` is cancelled, then leftover tasks are cancelled, async
+    generators and the default executor are shut down and the loop is closed.
+
+    Args:
+        main (Callable[[], Awaitable]): Starts whatever should run.
+        shutdown (Optional[Callable[[], Awaitable]]): Stops it gracefully.
+        use_uvloop (Optional[bool]): See :func:`new_event_loop`.
+        debug (bool): Whether to run the loop in debug mode. Defaults to False.
+    """
+    loop = new_event_loop(use_uvloop=use_uvloop)
+    loop.set_debug(debug)
+    asyncio.set_event_loop(loop)
+
+    try:
+        try:
+            return loop.run_until_complete(_run_until_stopped(main, shutdown))
+        except KeyboardInterrupt:
+            if shutdown is None:
+                raise
+
+            _log.info("Interrupted, shutting down")
+            loop.run_until_complete(shutdown())
+            return None
+    finally:
+        try:
+            _cancel_all_tasks(loop)
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
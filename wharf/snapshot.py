@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+import zlib
+from typing import TYPE_CHECKING, Any, Dict
+
+from .impl import Member
+
+try:
+    import msgpack  # type: ignore
+except ImportError:
+    msgpack = None
+
+if TYPE_CHECKING:
+    from .client import Client
+
+__all__ = ("save_snapshot", "load_snapshot")
+
+_log = logging.getLogger(__name__)
+
+MAGIC = b"WHARF"
+VERSION = 1
+
+# the most bucket hashes written, the most recently learned ones are kept
+MAX_RATELIMITS = 1000
+
+# these routes carry a token in their bucket key, which has no business being on disk
+TOKEN_ROUTES = ("/webhooks/", "/interactions/")
+
+
+def _persistable_ratelimits(url_to_discord_hash: Dict[str, str]) -> Dict[str, str]:
+    entries = [
+        (url, hash)
+        for url, hash in url_to_discord_hash.items()
+        if not any(route in url for route in TOKEN_ROUTES)
+    ]
+    return dict(entries[-MAX_RATELIMITS:])
+
+
+def _encode(data: Dict[str, Any]) -> bytes:
+    if msgpack is not None:
+        return b"m" + zlib.compress(msgpack.packb(data), 1)
+
+    return b"j" + zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 1)
+
+
+def _decode(raw: bytes) -> Dict[str, Any]:
+    kind, body = raw[:1], zlib.decompress(raw[1:])
+
+    if kind == b"m":
+        if msgpack is None:
+            raise RuntimeError(
+                "This snapshot was written with msgpack, which isn't installed"
+            )
+
+        return msgpack.unpackb(body)
+
+    return json.loads(body)
+
+
+def dump_snapshot(client: Client) -> Dict[str, Any]:
+    gateway = client.ws
+    cache = client.cache
+
+    guilds = list(cache._raw_guilds.values())
+    guilds.extend(guild._to_json() for guild in cache.guilds.values())
+
+    return {
+        "version": VERSION,
+        "created_at": time.time(),
+        "gateway": {
+            "session_id": gateway.session_id,
+            "sequence": gateway._last_sequence,
+            "resume_gateway_url": gateway.resume_gateway_url,
+        },
+        "ratelimits": _persistable_ratelimits(
+            client.http.ratelimiter.url_to_discord_hash
+        ),
+        "guilds": guilds,
+        "members": {
+            str(guild_id): [member._to_json() for member in members.values()]
+            for guild_id, members in cache.members.items()
+        },
+    }
+
+
+def save_snapshot(client: Client, path: str):
+    """Writes the client's cache, gateway session and bucket hashes to ``path``.
+
+    The file is written next to the target first and then moved over it, so a crash
+    mid-write never leaves a truncated snapshot behind.
+    """
+    raw = MAGIC + bytes([VERSION]) + _encode(dump_snapshot(client))
+    tmp = f"{path}.tmp"
+
+    with open(tmp, "wb") as f:
+        f.write(raw)
+
+    os.replace(tmp, path)
+    _log.info("Saved snapshot to %s (%d bytes)", path, len(raw))
+
+
+def load_snapshot(client: Client, path: str, *, max_resume_age: float = 300.0) -> bool:
+    """Restores a snapshot written by :func:`save_snapshot`.
+
+    Returns whether the gateway session was restored, in which case the next connection
+    should try to RESUME. Sessions older than ``max_resume_age`` seconds are skipped, the
+    cache and bucket hashes are restored either way.
+    """
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return False
+
+    header = len(MAGIC) + 1
+    if raw[: len(MAGIC)] != MAGIC or raw[len(MAGIC) : header] != bytes([VERSION]):
+        _log.warning("Ignoring snapshot %s, unknown format", path)
+        return False
+
+    # everything is read before anything is restored, so a damaged snapshot leaves the
+    # client as it was and it simply identifies from scratch
+    try:
+        data = _decode(raw[header:])
+
+        ratelimits = _persistable_ratelimits(
+            {str(url): str(hash) for url, hash in data["ratelimits"].items()}
+        )
+        guilds = {int(guild["id"]): guild for guild in data["guilds"]}
+        members: Dict[int, Dict[int, Member]] = {}
+        for guild_id, payloads in data["members"].items():
+            for payload in payloads:
+                member = Member(payload, client)
+                members.setdefault(int(guild_id), {})[int(member.id)] = member
+
+        session = data["gateway"]
+        session_id = session["session_id"]
+        sequence = session["sequence"]
+        resume_gateway_url = session["resume_gateway_url"]
+        created_at = float(data["created_at"])
+    except (
+        zlib.error,
+        RuntimeError,
+        KeyError,
+        TypeError,
+        ValueError,
+        AttributeError,
+    ) as exc:
+        _log.warning("Ignoring snapshot %s, it's damaged: %r", path, exc)
+        return False
+
+    client.http.ratelimiter.restore(ratelimits)
+
+    cache = client.cache
+    cache._raw_guilds.update(guilds)
+
+    for guild_id, guild_members in members.items():
+        cache.members.setdefault(guild_id, {}).update(guild_members)
+
+    if session_id is None or sequence is None:
+        return False
+
+    if time.time() - created_at > max_resume_age:
+        return False
+
+    client.ws.session_id = session_id
+    client.ws._last_sequence = sequence
+    client.ws.resume_gateway_url = resume_gateway_url
+
+    return True
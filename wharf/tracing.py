@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import collections
+import contextvars
+import logging
+import random
+import time
+import weakref
+from typing import Any, Deque, Dict, Iterable, List, Optional, Protocol
+
+try:
+    from opentelemetry import trace as otel_trace  # type: ignore
+except ImportError:
+    otel_trace = None
+
+from . import __version__
+
+__all__ = (
+    "Span",
+    "Tracer",
+    "SpanRecorder",
+    "OpenTelemetryProcessor",
+    "current_span",
+)
+
+_log = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "wharf_current_span", default=None
+)
+
+
+def current_span() -> Optional[Span]:
+    """The span the calling code runs in, if tracing is enabled and one is open."""
+    return _current_span.get()
+
+
+class SpanProcessor(Protocol):
+    def on_start(self, span: Span) -> None:
+        ...
+
+    def on_end(self, span: Span) -> None:
+        ...
+
+
+class Span:
+    """One timed operation, like dispatching an event, running a listener or sending a request.
+
+    Spans opened while another one is current become its children, and since asyncio tasks
+    copy the context they were created in, that includes spans opened in listener tasks
+    started during a dispatch. ``start_time`` and ``end_time`` are in nanoseconds since the
+    epoch, the duration itself is measured with a monotonic clock.
+    """
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent",
+        "attributes",
+        "start_time",
+        "end_time",
+        "error",
+        "_tracer",
+        "_started",
+        "_token",
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        tracer: Tracer,
+        name: str,
+        parent: Optional[Span],
+        attributes: Dict[str, Any],
+    ):
+        self.name = name
+        self.parent = parent
+        self.trace_id = (
+            parent.trace_id if parent is not None else random.getrandbits(128)
+        )
+        self.span_id = random.getrandbits(64)
+        self.attributes = attributes
+        self.start_time = 0
+        self.end_time: Optional[int] = None
+        self.error: Optional[BaseException] = None
+
+        self._tracer = tracer
+        self._started = 0
+        self._token: Optional[contextvars.Token] = None
+
+    def __repr__(self):
+        return f"<Span {self.name} {self.duration * 1000:.2f}ms>"
+
+    @property
+    def duration(self) -> float:
+        """Seconds the span was open for, or has been open for so far."""
+        end = self.end_time if self.end_time is not None else time.time_ns()
+        return (end - self.start_time) / 1e9
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def __enter__(self) -> Span:
+        self.start_time = time.time_ns()
+        self._started = time.perf_counter_ns()
+        self._token = _current_span.set(self)
+        self._tracer._emit("on_start", self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_time = self.start_time + time.perf_counter_ns() - self._started
+
+        if exc is not None:
+            self.error = exc
+
+        _current_span.reset(self._token)  # type: ignore
+        self._token = None
+        self._tracer._emit("on_end", self)
+
+
+class _NoopSpan:
+    """What :meth:`Tracer.span` hands out while tracing is disabled."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self) -> _NoopSpan:
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Creates spans and hands them to processors as they start and end.
+
+    A tracer without processors is disabled, :meth:`span` then returns a shared no-op span
+    and touches neither the clock nor the context. The client, its dispatcher and its HTTP
+    client share one, so adding a processor to :attr:`Client.tracer` traces everything from
+    an incoming event through the listeners it runs to the requests they make.
+
+    Args:
+        processors (Iterable[SpanProcessor]): Objects with ``on_start(span)`` and ``on_end(span)``.
+    """
+
+    def __init__(self, processors: Iterable[SpanProcessor] = ()):
+        self.processors: List[SpanProcessor] = list(processors)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.processors)
+
+    def add_processor(self, processor: SpanProcessor):
+        self.processors.append(processor)
+
+    def remove_processor(self, processor: SpanProcessor):
+        self.processors.remove(processor)
+
+    def span(self, name: str, **attributes: Any):
+        """A span to use as a context manager, a child of the current span if there is one."""
+        if not self.processors:
+            return NOOP_SPAN
+
+        return Span(self, name, _current_span.get(), attributes)
+
+    def _emit(self, hook: str, span: Span):
+        for processor in self.processors:
+            try:
+                getattr(processor, hook)(span)
+            except Exception:
+                _log.exception("Span processor %r failed in %s", processor, hook)
+
+
+class SpanRecorder:
+    """Keeps the ``keep`` most recently finished spans in memory, e.g. to dump a slow trace.
+
+    Args:
+        keep (int): How many finished spans to hold on to. Defaults to 1000.
+    """
+
+    def __init__(self, *, keep: int = 1000):
+        self.spans: Deque[Span] = collections.deque(maxlen=keep)
+
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        self.spans.append(span)
+
+    def clear(self):
+        self.spans.clear()
+
+    def traces(self) -> Dict[int, List[Span]]:
+        """The recorded spans grouped by trace id, each in the order they started."""
+        traces: Dict[int, List[Span]] = collections.defaultdict(list)
+
+        for span in sorted(self.spans, key=lambda span: span.start_time):
+            traces[span.trace_id].append(span)
+
+        return dict(traces)
+
+    def format(self, trace_id: int) -> str:
+        """A trace as an indented tree, with every span's offset from the start and duration."""
+        spans = self.traces().get(trace_id, [])
+        if not spans:
+            return ""
+
+        recorded = {span.span_id for span in spans}
+        children: Dict[Optional[int], List[Span]] = collections.defaultdict(list)
+
+        for span in spans:
+            parent = span.parent.span_id if span.parent is not None else None
+            children[parent if parent in recorded else None].append(span)
+
+        origin = spans[0].start_time
+        lines: List[str] = []
+
+        def walk(span: Span, depth: int):
+            attributes = " ".join(f"{k}={v}" for k, v in span.attributes.items())
+            error = f" error={type(span.error).__name__}" if span.error else ""
+            lines.append(
+                f"{(span.start_time - origin) / 1e6:>9.2f}ms {span.duration * 1000:>9.2f}ms "
+                f"{'  ' * depth}{span.name} {attributes}{error}".rstrip()
+            )
+
+            for child in children[span.span_id]:
+                walk(child, depth + 1)
+
+        for root in children[None]:
+            walk(root, 0)
+
+        return "\n".join(lines)
+
+
+class OpenTelemetryProcessor:
+    """Mirrors wharf's spans into OpenTelemetry, needs ``opentelemetry-api`` installed.
+
+    Spans are exported through whatever tracer provider the application configured, so
+    they end up wherever its OpenTelemetry exporters send them.
+
+    Args:
+        tracer (Optional[opentelemetry.trace.Tracer]): The tracer to create spans with, by default one named ``wharf`` from the global provider.
+    """
+
+    def __init__(self, tracer: Any = None):
+        if otel_trace is None:
+            raise RuntimeError(
+                "OpenTelemetryProcessor needs opentelemetry-api, install it with `pip install wharf[opentelemetry]`"
+            )
+
+        self.tracer = tracer or otel_trace.get_tracer("wharf", __version__)
+        # a parent can end before its children start, e.g. an event span before the
+        # listener tasks it scheduled, so this is keyed on span objects rather than popped
+        self._spans: weakref.WeakKeyDictionary[Span, Any] = weakref.WeakKeyDictionary()
+
+    def on_start(self, span: Span):
+        context = None
+        parent = self._spans.get(span.parent) if span.parent is not None else None
+
+        if parent is not None:
+            context = otel_trace.set_span_in_context(parent)  # type: ignore
+
+        self._spans[span] = self.tracer.start_span(
+            span.name,
+            context=context,
+            attributes=_otel_attributes(span.attributes),
+            start_time=span.start_time,
+        )
+
+    def on_end(self, span: Span):
+        otel_span = self._spans.get(span)
+        if otel_span is None:
+            return
+
+        otel_span.set_attributes(_otel_attributes(span.attributes))
+
+        if span.error is not None:
+            otel_span.record_exception(span.error)
+            otel_span.set_status(
+                otel_trace.Status(otel_trace.StatusCode.ERROR, str(span.error))  # type: ignore
+            )
+
+        otel_span.end(end_time=span.end_time)
+
+
+def _otel_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    # OpenTelemetry only takes primitives, ids and the like are stringified
+    return {
+        key: value if isinstance(value, (bool, int, float, str)) else str(value)
+        for key, value in attributes.items()
+    }
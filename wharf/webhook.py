@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import re
+from typing import Any, List, Optional, Union
+
+from .http import HTTPClient, Route
+from .impl import Embed, MessageCoalescer
+
+__all__ = ("Webhook",)
+
+
+WEBHOOK_URL_RE = re.compile(
+    r"discord(?:app)?\.com/api/(?:v\d+/)?webhooks/(?P<id>\d+)/(?P<token>[\w.-]+)"
+)
+
+
+class Webhook:
+    """Sends messages through a webhook, no bot token needed.
+
+    Webhook routes have their own ratelimit buckets and don't count against the bot's global
+    limit, so running many webhooks side by side scales with the number of webhooks. Lines
+    passed to :meth:`log` are batched, see :class:`MessageCoalescer`, so a chatty log relay
+    turns into a few large messages per webhook instead of one request per line.
+
+    Args:
+        id (int): The ID of the webhook.
+        token (str): The token of the webhook.
+        http (Optional[HTTPClient]): The HTTP client to send requests with, a tokenless one is made otherwise.
+        batch_window (float): Seconds :meth:`log` waits for more lines. Defaults to 0.05.
+    """
+
+    def __init__(
+        self,
+        id: Union[int, str],
+        token: str,
+        *,
+        http: Optional[HTTPClient] = None,
+        batch_window: float = 0.05,
+    ):
+        self.id = int(id)
+        self.token = token
+        self._owns_http = http is None
+        self.http = http or HTTPClient()
+        self._batcher = MessageCoalescer(
+            self._send_batch, window=batch_window, overflow_into_embeds=True
+        )
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> Webhook:
+        match = WEBHOOK_URL_RE.search(url)
+        if match is None:
+            raise ValueError(f"{url!r} is not a webhook URL")
+
+        return cls(match["id"], match["token"], **kwargs)
+
+    def _route(self, method: str, suffix: str = "") -> Route:
+        return Route(
+            method,
+            f"/webhooks/{self.id}/{self.token}{suffix}",
+            webhook_id=self.id,
+            webhook_token=self.token,
+        )
+
+    @staticmethod
+    def _message_payload(
+        content: Optional[str], embeds: Optional[List[Embed]], **extra: Any
+    ) -> dict:
+        payload = {"content": content, **extra}
+
+        if embeds is not None:
+            payload["embeds"] = [embed.to_dict() for embed in embeds]
+
+        return payload
+
+    async def execute(
+        self,
+        content: Optional[str] = None,
+        *,
+        embeds: Optional[List[Embed]] = None,
+        username: Optional[str] = None,
+        avatar_url: Optional[str] = None,
+        wait: bool = True,
+    ):
+        """Sends a message, returning it if ``wait`` is set."""
+        return await self.http.request(
+            self._route("POST"),
+            query_params={"wait": str(wait).lower()},
+            json_params=self._message_payload(
+                content, embeds, username=username, avatar_url=avatar_url
+            ),
+            auth=False,
+        )
+
+    async def edit_message(
+        self,
+        message_id: int,
+        *,
+        content: Optional[str] = None,
+        embeds: Optional[List[Embed]] = None,
+    ):
+        return await self.http.request(
+            self._route("PATCH", f"/messages/{message_id}"),
+            json_params=self._message_payload(content, embeds),
+            auth=False,
+        )
+
+    async def delete_message(self, message_id: int):
+        await self.http.request(
+            self._route("DELETE", f"/messages/{message_id}"), auth=False
+        )
+
+    async def delete(self):
+        """Deletes the webhook itself."""
+        await self.http.request(self._route("DELETE"), auth=False)
+
+    def _send_batch(self, payload: dict):
+        return self.http.request(
+            self._route("POST"),
+            query_params={"wait": "true"},
+            json_params=payload,
+            auth=False,
+        )
+
+    def log(self, line: str, *, embeds: Optional[List[Embed]] = None):
+        """Queues a line to be sent along with whatever else gets logged in the same window.
+
+        Returns a future for the message the line ended up in.
+        """
+        return self._batcher.put(
+            line, [embed.to_dict() for embed in embeds] if embeds else ()
+        )
+
+    async def flush(self):
+        """Waits until every logged line was sent."""
+        await self._batcher.flush()
+
+    async def close(self):
+        await self.flush()
+
+        if self._owns_http:
+            await self.http.close()